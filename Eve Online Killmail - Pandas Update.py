@@ -1,8 +1,43 @@
+import numpy as np
 import pandas as pd
+import hashlib
+import asyncio
+import csv
+import itertools
 import json
 import os
-from pathlib import Path
-from typing import Dict, Optional, List
+import pickle
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional, List, Tuple, Union
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for output_format='parquet'
+    pa = pq = None
+
+from killmail_checkpoints import BatchCheckpoints
+from killmail_cubes import CUBE_DIMENSIONS, MEASURES, CubeBuilder, cube_source, write_cubes
+from killmail_decoding import DECODE_ERRORS, get_decoder, resolve_backend
+from killmail_facts import FACT_TABLE_KEYS, KillmailFacts
+from killmail_instrumentation import RunReport, log, set_verbose
+from killmail_intermediate import IntermediateReader, IntermediateWriter
+from killmail_live import LiveIngestor
+from killmail_names import ENTITY_NAME_COLUMNS, ESI_NAMES_URL, NameResolver, add_entity_names
+from killmail_shards import (SOURCE_INDEX_COLUMN, iter_merged_chunks, read_sidecars, shard_of,
+                             write_sidecar)
+from killmail_sketches import KillmailSketches
+from killmail_spatial import SPATIAL_COLUMNS, SolarSystemTable, enrich_spatial
+from killmail_store import KillmailStore
+from killmail_valuation import VALUE_COLUMNS, PriceTable, value_killmails
+
+# A killmail to convert: a JSON file on disk, or a (member name, raw bytes) pair read from an archive
+KillmailSource = Union[Path, Tuple[str, bytes]]
 
 def load_ship_data(shiplist_csv_path: str) -> Dict[int, Dict[str, str]]:
     """
@@ -10,33 +45,32 @@ def load_ship_data(shiplist_csv_path: str) -> Dict[int, Dict[str, str]]:
     Returns a dictionary with ship_type_id as key and ship info as value.
     """
     try:
-        # Read CSV and handle potential encoding issues
-        df = pd.read_csv(shiplist_csv_path, encoding='utf-8')
+        # shiplist.csv has no header row: every line is id,name,type
+        df = pd.read_csv(shiplist_csv_path, encoding='utf-8', header=None)
         
-        # Print columns for debugging
-        print(f"Ship CSV columns: {df.columns.tolist()}")
+        # Print shape for debugging
+        log(f"Ship CSV shape: {df.shape}")
         
         # Handle different possible column structures
         if len(df.columns) >= 3:
             # Assume first 3 columns are ID, name, type
-            df.columns = ['ship_id', 'ship_name', 'ship_type'] + list(df.columns[3:])
+            df = df.iloc[:, :3]
+            df.columns = ['ship_id', 'ship_name', 'ship_type']
         else:
             print(f"Warning: Expected at least 3 columns in ship CSV, got {len(df.columns)}")
             return {}
         
-        # Convert to dictionary for fast lookups
-        ship_data = {}
-        for _, row in df.iterrows():
-            try:
-                ship_id = int(row['ship_id'])
-                ship_data[ship_id] = {
-                    'name': str(row['ship_name']),
-                    'type': str(row['ship_type'])
-                }
-            except (ValueError, TypeError):
-                continue
+        # Drop rows without a numeric ID (e.g. a header line) and convert to a dictionary for fast lookups
+        df['ship_id'] = pd.to_numeric(df['ship_id'], errors='coerce')
+        df = df.dropna(subset=['ship_id'])
+        ship_data = {
+            ship_id: {'name': ship_name, 'type': ship_type}
+            for ship_id, ship_name, ship_type in zip(df['ship_id'].astype(int).tolist(),
+                                                     df['ship_name'].astype(str).tolist(),
+                                                     df['ship_type'].astype(str).tolist())
+        }
         
-        print(f"Successfully loaded {len(ship_data)} ships")
+        log(f"Successfully loaded {len(ship_data)} ships")
         return ship_data
         
     except Exception as e:
@@ -52,8 +86,8 @@ def load_type_data(typeid_csv_path: str) -> Dict[int, str]:
         # Read CSV with flexible column detection
         df = pd.read_csv(typeid_csv_path, encoding='utf-8')
         
-        print(f"Type CSV columns: {df.columns.tolist()}")
-        print(f"Type CSV shape: {df.shape}")
+        log(f"Type CSV columns: {df.columns.tolist()}")
+        log(f"Type CSV shape: {df.shape}")
         
         # Find the correct columns
         type_id_col = None
@@ -68,11 +102,11 @@ def load_type_data(typeid_csv_path: str) -> Dict[int, str]:
         
         # If not found, use first two columns
         if type_id_col is None or type_name_col is None:
-            print("Using first two columns as ID and name")
+            log("Using first two columns as ID and name")
             type_id_col = df.columns[0]
             type_name_col = df.columns[1]
         
-        print(f"Using '{type_id_col}' for type ID and '{type_name_col}' for type name")
+        log(f"Using '{type_id_col}' for type ID and '{type_name_col}' for type name")
         
         # Clean and convert data
         df_clean = df[[type_id_col, type_name_col]].dropna()
@@ -82,13 +116,13 @@ def load_type_data(typeid_csv_path: str) -> Dict[int, str]:
         # Convert to dictionary
         type_data = dict(zip(df_clean[type_id_col].astype(int), df_clean[type_name_col].astype(str)))
         
-        print(f"Successfully loaded {len(type_data)} type mappings")
+        log(f"Successfully loaded {len(type_data)} type mappings")
         
         # Show sample
         if type_data:
-            print("Sample type mappings:")
+            log("Sample type mappings:")
             for i, (type_id, type_name) in enumerate(list(type_data.items())[:5]):
-                print(f"  {type_id}: {type_name}")
+                log(f"  {type_id}: {type_name}")
         
         return type_data
         
@@ -102,17 +136,16 @@ def load_solar_system_data(map_solar_systems_csv_path: str) -> Dict[int, str]:
     Returns a dictionary with solarSystemID as key and solarSystemName as value.
     """
     try:
-        # Read CSV with flexible column detection
-        df = pd.read_csv(map_solar_systems_csv_path, encoding='utf-8')
+        # Read just the header first; the file has 26 mostly-float columns and only two are needed
+        columns = pd.read_csv(map_solar_systems_csv_path, encoding='utf-8', nrows=0).columns
         
-        print(f"Solar system CSV columns: {df.columns.tolist()}")
-        print(f"Solar system CSV shape: {df.shape}")
+        log(f"Solar system CSV columns: {columns.tolist()}")
         
         # Find the correct columns
         system_id_col = None
         system_name_col = None
         
-        for col in df.columns:
+        for col in columns:
             col_lower = col.lower().strip()
             if col_lower in ['solarsystemid', 'solar_system_id', 'systemid', 'system_id']:
                 system_id_col = col
@@ -121,15 +154,19 @@ def load_solar_system_data(map_solar_systems_csv_path: str) -> Dict[int, str]:
         
         # If not found, try positional (based on your original code)
         if system_id_col is None or system_name_col is None:
-            print("Using positional columns (index 2 and 3)")
-            if len(df.columns) > 3:
-                system_id_col = df.columns[2]
-                system_name_col = df.columns[3]
+            log("Using positional columns (index 2 and 3)")
+            if len(columns) > 3:
+                system_id_col = columns[2]
+                system_name_col = columns[3]
             else:
                 print("Warning: Not enough columns for positional lookup")
                 return {}
         
-        print(f"Using '{system_id_col}' for system ID and '{system_name_col}' for system name")
+        log(f"Using '{system_id_col}' for system ID and '{system_name_col}' for system name")
+        
+        df = pd.read_csv(map_solar_systems_csv_path, encoding='utf-8',
+                         usecols=[system_id_col, system_name_col])
+        log(f"Solar system CSV shape: {df.shape}")
         
         # Clean and convert data
         df_clean = df[[system_id_col, system_name_col]].dropna()
@@ -139,13 +176,13 @@ def load_solar_system_data(map_solar_systems_csv_path: str) -> Dict[int, str]:
         # Convert to dictionary
         solar_system_data = dict(zip(df_clean[system_id_col].astype(int), df_clean[system_name_col].astype(str)))
         
-        print(f"Successfully loaded {len(solar_system_data)} solar system mappings")
+        log(f"Successfully loaded {len(solar_system_data)} solar system mappings")
         
         # Show sample
         if solar_system_data:
-            print("Sample solar system mappings:")
+            log("Sample solar system mappings:")
             for i, (system_id, system_name) in enumerate(list(solar_system_data.items())[:5]):
-                print(f"  {system_id}: {system_name}")
+                log(f"  {system_id}: {system_name}")
         
         return solar_system_data
         
@@ -153,12 +190,129 @@ def load_solar_system_data(map_solar_systems_csv_path: str) -> Dict[int, str]:
         print(f"Warning: Could not load solar system data from {map_solar_systems_csv_path}: {e}")
         return {}
 
+# Bump when the layout of the cached lookup tables changes
+LOOKUP_CACHE_VERSION = 1
+LOOKUP_CACHE_FILENAME = '.killmail_lookup_cache.pickle'
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _lookup_source_fingerprints(sources: Dict[str, Optional[str]]) -> Dict[str, Optional[dict]]:
+    """
+    Describe each lookup CSV by resolved path, size, mtime and SHA-256 hash.
+    """
+    fingerprints = {}
+    for name, path in sources.items():
+        if not path or not os.path.exists(path):
+            fingerprints[name] = None
+            continue
+        stat = os.stat(path)
+        fingerprints[name] = {
+            'path': str(Path(path).resolve()),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': None,  # filled in lazily, only when the mtime alone can't decide
+        }
+    return fingerprints
+
+def _cache_is_current(cached: Dict[str, Optional[dict]], current: Dict[str, Optional[dict]],
+                      sources: Dict[str, Optional[str]]) -> bool:
+    """
+    A cached source matches when path and size agree and either the mtime is unchanged or,
+    if the file was touched, its content hash is still the same.
+    """
+    if cached.keys() != current.keys():
+        return False
+    for name, now in current.items():
+        then = cached[name]
+        if now is None or then is None:
+            if now is not then:
+                return False
+            continue
+        if now['path'] != then['path'] or now['size'] != then['size']:
+            return False
+        if now['mtime_ns'] != then['mtime_ns']:
+            if _file_sha256(sources[name]) != then['sha256']:
+                return False
+        now['sha256'] = then['sha256']
+    return True
+
+def load_lookup_data(shiplist_csv: Optional[str] = None, typeid_csv: Optional[str] = None,
+                     map_solar_systems_csv: Optional[str] = None,
+                     cache_path: Optional[str] = None,
+                     use_cache: bool = True) -> Tuple[Dict, Dict, Dict]:
+    """
+    Load the ship, type and solar system lookup dictionaries.
+    
+    The parsed dictionaries are kept in a compiled pickle cache (by default
+    .killmail_lookup_cache.pickle next to the first lookup CSV). The cache is reused while every
+    source CSV has the same path, size and mtime (or, after a touch, the same SHA-256), and is
+    rebuilt from the CSVs otherwise.
+    Returns (ship_data, type_data, solar_system_data).
+    """
+    sources = {'ship_data': shiplist_csv, 'type_data': typeid_csv, 'solar_system_data': map_solar_systems_csv}
+    
+    if use_cache and cache_path is None:
+        first_source = next((path for path in sources.values() if path), None)
+        if first_source:
+            cache_path = str(Path(first_source).parent / LOOKUP_CACHE_FILENAME)
+    use_cache = use_cache and cache_path is not None
+    
+    fingerprints = _lookup_source_fingerprints(sources)
+    
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if (cached.get('version') == LOOKUP_CACHE_VERSION
+                    and _cache_is_current(cached['sources'], fingerprints, sources)):
+                log(f"Loaded lookup data from cache '{cache_path}' "
+                      f"({len(cached['ship_data'])} ships, {len(cached['type_data'])} types, "
+                      f"{len(cached['solar_system_data'])} solar systems)")
+                return cached['ship_data'], cached['type_data'], cached['solar_system_data']
+            log("Lookup cache is out of date, rebuilding...")
+        except Exception as e:
+            print(f"Warning: Could not read lookup cache '{cache_path}': {e}")
+    
+    ship_data = load_ship_data(shiplist_csv) if shiplist_csv else {}
+    type_data = load_type_data(typeid_csv) if typeid_csv else {}
+    solar_system_data = load_solar_system_data(map_solar_systems_csv) if map_solar_systems_csv else {}
+    
+    if use_cache:
+        for name, fingerprint in fingerprints.items():
+            if fingerprint is not None:
+                fingerprint['sha256'] = _file_sha256(sources[name])
+        cache = {
+            'version': LOOKUP_CACHE_VERSION,
+            'sources': fingerprints,
+            'ship_data': ship_data,
+            'type_data': type_data,
+            'solar_system_data': solar_system_data,
+        }
+        try:
+            # Write to a temporary file and rename, so a crash never leaves a half-written cache
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"Warning: Could not write lookup cache '{cache_path}': {e}")
+    
+    return ship_data, type_data, solar_system_data
+
 def flatten_killmail(data: dict, ship_data: Optional[Dict] = None, 
                     type_data: Optional[Dict] = None, 
-                    solar_system_data: Optional[Dict] = None) -> dict:
+                    solar_system_data: Optional[Dict] = None,
+                    projection: Optional['ColumnProjection'] = None) -> dict:
     """
     Flatten the nested killmail JSON structure into a single row dictionary.
     Optimized version with better null handling.
+    With a projection, only its columns are returned and the attacker and item scans are
+    skipped when none of them needs those.
     """
     # Initialize with all possible fields to ensure consistent DataFrame structure
     flattened = {
@@ -232,10 +386,10 @@ def flatten_killmail(data: dict, ship_data: Optional[Dict] = None,
     })
     
     # Attacker information
-    attackers = data.get('attackers', [])
+    attackers = data.get('attackers', []) if projection is None or projection.attackers else []
     flattened['total_attackers'] = len(attackers)
     
-    if attackers:
+    if attackers and (projection is None or projection.final_blow):
         # Find final blow attacker or use first one
         final_blow_attacker = next((att for att in attackers if att.get('final_blow')), attackers[0])
         
@@ -262,141 +416,1712 @@ def flatten_killmail(data: dict, ship_data: Optional[Dict] = None,
             flattened['attacker_weapon_type_name'] = type_data.get(flattened['attacker_weapon_type_id'])
     
     # Items information
-    items = victim.get('items', [])
-    flattened.update({
-        'total_items': len(items),
-        'items_destroyed': sum(1 for item in items if 'quantity_destroyed' in item),
-        'items_dropped': sum(1 for item in items if 'quantity_dropped' in item),
-    })
+    items = victim.get('items', []) if projection is None or projection.items else []
+    flattened['total_items'] = len(items)
+    if projection is None or projection.item_flags:
+        flattened.update({
+            'items_destroyed': sum(1 for item in items if 'quantity_destroyed' in item),
+            'items_dropped': sum(1 for item in items if 'quantity_dropped' in item),
+        })
     
+    if projection is not None:
+        # source_file is added by the caller
+        return {col: flattened.get(col) for col in projection.flattened}
     return flattened
 
+# Every column produced by flatten_killmail, plus the source filename added during conversion
+KILLMAIL_COLUMNS = list(flatten_killmail({}).keys()) + ['source_file']
+
+# Columns converted by the data type optimization pass
+INT_COLUMNS = ['killmail_id', 'solar_system_id', 'victim_alliance_id', 'victim_character_id', 
+               'victim_corporation_id', 'victim_damage_taken', 'victim_ship_type_id',
+               'attacker_alliance_id', 'attacker_character_id', 'attacker_corporation_id',
+               'attacker_damage_done', 'attacker_ship_type_id', 'attacker_weapon_type_id',
+               'total_attackers', 'total_items', 'items_destroyed', 'items_dropped']
+FLOAT_COLUMNS = ['victim_position_x', 'victim_position_y', 'victim_position_z', 'attacker_security_status']
+BOOL_COLUMNS = ['attacker_final_blow']
+
+# Fixed dtypes for chunked (streaming) output. A downcast picks a dtype from the values it sees,
+# so a chunk without missing values would get int columns while the next gets float ones.
+# Nullable integers keep every chunk on the same schema.
+STREAM_DTYPES = {
+    'killmail_id': 'Int64',
+    'solar_system_id': 'Int32',
+    'victim_alliance_id': 'Int64',
+    'victim_character_id': 'Int64',
+    'victim_corporation_id': 'Int64',
+    'victim_damage_taken': 'Int32',
+    'victim_ship_type_id': 'Int32',
+    'attacker_alliance_id': 'Int64',
+    'attacker_character_id': 'Int64',
+    'attacker_corporation_id': 'Int64',
+    'attacker_damage_done': 'Int32',
+    'attacker_ship_type_id': 'Int32',
+    'attacker_weapon_type_id': 'Int32',
+    'total_attackers': 'Int32',
+    'total_items': 'Int32',
+    'items_destroyed': 'Int32',
+    'items_dropped': 'Int32',
+    'victim_position_x': 'float64',
+    'victim_position_y': 'float64',
+    'victim_position_z': 'float64',
+    'attacker_security_status': 'float32',
+    'attacker_final_blow': 'boolean',
+}
+
+class ReferenceTable(NamedTuple):
+    """
+    A lookup dictionary laid out for vectorized joins: the IDs as an index, and for each ID
+    the code of its name in a categorical dtype shared by every DataFrame that uses it.
+    """
+    index: pd.Index
+    codes: np.ndarray
+    dtype: pd.CategoricalDtype
+
+def build_reference_table(mapping: Dict[int, str]) -> ReferenceTable:
+    """
+    Turn an ID -> name dictionary into a ReferenceTable.
+    """
+    ids = np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+    codes, categories = pd.factorize(pd.Series(list(mapping.values()), dtype=object))
+    return ReferenceTable(pd.Index(ids), codes, pd.CategoricalDtype(categories))
+
+def build_reference_tables(ship_data: Optional[Dict] = None, type_data: Optional[Dict] = None,
+                           solar_system_data: Optional[Dict] = None) -> Dict[str, ReferenceTable]:
+    """
+    Build the ReferenceTables used by enrich_killmails from the lookup dictionaries.
+    Build them once per run; each table is reused for every chunk.
+    """
+    ship_data = ship_data or {}
+    return {
+        'ship_name': build_reference_table({ship_id: info['name'] for ship_id, info in ship_data.items()}),
+        'ship_type': build_reference_table({ship_id: info['type'] for ship_id, info in ship_data.items()}),
+        'type_name': build_reference_table(type_data or {}),
+        'solar_system_name': build_reference_table(solar_system_data or {}),
+    }
+
+# (output column, ID column it is looked up by, reference table)
+ENRICHMENT_COLUMNS = [
+    ('solar_system_name', 'solar_system_id', 'solar_system_name'),
+    ('victim_ship_name', 'victim_ship_type_id', 'ship_name'),
+    ('victim_ship_type', 'victim_ship_type_id', 'ship_type'),
+    ('attacker_ship_name', 'attacker_ship_type_id', 'ship_name'),
+    ('attacker_ship_type', 'attacker_ship_type_id', 'ship_type'),
+    ('attacker_weapon_type_name', 'attacker_weapon_type_id', 'type_name'),
+]
+# The name columns filled in by enrich_killmails, which intermediates do not store
+ENRICHED_COLUMNS = [target_col for target_col, _, _ in ENRICHMENT_COLUMNS]
+
+# The final-blow attacker's columns, found by scanning the attackers
+FINAL_BLOW_COLUMNS = [col for col in KILLMAIL_COLUMNS if col.startswith('attacker_')]
+# Columns counted by scanning the victim's items
+ITEM_FLAG_COLUMNS = ['items_destroyed', 'items_dropped']
+
+# Flattened columns that each computed output column is made from
+COLUMN_SOURCES = {
+    **{target_col: [id_col] for target_col, id_col, _ in ENRICHMENT_COLUMNS},
+    **{col: ['solar_system_id'] for col in SPATIAL_COLUMNS},
+    **{col: ['killmail_id', 'victim_ship_type_id'] for col in VALUE_COLUMNS},
+    **{name_col: [id_col] for id_col, name_col in ENTITY_NAME_COLUMNS.items()},
+}
+
+# The columns CubeBuilder aggregates
+CUBE_COLUMNS = ['killmail_time'] + [col for dimensions in CUBE_DIMENSIONS.values() for col in dimensions
+                                    if col != 'killmail_hour'] + MEASURES[1:]
+
+class ColumnProjection(NamedTuple):
+    """
+    The output columns a run was asked for and what it takes to produce them: the columns
+    computed (the output plus what they, and other outputs such as cubes, are made from), the
+    flattened ones among them in KILLMAIL_COLUMNS order, and which parts of each killmail those
+    need, so that decoding and flattening skip the rest.
+    """
+    output: List[str]
+    computed: List[str]
+    flattened: List[str]
+    attackers: bool   # the attacker list (its length or the final-blow scan)
+    final_blow: bool  # the final-blow attacker's columns
+    items: bool       # the victim's item list
+    item_flags: bool  # the destroyed/dropped item counts
+
+def plan_column_projection(columns: List[str], required: Iterable[str] = ()) -> ColumnProjection:
+    """
+    Plan a run that writes only columns, in that order. required lists further columns that
+    are computed but not written (e.g. the key columns of the incremental manifest).
+    """
+    computed = list(dict.fromkeys(list(columns) + list(required)))
+    for col in list(computed):
+        computed.extend(source for source in COLUMN_SOURCES.get(col, []) if source not in computed)
+    flattened = [col for col in KILLMAIL_COLUMNS if col in computed]
+    final_blow = any(col in FINAL_BLOW_COLUMNS for col in flattened)
+    item_flags = any(col in ITEM_FLAG_COLUMNS for col in flattened)
+    return ColumnProjection(
+        output=list(columns), computed=computed, flattened=flattened,
+        attackers=final_blow or 'total_attackers' in flattened, final_blow=final_blow,
+        items=item_flags or 'total_items' in flattened, item_flags=item_flags)
+
+def entity_name_id_columns(projection: Optional[ColumnProjection]) -> Optional[List[str]]:
+    """
+    The ID columns whose names (ENTITY_NAME_COLUMNS) a projected run computes, for
+    add_entity_names; None (all of them) without a projection.
+    """
+    if projection is None:
+        return None
+    return [id_col for id_col, name_col in ENTITY_NAME_COLUMNS.items() if name_col in projection.computed]
+
+def lookup_categorical(ids: pd.Series, table: ReferenceTable) -> pd.Categorical:
+    """
+    Join a column of IDs against a ReferenceTable in one pass.
+    Missing, zero and unknown IDs come out as NaN, like the dictionary lookups in flatten_killmail.
+    Only the names that actually occur are kept as categories.
+    """
+    id_values = pd.to_numeric(ids, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    positions = table.index.get_indexer(id_values)
+    codes = np.where(positions >= 0, table.codes[positions], -1)
+    codes[id_values == 0] = -1
+    return pd.Categorical.from_codes(codes, dtype=table.dtype).remove_unused_categories()
+
+def enrich_killmails(df: pd.DataFrame, reference_tables: Dict[str, ReferenceTable]) -> pd.DataFrame:
+    """
+    Fill in the ship, weapon and solar system name columns of flattened killmails by joining
+    their ID columns against the reference tables. The names are stored as categoricals, so
+    each distinct name is held once instead of once per row. Only name columns present in df
+    are filled in, so a projected frame (see ColumnProjection) only gets the names it asked for.
+    """
+    for target_col, id_col, table_name in ENRICHMENT_COLUMNS:
+        if id_col in df.columns and target_col in df.columns:
+            df[target_col] = lookup_categorical(df[id_col], reference_tables[table_name])
+    
+    return df
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Downcast the numeric and boolean columns for better performance and smaller file size.
+    """
+    # Convert integer columns
+    for col in INT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce', downcast='integer')
+    
+    # Convert float columns
+    for col in FLOAT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce', downcast='float')
+    
+    # Convert boolean columns
+    for col in BOOL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('boolean')
+    
+    return df
+
+def apply_stream_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a chunk of rows to the fixed STREAM_DTYPES schema.
+    """
+    for col, dtype in STREAM_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'boolean':
+            df[col] = df[col].astype(dtype)
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    
+    return df
+
+class ConversionStats:
+    """
+    Running counters behind the end-of-run statistics.
+    Updated once per DataFrame (the whole run, or each chunk when streaming), so the
+    report never needs every row in memory at once. With sketches (see killmail_sketches),
+    the unique entity counts, top lists and damage quantiles are kept as well.
+    """
+    
+    def __init__(self, sketches: Optional[KillmailSketches] = None):
+        self.sketches = sketches
+        self.total_records = 0
+        self.chunks = 0
+        self.peak_memory_bytes = 0
+        self.victim_ships_matched = 0
+        self.attacker_ships_matched = 0
+        self.weapons_matched = 0
+        self.total_weapons = 0
+        self.systems_matched = 0
+        self.total_systems = 0
+        self.fact_rows = {}
+    
+    def update(self, df: pd.DataFrame) -> None:
+        self.total_records += len(df)
+        self.chunks += 1
+        self.peak_memory_bytes = max(self.peak_memory_bytes, int(df.memory_usage(deep=True).sum()))
+        self.victim_ships_matched += self._present(df, 'victim_ship_name')
+        self.attacker_ships_matched += self._present(df, 'attacker_ship_name')
+        self.weapons_matched += self._present(df, 'attacker_weapon_type_name')
+        self.total_weapons += self._present(df, 'attacker_weapon_type_id')
+        self.systems_matched += self._present(df, 'solar_system_name')
+        self.total_systems += self._present(df, 'solar_system_id')
+        if self.sketches is not None:
+            self.sketches.add(df)
+    
+    @staticmethod
+    def _present(df: pd.DataFrame, col: str) -> int:
+        # Non-missing values of col; 0 when a column projection left it out
+        return int(df[col].notna().sum()) if col in df.columns else 0
+    
+    def update_facts(self, fact_frames: Dict[str, pd.DataFrame]) -> None:
+        for name, frame in fact_frames.items():
+            self.fact_rows[name] = self.fact_rows.get(name, 0) + len(frame)
+    
+    def print_report(self, ship_data: Optional[Dict], type_data: Optional[Dict],
+                     solar_system_data: Optional[Dict], errors: List[str]) -> None:
+        log("\n=== STATISTICS ===")
+        log(f"Total records: {self.total_records}")
+        if self.chunks > 1:
+            log(f"Memory usage: {self.peak_memory_bytes / 1024 / 1024:.2f} MB (largest of {self.chunks} chunks)")
+        else:
+            log(f"Memory usage: {self.peak_memory_bytes / 1024 / 1024:.2f} MB")
+        
+        # Lookup statistics
+        if ship_data:
+            log(f"Ship name matches: {self.victim_ships_matched} victims, {self.attacker_ships_matched} attackers")
+        
+        if type_data:
+            log(f"Weapon type matches: {self.weapons_matched}/{self.total_weapons}")
+        
+        if solar_system_data:
+            log(f"Solar system matches: {self.systems_matched}/{self.total_systems}")
+        
+        if self.fact_rows:
+            log("Fact tables: " + ", ".join(f"{rows} {name}" for name, rows in self.fact_rows.items()))
+        
+        if self.sketches is not None:
+            summary = self.sketches.summary(top=5)
+            log("Unique (estimated): " + ", ".join(f"{count} {name}" for name, count in summary['unique'].items()))
+            names = {
+                'victim_ships': {ship_id: info['name'] for ship_id, info in (ship_data or {}).items()},
+                'attacker_ships': {ship_id: info['name'] for ship_id, info in (ship_data or {}).items()},
+                'weapons': type_data or {},
+                'systems': solar_system_data or {},
+            }
+            for name, entries in summary['top'].items():
+                log(f"Top {name.replace('_', ' ')}: " + ", ".join(
+                    f"{names[name].get(key, key)} ({count})" for key, count, _ in entries))
+            for col, quantiles in summary['quantiles'].items():
+                log(f"{col}: " + ", ".join(f"{q} {value:,.0f}" for q, value in quantiles.items()))
+        
+        if errors:
+            print(f"\nErrors encountered: {len(errors)}")
+            for error in errors[:10]:  # Show first 10 errors
+                print(f"  - {error}")
+            if len(errors) > 10:
+                print(f"  ... and {len(errors) - 10} more errors")
+
+def iter_json_files(input_path: Path) -> Iterator[Path]:
+    """
+    Yield the JSON files in a folder, sorted by name so that every run (and every shard of a
+    sharded run) sees them in the same order whatever the file system returns.
+    """
+    yield from sorted(input_path.glob('*.json'), key=lambda path: path.name)
+
+def iter_archive_members(archive_path: Path, errors: List[str]) -> Iterator[Tuple[str, bytes]]:
+    """
+    Stream the JSON members of a daily killmail archive (.tar.bz2, .tar.gz, ...) without
+    extracting it to disk. Yields (member file name, raw bytes) in archive order.
+    A damaged archive ends the stream and is recorded in errors.
+    """
+    try:
+        # 'r|*' reads the archive as a forward-only stream with transparent decompression
+        with tarfile.open(archive_path, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile() or not member.name.endswith('.json'):
+                    continue
+                
+                member_name = PurePosixPath(member.name).name
+                try:
+                    payload = archive.extractfile(member).read()
+                except (tarfile.TarError, OSError, EOFError) as e:
+                    errors.append(f"Error processing {member_name}: {e}")
+                    return
+                
+                yield member_name, payload
+    except (tarfile.TarError, OSError, EOFError) as e:
+        errors.append(f"Error reading archive {archive_path.name}: {e}")
+
+def iter_parsed_killmails(sources: Iterable[KillmailSource], errors: List[str],
+                          decode: Callable[[bytes], object] = json.loads) -> Iterator[Tuple[str, dict]]:
+    """
+    Parse each killmail source and yield (file name, killmail) pairs.
+    A source is either a JSON file path or a (member name, raw bytes) pair from an archive.
+    decode turns raw bytes into a killmail (see killmail_decoding.get_decoder).
+    Sources that cannot be read or decoded are recorded in errors and skipped.
+    """
+    for source in sources:
+        if isinstance(source, tuple):
+            source_name, payload = source
+        else:
+            source_name, payload = source.name, None
+        
+        try:
+            if payload is None:
+                payload = source.read_bytes()
+            data = decode(payload)
+        except DECODE_ERRORS as e:
+            errors.append(f"JSON decode error in {source_name}: {e}")
+            continue
+        except Exception as e:
+            errors.append(f"Error processing {source_name}: {e}")
+            continue
+        
+        yield source_name, data
+
+def iter_flattened_killmails(parsed_killmails: Iterable[Tuple[str, dict]], errors: List[str],
+                             ship_data: Optional[Dict] = None,
+                             type_data: Optional[Dict] = None,
+                             solar_system_data: Optional[Dict] = None,
+                             facts: Optional[KillmailFacts] = None,
+                             projection: Optional[ColumnProjection] = None) -> Iterator[dict]:
+    """
+    Flatten each parsed killmail into a row dictionary, adding the source filename.
+    With facts, the killmail's attackers and items are added to those fact tables as well.
+    With a projection, only its flattened columns are built (see flatten_killmail).
+    """
+    add_source_file = projection is None or 'source_file' in projection.flattened
+    for file_name, data in parsed_killmails:
+        try:
+            flattened = flatten_killmail(data, ship_data, type_data, solar_system_data, projection)
+            if facts is not None:
+                facts.add(data)
+        except Exception as e:
+            errors.append(f"Error processing {file_name}: {e}")
+            continue
+        
+        if add_source_file:
+            flattened['source_file'] = file_name
+        yield flattened
+
+class BatchResult(NamedTuple):
+    """
+    The flattened rows and error messages of one batch of killmail sources, in file order,
+    and the batch's attacker and item fact tables (None unless they were requested).
+    """
+    rows: List[dict]
+    errors: List[str]
+    facts: Optional[KillmailFacts]
+
+def process_killmail_batch(sources: List[KillmailSource], ship_data: Optional[Dict] = None,
+                          type_data: Optional[Dict] = None,
+                          solar_system_data: Optional[Dict] = None,
+                          json_backend: str = 'auto',
+                          fact_tables: bool = False,
+                          attacker_facts: bool = True,
+                          projection: Optional[ColumnProjection] = None) -> BatchResult:
+    """
+    Parse and flatten a batch of killmail JSON files or archive members.
+    With fact_tables=True the attacker and item fact tables are filled in the same pass
+    (only the item table with attacker_facts=False).
+    With a projection, only its columns are flattened, and the attackers and items are not
+    even decoded (with msgspec) unless its columns or the fact tables use them.
+    """
+    errors = []
+    facts = KillmailFacts(attackers=attacker_facts) if fact_tables else None
+    if projection is None:
+        decode = get_decoder(json_backend)
+    else:
+        decode = get_decoder(json_backend, attackers=projection.attackers or (fact_tables and attacker_facts),
+                             items=projection.items or fact_tables)
+    parsed = iter_parsed_killmails(sources, errors, decode)
+    batch_data = list(iter_flattened_killmails(parsed, errors, ship_data, type_data, solar_system_data,
+                                               facts, projection))
+    return BatchResult(batch_data, errors, facts)
+
+# Lookup tables, JSON backend and fact table settings of a pool worker, sent once per process
+# by _init_worker instead of with every batch
+_worker_settings = (None, None, None, 'auto', False, True, None)
+
+def _init_worker(ship_data: Optional[Dict], type_data: Optional[Dict],
+                 solar_system_data: Optional[Dict], json_backend: str, fact_tables: bool,
+                 attacker_facts: bool, projection: Optional[ColumnProjection]) -> None:
+    global _worker_settings
+    _worker_settings = (ship_data, type_data, solar_system_data, json_backend, fact_tables,
+                        attacker_facts, projection)
+
+def _process_batch_in_worker(sources: List[KillmailSource]) -> BatchResult:
+    return process_killmail_batch(sources, *_worker_settings)
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[list]:
+    """
+    Group an iterable into lists of batch_size items without materializing it.
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def source_key(source: KillmailSource) -> str:
+    """
+    Name and size of a source file or archive member, identifying it in checkpoints.
+    """
+    if isinstance(source, tuple):
+        return f"{source[0]}:{len(source[1])}"
+    return f"{source.name}:{source.stat().st_size}"
+
+def iter_processed_batches(batches: Iterable[List[KillmailSource]], ship_data: Optional[Dict] = None,
+                           type_data: Optional[Dict] = None,
+                           solar_system_data: Optional[Dict] = None,
+                           workers: Optional[int] = None,
+                           total: Optional[int] = None,
+                           json_backend: str = 'auto',
+                           fact_tables: bool = False,
+                           attacker_facts: bool = True,
+                           projection: Optional[ColumnProjection] = None) -> Iterator[BatchResult]:
+    """
+    Yield a BatchResult for each batch of files, in batch order.
+    
+    batches may be a lazy iterator (e.g. members streamed from an archive); total is only
+    used for the progress messages and defaults to len(batches) when available.
+    
+    With more than one worker the batches are processed in a process pool, keeping at most
+    two batches per worker in flight. If the pool cannot be started or breaks, the remaining
+    batches are processed serially, so the result is always the same as a serial run.
+    """
+    if total is None and hasattr(batches, '__len__'):
+        total = len(batches)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if total is not None:
+        workers = min(workers, total)
+    
+    batch_iter = iter(batches)
+    pending = deque()  # (batch, future) pairs, oldest first
+    done = 0
+    
+    def progress(batch):
+        of_total = f"/{total}" if total is not None else ""
+        log(f"Processing batch {done}{of_total} ({len(batch)} files)...")
+    
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(ship_data, type_data, solar_system_data,
+                                               json_backend, fact_tables, attacker_facts,
+                                               projection)) as executor:
+                for batch in itertools.islice(batch_iter, workers * 2):
+                    pending.append((batch, executor.submit(_process_batch_in_worker, batch)))
+                
+                while pending:
+                    batch, future = pending[0]
+                    result = future.result()
+                    pending.popleft()
+                    for next_batch in itertools.islice(batch_iter, 1):
+                        pending.append((next_batch, executor.submit(_process_batch_in_worker, next_batch)))
+                    
+                    done += 1
+                    progress(batch)
+                    yield result
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            print(f"Warning: Process pool unavailable ({e}), processing remaining batches serially")
+    
+    # Serial path, also picking up whatever the pool did not finish
+    for batch in itertools.chain((batch for batch, _ in pending), batch_iter):
+        done += 1
+        progress(batch)
+        yield process_killmail_batch(batch, ship_data, type_data, solar_system_data, json_backend,
+                                     fact_tables, attacker_facts, projection)
+
+class KillmailManifest:
+    """
+    Compact on-disk index of what an output file already contains, used by incremental runs:
+    the processed source file names and the (killmail_id, killmail_hash) pairs written so far.
+    Stored as a compressed .npz next to the output.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.source_files = set()
+        self.killmails = set()
+    
+    @classmethod
+    def load(cls, path: str) -> 'KillmailManifest':
+        manifest = cls(path)
+        if os.path.exists(path):
+            with np.load(path) as arrays:
+                manifest.source_files = set(arrays['source_file'].tolist())
+                manifest.killmails = set(zip(arrays['killmail_id'].tolist(),
+                                             arrays['killmail_hash'].astype(str).tolist()))
+        return manifest
+    
+    def save(self) -> None:
+        killmails = sorted(self.killmails)
+        # Write to a temporary file and rename, so a crash never leaves a half-written manifest
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            source_file=np.array(sorted(self.source_files), dtype=str),
+            killmail_id=np.array([killmail_id for killmail_id, _ in killmails], dtype=np.int64),
+            killmail_hash=np.array([killmail_hash for _, killmail_hash in killmails], dtype='S40'),
+        )
+        os.replace(tmp_path, self.path)
+    
+    def filter_new(self, rows: List[dict]) -> List[dict]:
+        """
+        Record the rows' source files as processed and return only the rows whose killmail
+        is not in the manifest yet (including duplicates under other file names in this run).
+        """
+        new_rows = []
+        for row in rows:
+            self.source_files.add(row['source_file'])
+            key = (row['killmail_id'], row['killmail_hash'])
+            if key[0] is None or key in self.killmails:
+                continue
+            self.killmails.add(key)
+            new_rows.append(row)
+        return new_rows
+
+class CsvChunkWriter:
+    """
+    Writes DataFrame chunks to one CSV file: the first chunk replaces the file and writes the
+    header, later chunks are appended. With append=True every chunk is appended.
+    """
+    
+    def __init__(self, output_csv: str, append: bool = False):
+        self.output_csv = output_csv
+        self.append = append
+    
+    def write(self, chunk: pd.DataFrame) -> None:
+        chunk.to_csv(self.output_csv, mode='a' if self.append else 'w', header=not self.append,
+                     index=False, encoding='utf-8')
+        self.append = True
+    
+    def close(self) -> None:
+        pass
+
+# Hive-style partition columns of the Parquet output, derived from killmail_time
+PARQUET_PARTITION_COLUMNS = ['killmail_date', 'killmail_hour']
+# pyarrow's name for a null partition value
+PARQUET_NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+def _arrow_table(df: pd.DataFrame) -> 'pa.Table':
+    """
+    Convert a chunk to an Arrow table with a schema that does not depend on the chunk's values:
+    categoricals become dictionary<int32, string> and text (or all-missing) columns become
+    string, so files written by different chunks and runs load as one dataset.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = []
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+        elif (pa.types.is_null(field.type) or pa.types.is_string(field.type)
+              or pa.types.is_large_string(field.type)):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+class ParquetChunkWriter:
+    """
+    Writes DataFrame chunks to a Parquet dataset directory partitioned by killmail date and hour
+    (killmail_date=YYYY-MM-DD/killmail_hour=H/part-<run>.parquet). Name columns are stored
+    dictionary-encoded and numeric columns keep their optimized dtypes.
+    
+    Each partition gets one file per run. Rows are buffered per partition and written as a
+    row group once row_group_size rows have collected, so memory stays bounded while the files
+    don't fill up with tiny row groups. Call close() to flush the rest.
+    
+    Unless append=True, a partition that already exists is emptied the first time this run
+    writes to it, so re-converting a day replaces that day instead of duplicating it.
+    """
+    
+    def __init__(self, output_dir: str, append: bool = False, row_group_size: int = 10000):
+        self.output_dir = Path(output_dir)
+        self.append = append
+        self.row_group_size = row_group_size
+        self.run_id = time.strftime('%Y%m%d%H%M%S')
+        self.writers = {}
+        self.buffers = {}
+    
+    def write(self, chunk: pd.DataFrame) -> None:
+        times = chunk['killmail_time'].astype('string')
+        dates = times.str.slice(0, 10).fillna(PARQUET_NULL_PARTITION)
+        hours = (pd.to_numeric(times.str.slice(11, 13), errors='coerce').astype('Int64')
+                 .astype('string').fillna(PARQUET_NULL_PARTITION))
+        
+        for partition, part in chunk.groupby([dates, hours], sort=True):
+            buffer = self.buffers.setdefault(partition, [])
+            buffer.append(_arrow_table(part))
+            if sum(len(table) for table in buffer) >= self.row_group_size:
+                self._flush(partition)
+    
+    def _flush(self, partition: Tuple[str, str]) -> None:
+        buffer = self.buffers.pop(partition, None)
+        if not buffer:
+            return
+        table = pa.concat_tables(buffer)
+        
+        writer = self.writers.get(partition)
+        if writer is None:
+            date, hour = partition
+            partition_dir = self.output_dir / f"killmail_date={date}" / f"killmail_hour={hour}"
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            if not self.append:
+                for old_file in partition_dir.glob('*.parquet'):
+                    old_file.unlink()
+            writer = pq.ParquetWriter(partition_dir / f"part-{self.run_id}.parquet", table.schema)
+            self.writers[partition] = writer
+        
+        writer.write_table(table)
+    
+    def close(self) -> None:
+        for partition in list(self.buffers):
+            self._flush(partition)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+def fact_table_paths(output_csv: str, output_format: str = 'csv') -> Dict[str, str]:
+    """
+    Where the attacker and item fact tables of an output go: <name>_attackers.csv and
+    <name>_items.csv next to a CSV, or <dir>_attackers / <dir>_items datasets next to Parquet.
+    """
+    if output_format == 'parquet':
+        base, extension = str(output_csv).rstrip('/\\'), ''
+    else:
+        base, extension = os.path.splitext(output_csv)
+    return {name: f"{base}_{name}{extension}" for name in FACT_TABLE_KEYS}
+
+def fact_table_frames(facts: KillmailFacts, chunk: pd.DataFrame, deduplicate: bool = False,
+                      with_killmail_time: bool = False) -> Dict[str, pd.DataFrame]:
+    """
+    The fact table DataFrames belonging to a chunk of killmail rows.
+    
+    With deduplicate=True (incremental runs), only facts of killmails still in the chunk after
+    the manifest check are kept, once each. with_killmail_time joins on the chunk's
+    killmail_time, which the Parquet writer partitions by.
+    """
+    frames = facts.to_frames()
+    if not deduplicate and not with_killmail_time:
+        return frames
+    
+    times = chunk[['killmail_id', 'killmail_time']].dropna(subset=['killmail_id'])
+    times = times.drop_duplicates('killmail_id').astype({'killmail_id': 'Int64'})
+    for name, frame in frames.items():
+        if deduplicate:
+            frame = frame[frame['killmail_id'].isin(times['killmail_id'])]
+            frame = frame.drop_duplicates(FACT_TABLE_KEYS[name])
+        if with_killmail_time:
+            frame = frame.merge(times, on='killmail_id', how='left')
+        frames[name] = frame
+    return frames
+
+def write_chunks(batch_results: Iterable[BatchResult],
+                 writer: Union[CsvChunkWriter, ParquetChunkWriter],
+                 errors: List[str], stats: ConversionStats,
+                 reference_tables: Dict[str, ReferenceTable],
+                 manifest: Optional[KillmailManifest] = None,
+                 report: Optional[RunReport] = None,
+                 fact_writers: Optional[Dict[str, Union[CsvChunkWriter, ParquetChunkWriter]]] = None,
+                 cube_builder: Optional[CubeBuilder] = None,
+                 solar_system_table: Optional[SolarSystemTable] = None,
+                 store: Optional[KillmailStore] = None,
+                 name_resolver: Optional[NameResolver] = None,
+                 price_table: Optional[PriceTable] = None,
+                 intermediate: Optional[IntermediateWriter] = None,
+                 projection: Optional[ColumnProjection] = None) -> int:
+    """
+    Enrich each batch of flattened rows and hand it to writer as soon as it arrives,
+    using the fixed KILLMAIL_COLUMNS / STREAM_DTYPES schema. Only one chunk is held in memory.
+    
+    With a manifest, killmails it already lists are dropped and the new ones are added to it.
+    With a report, the time spent in each step is added to its stages.
+    With fact_writers ({'attackers': writer, 'items': writer}), each batch's fact tables are
+    written alongside its chunk. With a cube_builder, each chunk is added to the daily cubes.
+    With a solar_system_table, the region, security and coordinate columns are added.
+    With a store, each chunk is also upserted into the SQLite store.
+    With a name_resolver, the character, corporation and alliance names of each chunk are added.
+    With a price_table, each chunk is valued from its batch's item fact table.
+    With an intermediate, each chunk is also written there before it is enriched.
+    With a projection, chunks hold its computed columns and only its output columns are written.
+    Returns the number of rows written.
+    """
+    report = report or RunReport('write_chunks')
+    rows_written = 0
+    name_id_columns = entity_name_id_columns(projection)
+    
+    for batch_data, batch_errors, batch_facts in report.timed_iter('parse_flatten', batch_results):
+        report.count('parse_flatten', rows=len(batch_data), errors=len(batch_errors))
+        errors.extend(batch_errors)
+        if manifest is not None:
+            with report.stage('dedupe'):
+                batch_data = manifest.filter_new(batch_data)
+        if not batch_data:
+            continue
+        
+        with report.stage('dataframe_build'):
+            chunk = pd.DataFrame(batch_data, columns=KILLMAIL_COLUMNS if projection is None else projection.flattened)
+        if price_table is not None and batch_facts is not None:
+            with report.stage('valuation'):
+                value_killmails(chunk, batch_facts, price_table)
+        if intermediate is not None:
+            with report.stage('intermediate'):
+                intermediate.write(chunk)
+        with report.stage('enrich'):
+            enrich_killmails(chunk, reference_tables)
+            if solar_system_table is not None:
+                enrich_spatial(chunk, solar_system_table)
+        if name_resolver is not None:
+            with report.stage('names'):
+                add_entity_names(chunk, name_resolver, name_id_columns)
+        with report.stage('dtype_optimize'):
+            apply_stream_schema(chunk)
+        with report.stage('write'):
+            writer.write(chunk if projection is None else chunk[projection.output])
+        report.count('write', rows_written=len(chunk))
+        rows_written += len(chunk)
+        
+        if fact_writers and batch_facts is not None:
+            with report.stage('fact_tables'):
+                frames = fact_table_frames(batch_facts, chunk, deduplicate=manifest is not None,
+                                           with_killmail_time=isinstance(writer, ParquetChunkWriter))
+                for name, frame in frames.items():
+                    fact_writers[name].write(frame)
+            stats.update_facts(frames)
+        
+        if cube_builder is not None:
+            with report.stage('cubes'):
+                cube_builder.add(chunk)
+        
+        if store is not None:
+            with report.stage('store'):
+                store.write(chunk)
+        
+        with report.stage('statistics'):
+            stats.update(chunk)
+    
+    return rows_written
+
 def convert_json_folder_to_csv_pandas(input_folder: str, output_csv: str = 'killmails.csv', 
                                     shiplist_csv: Optional[str] = None, 
                                     typeid_csv: Optional[str] = None, 
-                                    map_solar_systems_csv: Optional[str] = None) -> None:
+                                    map_solar_systems_csv: Optional[str] = None,
+                                    workers: Optional[int] = None,
+                                    stream: bool = False,
+                                    chunk_size: int = 1000,
+                                    use_lookup_cache: bool = True,
+                                    lookup_cache_path: Optional[str] = None,
+                                    incremental: bool = False,
+                                    output_format: str = 'csv',
+                                    json_backend: str = 'auto',
+                                    fact_tables: bool = False,
+                                    cube_dir: Optional[str] = None,
+                                    spatial_enrichment: bool = False,
+                                    sqlite_path: Optional[str] = None,
+                                    resolve_names: bool = False,
+                                    names_cache_path: Optional[str] = None,
+                                    names_url: str = ESI_NAMES_URL,
+                                    price_csv: Optional[str] = None,
+                                    intermediate_path: Optional[str] = None,
+                                    sketch_path: Optional[str] = None,
+                                    checkpoint_dir: Optional[str] = None,
+                                    columns: Optional[List[str]] = None,
+                                    verbose: bool = True,
+                                    report_path: Optional[str] = None) -> dict:
     """
     Convert all JSON files in a folder to a single CSV file using pandas for optimization.
+    
+    input_folder may also be a daily killmail archive (.tar.bz2 / .tar.gz); its JSON members
+    are streamed straight from the archive without being extracted.
+    
+    workers sets the number of processes used to parse and flatten the files
+    (default: one per CPU). Use workers=1 to process everything serially in this process.
+    The output is identical either way.
+    
+    With stream=True each chunk of chunk_size rows is written as soon as it is flattened,
+    so memory use stays flat however many killmails there are. Chunks use the fixed
+    STREAM_DTYPES schema (nullable integers) instead of a downcast of the whole table.
+    
+    The lookup tables are read through the compiled cache of load_lookup_data unless
+    use_lookup_cache is False; lookup_cache_path overrides where that cache lives.
+    
+    With incremental=True a KillmailManifest (output_csv + '.manifest.npz') records which
+    files and killmails are already in the output. Later runs only parse files that are not
+    in it, append only killmails that are not in it, and skip duplicates that arrive under
+    another file name. Incremental runs always use the chunked (stream) writer.
+    
+    output_format='parquet' writes output_csv as a Parquet dataset directory partitioned by
+    killmail date and hour instead of a CSV file (requires pyarrow). Parquet output always uses
+    the fixed STREAM_DTYPES schema so that every partition loads with the same column types.
+    
+    json_backend picks the JSON decoder: 'msgspec' decodes straight into the typed killmail
+    structs of killmail_decoding, 'stdlib' uses json, and 'auto' (default) uses msgspec when
+    it is installed.
+    
+    fact_tables=True also writes the attacker and item fact tables (see killmail_facts), one row
+    per attacker and per item keyed by killmail_id, to the paths given by fact_table_paths.
+    They are filled in the same parse pass; the killmail output itself is unchanged.
+    
+    cube_dir also writes the daily aggregate cubes of killmail_cubes (kills and damage/item sums
+    by hour, solar system and ship) there, one CSV per cube, day and input, for fast monthly
+    rollups. Re-converting an input replaces its own files, or incremental runs add to them;
+    other inputs' killmails of the same days are kept.
+    
+    spatial_enrichment=True adds the region, constellation, security and light-year coordinate
+    columns of killmail_spatial.SPATIAL_COLUMNS, from the full mapSolarSystems.csv.
+    
+    sqlite_path also upserts every row into the SQLite store of killmail_store (one table keyed
+    by killmail_id, with indexes on time, system, alliance, corporation and ship type IDs), so
+    ad-hoc questions are answered with SQL instead of re-reading the CSVs. Re-runs replace
+    the killmails they contain instead of duplicating them.
+    
+    resolve_names=True adds the character, corporation and alliance names of the victim and
+    final-blow attacker (killmail_names.ENTITY_NAME_COLUMNS). The unique IDs of the run (of
+    each chunk when streaming) are resolved in bulk POSTs to names_url (ESI /universe/names/)
+    through a persistent cache, by default .killmail_names_cache.sqlite next to the output.
+    
+    price_csv (type ID -> price, see killmail_valuation.PriceTable) adds the ISK value of each
+    killmail: destroyed_value, dropped_value, hull_value and total_value. The items, container
+    contents included, are collected in the parse pass as for fact_tables and priced with
+    array operations per batch.
+    
+    intermediate_path also saves the flattened rows before enrichment as a columnar,
+    memory-mapped intermediate (see killmail_intermediate). reenrich_intermediate_pandas turns
+    it into the same output again, with updated lookup files, without re-parsing any JSON.
+    
+    sketch_path saves the run's bounded-memory statistics (killmail_sketches.KillmailSketches:
+    unique characters/corporations/alliances, top ships, weapons and systems, damage and value
+    quantiles) as an .npz that merges with other days' files; incremental runs add to it.
+    The end-of-run statistics then include them as well.
+    
+    checkpoint_dir makes long runs resumable: every parsed batch is saved there as it completes,
+    with a journal of the batches done (see killmail_checkpoints). If the run dies, running it
+    again with the same input and settings loads the saved batches instead of parsing them and
+    produces exactly the output an uninterrupted run would have. The checkpoints are deleted
+    once the output is complete. Not available for incremental runs, whose appends to the
+    existing output cannot be replayed.
+    
+    columns writes only those output columns, in that order, and computes only what they need
+    (see plan_column_projection): the attackers and items are not scanned, or with msgspec not
+    even decoded, unless a selected column (or the fact tables) uses them, and only the
+    selected name, spatial, value and entity name columns are looked up. Columns that other
+    outputs need (cubes, the SQLite store's killmail_id, the incremental manifest's keys) are
+    computed but not written. Parquet output always includes killmail_time, which it is
+    partitioned by.
+    
+    verbose=False turns off the progress and debug output; warnings, errors and the final
+    summary are still printed. Each run is measured by a RunReport (killmail_instrumentation):
+    wall time, CPU time, file/row/byte/error counts and peak RSS per stage, plus killmails per
+    second overall. The report is returned as a dict and, with report_path, written there as JSON.
+    """
+    report = RunReport('pandas', {
+        'input_folder': str(input_folder), 'output': str(output_csv), 'workers': workers,
+        'stream': stream, 'chunk_size': chunk_size, 'incremental': incremental,
+        'output_format': output_format, 'json_backend': json_backend, 'fact_tables': fact_tables,
+        'cube_dir': None if cube_dir is None else str(cube_dir), 'spatial_enrichment': spatial_enrichment,
+        'sqlite_path': None if sqlite_path is None else str(sqlite_path),
+        'resolve_names': resolve_names, 'names_url': names_url if resolve_names else None,
+        'price_csv': None if price_csv is None else str(price_csv),
+        'intermediate_path': None if intermediate_path is None else str(intermediate_path),
+        'sketch_path': None if sketch_path is None else str(sketch_path),
+        'checkpoint_dir': None if checkpoint_dir is None else str(checkpoint_dir),
+        'columns': None if columns is None else list(columns),
+    })
+    previous_verbose = set_verbose(verbose)
+    try:
+        _convert_json_folder_pandas(report, input_folder, output_csv, shiplist_csv, typeid_csv,
+                                    map_solar_systems_csv, workers, stream, chunk_size,
+                                    use_lookup_cache, lookup_cache_path, incremental,
+                                    output_format, json_backend, fact_tables, cube_dir,
+                                    spatial_enrichment, sqlite_path, resolve_names,
+                                    names_cache_path, names_url, price_csv, intermediate_path,
+                                    sketch_path, checkpoint_dir, columns)
+    except BaseException:
+        report.status = 'failed'
+        raise
+    finally:
+        set_verbose(previous_verbose)
+        if report_path:
+            report.write(report_path)
+            log(f"Run report written to '{report_path}'")
+    return report.finish()
+
+def _convert_json_folder_pandas(report: RunReport, input_folder: str, output_csv: str,
+                                shiplist_csv: Optional[str], typeid_csv: Optional[str],
+                                map_solar_systems_csv: Optional[str], workers: Optional[int],
+                                stream: bool, chunk_size: int, use_lookup_cache: bool,
+                                lookup_cache_path: Optional[str], incremental: bool,
+                                output_format: str, json_backend: str, fact_tables: bool,
+                                cube_dir: Optional[str], spatial_enrichment: bool,
+                                sqlite_path: Optional[str], resolve_names: bool,
+                                names_cache_path: Optional[str], names_url: str,
+                                price_csv: Optional[str], intermediate_path: Optional[str],
+                                sketch_path: Optional[str], checkpoint_dir: Optional[str],
+                                columns: Optional[List[str]]) -> None:
+    """
+    The conversion behind convert_json_folder_to_csv_pandas, recording into report.
     """
     input_path = Path(input_folder)
     
     if not input_path.exists():
         print(f"Error: Input folder '{input_folder}' does not exist.")
+        report.status = 'no_input'
         return
     
-    print("Loading lookup data...")
-    
-    # Load lookup data
-    ship_data = load_ship_data(shiplist_csv) if shiplist_csv else {}
-    type_data = load_type_data(typeid_csv) if typeid_csv else {}
-    solar_system_data = load_solar_system_data(map_solar_systems_csv) if map_solar_systems_csv else {}
+    if output_format not in ('csv', 'parquet'):
+        print(f"Error: Unknown output format '{output_format}', expected 'csv' or 'parquet'.")
+        report.status = 'failed'
+        return
+    if output_format == 'parquet' and pq is None:
+        print("Error: Parquet output requires pyarrow (pip install pyarrow).")
+        report.status = 'failed'
+        return
     
-    # Find all JSON files
-    json_files = list(input_path.glob('*.json'))
+    projection = None
+    if columns is not None:
+        available = (KILLMAIL_COLUMNS + (SPATIAL_COLUMNS if spatial_enrichment else [])
+                     + (VALUE_COLUMNS if price_csv else [])
+                     + (list(ENTITY_NAME_COLUMNS.values()) if resolve_names else []))
+        unknown = [col for col in columns if col not in available]
+        if unknown or not columns:
+            print(f"Error: Unknown output columns {unknown}. Available: {', '.join(available)} "
+                  "(the spatial, value and entity name columns need spatial_enrichment, price_csv "
+                  "and resolve_names).")
+            report.status = 'failed'
+            return
+        columns = list(columns)
+        if output_format == 'parquet' and 'killmail_time' not in columns:
+            columns.append('killmail_time')
+        required = []
+        if incremental:
+            required += ['killmail_id', 'killmail_hash', 'source_file']
+        if fact_tables or sqlite_path:
+            required.append('killmail_id')
+        if cube_dir:
+            required += CUBE_COLUMNS
+        projection = plan_column_projection(columns, required)
+        # Skip whole steps whose columns nobody asked for
+        if not any(col in projection.computed for col in SPATIAL_COLUMNS):
+            spatial_enrichment = False
+        if not any(col in projection.computed for col in VALUE_COLUMNS):
+            price_csv = None
+        if not any(col in projection.computed for col in ENTITY_NAME_COLUMNS.values()):
+            resolve_names = False
+        log(f"Computing {len(projection.computed)} columns for the {len(projection.output)} selected")
     
-    if not json_files:
-        print(f"No JSON files found in '{input_folder}'.")
-        return
+    log("Loading lookup data...")
     
-    print(f"Found {len(json_files)} JSON files to process...")
+    # Load lookup data
+    with report.stage('lookup_load'):
+        ship_data, type_data, solar_system_data = load_lookup_data(
+            shiplist_csv, typeid_csv, map_solar_systems_csv,
+            cache_path=lookup_cache_path, use_cache=use_lookup_cache)
+        solar_system_table = None
+        if spatial_enrichment:
+            if map_solar_systems_csv:
+                solar_system_table = SolarSystemTable.from_csv(map_solar_systems_csv)
+            else:
+                print("Warning: spatial_enrichment needs map_solar_systems_csv, skipping it")
+        price_table = PriceTable.from_file(price_csv) if price_csv else None
     
-    # Process files in batches for better memory management
-    batch_size = 1000
-    all_data = []
     errors = []
+    stats = ConversionStats()
     
-    for i in range(0, len(json_files), batch_size):
-        batch_files = json_files[i:i+batch_size]
-        batch_data = []
-        
-        print(f"Processing batch {i//batch_size + 1}/{(len(json_files)-1)//batch_size + 1} ({len(batch_files)} files)...")
+    manifest = None
+    append = False
+    if incremental:
+        manifest_path = f"{output_csv}.manifest.npz"
+        if os.path.exists(output_csv) and os.path.exists(manifest_path):
+            manifest = KillmailManifest.load(manifest_path)
+            append = True
+            log(f"Incremental run: {len(manifest.killmails)} killmails from "
+                  f"{len(manifest.source_files)} files already in '{output_csv}'")
+        else:
+            manifest = KillmailManifest(manifest_path)
+        stream = True
+    if sketch_path:
+        # Incremental runs only add new killmails, so their sketches extend the existing ones
+        stats.sketches = (KillmailSketches.load(sketch_path) if append and os.path.exists(sketch_path)
+                          else KillmailSketches())
+    already_processed = manifest.source_files if manifest is not None else set()
+    
+    if input_path.is_file():
+        # A daily archive: stream its members in batches without extracting anything
+        log(f"Reading killmails from archive '{input_folder}'...")
+        members = report.counted('discovery', iter_archive_members(input_path, errors),
+                                 size=lambda member: len(member[1]))
+        if already_processed:
+            members = (member for member in members if member[0] not in already_processed)
+        batches = iter_batches(members, chunk_size)
+    else:
+        # Find all JSON files
+        with report.stage('discovery'):
+            json_files = list(iter_json_files(input_path))
         
-        for json_file in batch_files:
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    flattened = flatten_killmail(data, ship_data, type_data, solar_system_data)
-                    flattened['source_file'] = json_file.name
-                    batch_data.append(flattened)
-                    
-            except json.JSONDecodeError as e:
-                errors.append(f"JSON decode error in {json_file.name}: {e}")
-            except Exception as e:
-                errors.append(f"Error processing {json_file.name}: {e}")
+        if not json_files:
+            print(f"No JSON files found in '{input_folder}'.")
+            report.status = 'no_data'
+            return
         
-        all_data.extend(batch_data)
+        log(f"Found {len(json_files)} JSON files to process...")
+        if already_processed:
+            json_files = [json_file for json_file in json_files if json_file.name not in already_processed]
+            log(f"{len(json_files)} of them are new since the last run")
+            if not json_files:
+                print(f"'{output_csv}' is already up to date.")
+                report.status = 'up_to_date'
+                return
+        with report.stage('discovery'):
+            report.count('discovery', files=len(json_files),
+                         bytes_read=sum(json_file.stat().st_size for json_file in json_files))
+        batches = [json_files[i:i+chunk_size] for i in range(0, len(json_files), chunk_size)]
     
-    if not all_data:
-        print("No valid data found to convert.")
-        return
+    # Process files in batches; with workers > 1 the batches are spread over a process pool.
+    # Names are not looked up while flattening; enrich_killmails joins them on afterwards.
+    json_backend = resolve_backend(json_backend)
+    log(f"Decoding JSON with the {json_backend} backend")
+    # Valuation prices the item fact table, so it needs the item facts even when they are not
+    # written; the attacker facts only when they are
+    collect_facts = fact_tables or price_table is not None
+    checkpoints = None
+    if checkpoint_dir and incremental:
+        print("Warning: checkpoint_dir is not supported for incremental runs, ignoring it")
+    elif checkpoint_dir:
+        checkpoints = BatchCheckpoints(checkpoint_dir, {
+            'input': str(input_path.resolve()), 'chunk_size': chunk_size, 'json_backend': json_backend,
+            'fact_tables': collect_facts, 'attacker_facts': fact_tables,
+            'columns': None if projection is None else projection.flattened})
+    if checkpoints is None:
+        batch_results = iter_processed_batches(batches, workers=workers, json_backend=json_backend,
+                                               fact_tables=collect_facts, attacker_facts=fact_tables,
+                                               projection=projection)
+    else:
+        total = len(batches) if isinstance(batches, list) else None
+        batch_results = (BatchResult(*result) for result in checkpoints.iter_results(
+            batches, lambda remaining: iter_processed_batches(
+                remaining, workers=workers, json_backend=json_backend, fact_tables=collect_facts,
+                attacker_facts=fact_tables, projection=projection,
+                total=None if total is None else total - checkpoints.resumed),
+            source_key))
+    reference_tables = build_reference_tables(ship_data, type_data, solar_system_data)
     
-    # Convert to DataFrame for efficient processing
-    print("Converting to DataFrame...")
-    df = pd.DataFrame(all_data)
+    if output_format == 'parquet':
+        writer = ParquetChunkWriter(output_csv, append)
+    else:
+        writer = CsvChunkWriter(output_csv, append)
     
-    # Optimize data types for better performance and smaller file size
-    print("Optimizing data types...")
+    fact_writers = None
+    if fact_tables:
+        writer_class = ParquetChunkWriter if output_format == 'parquet' else CsvChunkWriter
+        fact_writers = {name: writer_class(path, append)
+                        for name, path in fact_table_paths(output_csv, output_format).items()}
+    cube_builder = CubeBuilder() if cube_dir else None
+    store = KillmailStore(sqlite_path) if sqlite_path else None
+    name_resolver = None
+    if resolve_names:
+        if names_cache_path is None:
+            names_cache_path = os.path.join(os.path.dirname(os.path.abspath(output_csv)),
+                                            '.killmail_names_cache.sqlite')
+        name_resolver = NameResolver(names_cache_path, names_url)
+    intermediate = None
+    if intermediate_path:
+        intermediate = IntermediateWriter(intermediate_path, STREAM_DTYPES, ENRICHED_COLUMNS, append=append)
     
-    # Convert integer columns
-    int_columns = ['killmail_id', 'solar_system_id', 'victim_alliance_id', 'victim_character_id', 
-                  'victim_corporation_id', 'victim_damage_taken', 'victim_ship_type_id',
-                  'attacker_alliance_id', 'attacker_character_id', 'attacker_corporation_id',
-                  'attacker_damage_done', 'attacker_ship_type_id', 'attacker_weapon_type_id',
-                  'total_attackers', 'total_items', 'items_destroyed', 'items_dropped']
+    if stream:
+        log(f"Streaming records to {output_format.upper()} in chunks of {chunk_size}...")
+        rows_written = write_chunks(batch_results, writer, errors, stats, reference_tables,
+                                    manifest, report, fact_writers, cube_builder, solar_system_table,
+                                    store, name_resolver, price_table, intermediate, projection)
+        with report.stage('write'):
+            writer.close()
+        if intermediate is not None:
+            with report.stage('intermediate'):
+                intermediate.close()
+        for fact_writer in (fact_writers or {}).values():
+            with report.stage('fact_tables'):
+                fact_writer.close()
+        if store is not None:
+            with report.stage('store'):
+                store.close()
+        if manifest is not None:
+            with report.stage('manifest_save'):
+                manifest.save()
+        if not rows_written:
+            if append:
+                print(f"No new killmails; '{output_csv}' is already up to date.")
+                report.status = 'up_to_date'
+            else:
+                print("No valid data found to convert.")
+                report.status = 'no_data'
+            for error in errors[:10]:
+                print(f"  - {error}")
+            if checkpoints is not None:
+                checkpoints.remove()
+            return
+    else:
+        all_data = []
+        all_facts = KillmailFacts(attackers=fact_tables) if collect_facts else None
+        for batch_data, batch_errors, batch_facts in report.timed_iter('parse_flatten', batch_results):
+            report.count('parse_flatten', rows=len(batch_data), errors=len(batch_errors))
+            all_data.extend(batch_data)
+            errors.extend(batch_errors)
+            if all_facts is not None:
+                all_facts.extend(batch_facts)
+        
+        if not all_data:
+            print("No valid data found to convert.")
+            for error in errors[:10]:
+                print(f"  - {error}")
+            report.status = 'no_data'
+            if intermediate is not None:
+                intermediate.close()
+            if checkpoints is not None:
+                checkpoints.remove()
+            return
+        
+        # Convert to DataFrame for efficient processing
+        log("Converting to DataFrame...")
+        with report.stage('dataframe_build'):
+            df = pd.DataFrame(all_data)
+            del all_data
+        
+        if price_table is not None:
+            log("Valuing items...")
+            with report.stage('valuation'):
+                value_killmails(df, all_facts, price_table)
+        
+        if intermediate is not None:
+            log(f"Saving the flattened rows to '{intermediate_path}'...")
+            with report.stage('intermediate'):
+                intermediate.write(df)
+                intermediate.close()
+        
+        log("Enriching with lookup data...")
+        with report.stage('enrich'):
+            enrich_killmails(df, reference_tables)
+            if solar_system_table is not None:
+                enrich_spatial(df, solar_system_table)
+        
+        if name_resolver is not None:
+            log("Resolving character, corporation and alliance names...")
+            with report.stage('names'):
+                add_entity_names(df, name_resolver, entity_name_id_columns(projection))
+        
+        # Optimize data types for better performance and smaller file size
+        log("Optimizing data types...")
+        with report.stage('dtype_optimize'):
+            if output_format == 'parquet':
+                apply_stream_schema(df)
+            else:
+                optimize_dtypes(df)
+        
+        # Write to CSV or Parquet
+        log(f"Writing {len(df)} records to {output_format.upper()}...")
+        with report.stage('write'):
+            output_df = df if projection is None else df[projection.output]
+            if output_format == 'parquet':
+                writer.write(output_df)
+                writer.close()
+            else:
+                output_df.to_csv(output_csv, index=False, encoding='utf-8')
+            del output_df
+        report.count('write', rows_written=len(df))
+        
+        if fact_tables:
+            log("Writing fact tables...")
+            with report.stage('fact_tables'):
+                frames = fact_table_frames(all_facts, df, with_killmail_time=output_format == 'parquet')
+                del all_facts
+                for name, frame in frames.items():
+                    fact_writers[name].write(frame)
+                    fact_writers[name].close()
+            stats.update_facts(frames)
+        
+        if cube_builder is not None:
+            with report.stage('cubes'):
+                cube_builder.add(df)
+        
+        if store is not None:
+            log(f"Loading {len(df)} records into '{sqlite_path}'...")
+            with report.stage('store'):
+                store.write(df)
+                store.close()
+        
+        with report.stage('statistics'):
+            stats.update(df)
     
-    for col in int_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce', downcast='integer')
+    if checkpoints is not None:
+        report.count('parse_flatten', resumed_batches=checkpoints.resumed)
+        checkpoints.remove()
+    print(f"Successfully converted {stats.total_records} records to '{output_csv}'")
+    if fact_tables:
+        paths = fact_table_paths(output_csv, output_format)
+        print(f"Fact tables written to '{paths['attackers']}' and '{paths['items']}'")
+    if store is not None:
+        print(f"Loaded {store.rows_written} killmails into '{sqlite_path}'")
+    if name_resolver is not None:
+        report.count('names', **name_resolver.stats)
+        name_resolver.close()
+        log(f"Names: {name_resolver.stats['requested_ids']} IDs, {name_resolver.stats['cache_hits']} "
+            f"from the cache, {name_resolver.stats['requests']} requests")
+    if cube_builder is not None:
+        with report.stage('cubes'):
+            files_written = write_cubes(cube_builder.cubes or {}, cube_dir, cube_source(input_folder),
+                                        merge_existing=append)
+        print(f"Wrote {files_written} daily cube files to '{cube_dir}'")
+    if stats.sketches is not None:
+        with report.stage('statistics'):
+            stats.sketches.save(sketch_path)
+        log(f"Statistics sketches saved to '{sketch_path}'")
     
-    # Convert float columns
-    float_columns = ['victim_position_x', 'victim_position_y', 'victim_position_z', 'attacker_security_status']
-    for col in float_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce', downcast='float')
+    # Statistics
+    stats.print_report(ship_data, type_data, solar_system_data, errors)
+
+def write_enriched_frames(frames: Iterable[pd.DataFrame],
+                          writer: Union[CsvChunkWriter, ParquetChunkWriter],
+                          reference_tables: Dict[str, ReferenceTable], stats: ConversionStats,
+                          report: RunReport, solar_system_table: Optional[SolarSystemTable] = None,
+                          stream_schema: bool = True) -> int:
+    """
+    Enrich, type and write DataFrames of flattened rows (read from intermediates) as a
+    conversion would, then close writer. stream_schema picks the fixed STREAM_DTYPES (chunked
+    and Parquet output) over optimize_dtypes (one frame for the whole run).
+    Returns the number of rows written.
+    """
+    rows_written = 0
+    for frame in report.timed_iter('read_intermediate', frames):
+        report.count('read_intermediate', rows=len(frame))
+        with report.stage('enrich'):
+            enrich_killmails(frame, reference_tables)
+            if solar_system_table is not None:
+                enrich_spatial(frame, solar_system_table)
+        with report.stage('dtype_optimize'):
+            if stream_schema:
+                apply_stream_schema(frame)
+            else:
+                optimize_dtypes(frame)
+        with report.stage('write'):
+            writer.write(frame)
+        report.count('write', rows_written=len(frame))
+        rows_written += len(frame)
+        with report.stage('statistics'):
+            stats.update(frame)
+    with report.stage('write'):
+        writer.close()
+    return rows_written
+
+def reenrich_intermediate_pandas(intermediate_path: str, output_csv: str,
+                                 shiplist_csv: Optional[str] = None,
+                                 typeid_csv: Optional[str] = None,
+                                 map_solar_systems_csv: Optional[str] = None,
+                                 stream: bool = False,
+                                 chunk_size: int = 50000,
+                                 output_format: str = 'csv',
+                                 spatial_enrichment: bool = False,
+                                 use_lookup_cache: bool = True,
+                                 lookup_cache_path: Optional[str] = None,
+                                 verbose: bool = True,
+                                 report_path: Optional[str] = None) -> dict:
+    """
+    Rebuild a converted output from an intermediate written with intermediate_path, joining
+    the (possibly updated) lookup files on again instead of re-parsing the JSON.
     
-    # Convert boolean columns
-    bool_columns = ['attacker_final_blow']
-    for col in bool_columns:
-        if col in df.columns:
-            df[col] = df[col].astype('boolean')
+    With the same lookup files and options (stream, output_format, spatial_enrichment) as the
+    original conversion, the output is identical to what that conversion wrote. With
+    stream=True the intermediate is read in chunks of chunk_size rows, so memory use stays
+    flat. Returns the RunReport dict, as convert_json_folder_to_csv_pandas does.
+    """
+    report = RunReport('pandas_reenrich', {
+        'intermediate_path': str(intermediate_path), 'output': str(output_csv), 'stream': stream,
+        'chunk_size': chunk_size, 'output_format': output_format,
+        'spatial_enrichment': spatial_enrichment,
+    })
+    previous_verbose = set_verbose(verbose)
+    try:
+        if output_format not in ('csv', 'parquet'):
+            print(f"Error: Unknown output format '{output_format}', expected 'csv' or 'parquet'.")
+            report.status = 'failed'
+            return report.finish()
+        if output_format == 'parquet' and pq is None:
+            print("Error: Parquet output requires pyarrow (pip install pyarrow).")
+            report.status = 'failed'
+            return report.finish()
+        
+        with report.stage('lookup_load'):
+            ship_data, type_data, solar_system_data = load_lookup_data(
+                shiplist_csv, typeid_csv, map_solar_systems_csv,
+                cache_path=lookup_cache_path, use_cache=use_lookup_cache)
+            solar_system_table = None
+            if spatial_enrichment:
+                if map_solar_systems_csv:
+                    solar_system_table = SolarSystemTable.from_csv(map_solar_systems_csv)
+                else:
+                    print("Warning: spatial_enrichment needs map_solar_systems_csv, skipping it")
+        reference_tables = build_reference_tables(ship_data, type_data, solar_system_data)
+        
+        with report.stage('read_intermediate'):
+            reader = IntermediateReader(intermediate_path)
+        log(f"Re-enriching {len(reader)} killmails from '{intermediate_path}'...")
+        stats = ConversionStats()
+        if output_format == 'parquet':
+            writer = ParquetChunkWriter(output_csv)
+        else:
+            writer = CsvChunkWriter(output_csv)
+        
+        chunks = reader.iter_chunks(chunk_size) if stream else [reader.read()]
+        write_enriched_frames(chunks, writer, reference_tables, stats, report, solar_system_table,
+                              stream_schema=stream or output_format == 'parquet')
+        
+        print(f"Successfully re-enriched {stats.total_records} records to '{output_csv}'")
+        stats.print_report(ship_data, type_data, solar_system_data, [])
+    except BaseException:
+        report.status = 'failed'
+        raise
+    finally:
+        set_verbose(previous_verbose)
+        if report_path:
+            report.write(report_path)
+            log(f"Run report written to '{report_path}'")
+    return report.finish()
+
+def convert_shard_pandas(input_folder: str, partial_path: str, shard_index: int, shard_count: int,
+                         workers: Optional[int] = None,
+                         chunk_size: int = 1000,
+                         json_backend: str = 'auto',
+                         price_csv: Optional[str] = None,
+                         verbose: bool = True,
+                         report_path: Optional[str] = None) -> dict:
+    """
+    Parse and flatten one shard of a day for a sharded (multi-machine) conversion.
+    
+    Of the JSON files in input_folder (or the members of a daily archive), only those that
+    killmail_shards.shard_of assigns to shard_index are parsed. Their flattened rows, valued
+    with price_csv if given, are written to partial_path as an intermediate that also records
+    each row's position in the input, with the run's counters and errors in a stats sidecar
+    (partial_path + '.stats.json'). No lookup files are needed; names are joined on by
+    merge_shards_pandas once every shard from 0 to shard_count - 1 has run, on any machines.
+    """
+    report = RunReport('pandas_shard', {
+        'input_folder': str(input_folder), 'partial_path': str(partial_path),
+        'shard_index': shard_index, 'shard_count': shard_count, 'workers': workers,
+        'chunk_size': chunk_size, 'json_backend': json_backend,
+        'price_csv': None if price_csv is None else str(price_csv),
+    })
+    previous_verbose = set_verbose(verbose)
+    try:
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"shard_index must be between 0 and {shard_count - 1}, got {shard_index}")
+        input_path = Path(input_folder)
+        if not input_path.exists():
+            print(f"Error: Input folder '{input_folder}' does not exist.")
+            report.status = 'no_input'
+            return report.finish()
+        
+        with report.stage('lookup_load'):
+            price_table = PriceTable.from_file(price_csv) if price_csv else None
+        
+        errors = []
+        source_count = 0
+        
+        def shard_sources(sources: Iterable[KillmailSource]) -> Iterator[Tuple[int, str, KillmailSource]]:
+            # (position in the input, name, source) of this shard's sources
+            nonlocal source_count
+            for position, source in enumerate(sources):
+                source_count = position + 1
+                name = source[0] if isinstance(source, tuple) else source.name
+                if shard_of(name, shard_count) == shard_index:
+                    yield position, name, source
+        
+        if input_path.is_file():
+            log(f"Reading shard {shard_index}/{shard_count} of archive '{input_folder}'...")
+            members = shard_sources(iter_archive_members(input_path, errors))
+            sources = report.counted('discovery', members, size=lambda member: len(member[2][1]))
+            total = None
+        else:
+            with report.stage('discovery'):
+                sources = list(shard_sources(iter_json_files(input_path)))
+                report.count('discovery', files=len(sources),
+                             bytes_read=sum(source.stat().st_size for _, _, source in sources))
+            log(f"Shard {shard_index}/{shard_count}: {len(sources)} of {source_count} JSON files")
+            total = -(-len(sources) // chunk_size)
+        
+        # Positions and names of the batches handed out, matched up with their results in order
+        batch_sources = deque()
+        
+        def iter_shard_batches() -> Iterator[List[KillmailSource]]:
+            for batch in iter_batches(sources, chunk_size):
+                batch_sources.append([(position, name) for position, name, _ in batch])
+                yield [source for _, _, source in batch]
+        
+        json_backend = resolve_backend(json_backend)
+        batch_results = iter_processed_batches(iter_shard_batches(), workers=workers, total=total,
+                                               json_backend=json_backend,
+                                               fact_tables=price_table is not None,
+                                               attacker_facts=False)
+        intermediate = IntermediateWriter(partial_path, STREAM_DTYPES, ENRICHED_COLUMNS)
+        for batch_data, batch_errors, batch_facts in report.timed_iter('parse_flatten', batch_results):
+            positions = batch_sources.popleft()
+            report.count('parse_flatten', rows=len(batch_data), errors=len(batch_errors))
+            errors.extend(batch_errors)
+            if not batch_data:
+                continue
+            
+            with report.stage('dataframe_build'):
+                chunk = pd.DataFrame(batch_data, columns=KILLMAIL_COLUMNS)
+            if price_table is not None:
+                with report.stage('valuation'):
+                    value_killmails(chunk, batch_facts, price_table)
+            # Rows come out in source order, minus the sources that failed
+            row_positions = []
+            source_iter = iter(positions)
+            for row in batch_data:
+                position, name = next(source_iter)
+                while name != row['source_file']:
+                    position, name = next(source_iter)
+                row_positions.append(position)
+            chunk[SOURCE_INDEX_COLUMN] = np.array(row_positions, dtype=np.int64)
+            with report.stage('intermediate'):
+                intermediate.write(chunk)
+        with report.stage('intermediate'):
+            intermediate.close()
+        
+        shard_report = report.finish()
+        write_sidecar(partial_path, {
+            'shard_index': shard_index,
+            'shard_count': shard_count,
+            'input': str(input_folder),
+            'sources': source_count,
+            'files': shard_report['totals']['files'],
+            'bytes_read': shard_report['totals']['bytes_read'],
+            'rows': intermediate.rows,
+            'errors': errors,
+            'report': shard_report,
+        })
+        print(f"Shard {shard_index}/{shard_count}: {intermediate.rows} records written to '{partial_path}'")
+        if errors:
+            print(f"Errors encountered: {len(errors)}")
+    except BaseException:
+        report.status = 'failed'
+        raise
+    finally:
+        set_verbose(previous_verbose)
+        if report_path:
+            report.write(report_path)
+            log(f"Run report written to '{report_path}'")
+    return report.finish()
+
+def merge_shards_pandas(partial_paths: List[str], output_csv: str,
+                        shiplist_csv: Optional[str] = None,
+                        typeid_csv: Optional[str] = None,
+                        map_solar_systems_csv: Optional[str] = None,
+                        stream: bool = False,
+                        chunk_size: int = 1000,
+                        output_format: str = 'csv',
+                        spatial_enrichment: bool = False,
+                        sketch_path: Optional[str] = None,
+                        use_lookup_cache: bool = True,
+                        lookup_cache_path: Optional[str] = None,
+                        verbose: bool = True,
+                        report_path: Optional[str] = None) -> dict:
+    """
+    Merge the partial outputs of every shard of convert_shard_pandas into the final output.
     
-    # Write to CSV
-    print(f"Writing {len(df)} records to CSV...")
-    df.to_csv(output_csv, index=False, encoding='utf-8')
+    The partials are read back in input order and enriched, typed and written exactly as
+    convert_json_folder_to_csv_pandas does with the same stream, chunk_size, output_format,
+    spatial_enrichment and sketch_path settings. With stream=True the rows are handed on in
+    that run's batches of chunk_size files, whatever chunk_size the shards used, so the
+    output, statistics and sketches (whose quantiles depend on the chunk boundaries) are
+    those of a single-node run; the error list is combined shard by shard. Raises ValueError
+    if a shard is missing or the partials come from different inputs.
+    """
+    report = RunReport('pandas_merge', {
+        'partial_paths': [str(path) for path in partial_paths], 'output': str(output_csv),
+        'stream': stream, 'chunk_size': chunk_size, 'output_format': output_format,
+        'spatial_enrichment': spatial_enrichment,
+        'sketch_path': None if sketch_path is None else str(sketch_path),
+    })
+    previous_verbose = set_verbose(verbose)
+    try:
+        if output_format not in ('csv', 'parquet'):
+            print(f"Error: Unknown output format '{output_format}', expected 'csv' or 'parquet'.")
+            report.status = 'failed'
+            return report.finish()
+        if output_format == 'parquet' and pq is None:
+            print("Error: Parquet output requires pyarrow (pip install pyarrow).")
+            report.status = 'failed'
+            return report.finish()
+        
+        sidecars = read_sidecars(partial_paths)
+        errors = [error for _, sidecar in sidecars for error in sidecar['errors']]
+        report.count('discovery', files=sum(sidecar['files'] for _, sidecar in sidecars),
+                     bytes_read=sum(sidecar['bytes_read'] for _, sidecar in sidecars))
+        report.count('parse_flatten', errors=len(errors))
+        
+        with report.stage('lookup_load'):
+            ship_data, type_data, solar_system_data = load_lookup_data(
+                shiplist_csv, typeid_csv, map_solar_systems_csv,
+                cache_path=lookup_cache_path, use_cache=use_lookup_cache)
+            solar_system_table = None
+            if spatial_enrichment:
+                if map_solar_systems_csv:
+                    solar_system_table = SolarSystemTable.from_csv(map_solar_systems_csv)
+                else:
+                    print("Warning: spatial_enrichment needs map_solar_systems_csv, skipping it")
+        reference_tables = build_reference_tables(ship_data, type_data, solar_system_data)
+        
+        with report.stage('read_intermediate'):
+            # Shards without any rows have no partial to read
+            readers = [IntermediateReader(partial_path) for partial_path, sidecar in sidecars if sidecar['rows']]
+        column_sets = {tuple(reader.columns) for reader in readers}
+        if len(column_sets) > 1:
+            raise ValueError("The partials have different columns (converted with and without price_csv?)")
+        total_rows = sum(len(reader) for reader in readers)
+        log(f"Merging {total_rows} killmails from {len(sidecars)} shards...")
+        
+        if not total_rows:
+            print("No valid data found to convert.")
+            for error in errors[:10]:
+                print(f"  - {error}")
+            report.status = 'no_data'
+            return report.finish()
+        
+        stats = ConversionStats(KillmailSketches() if sketch_path else None)
+        if output_format == 'parquet':
+            writer = ParquetChunkWriter(output_csv)
+        else:
+            writer = CsvChunkWriter(output_csv)
+        chunks = iter_merged_chunks(readers, chunk_size if stream else None)
+        write_enriched_frames(chunks, writer, reference_tables, stats, report, solar_system_table,
+                              stream_schema=stream or output_format == 'parquet')
+        if stats.sketches is not None:
+            with report.stage('statistics'):
+                stats.sketches.save(sketch_path)
+        
+        print(f"Successfully converted {stats.total_records} records to '{output_csv}'")
+        stats.print_report(ship_data, type_data, solar_system_data, errors)
+    except BaseException:
+        report.status = 'failed'
+        raise
+    finally:
+        set_verbose(previous_verbose)
+        if report_path:
+            report.write(report_path)
+            log(f"Run report written to '{report_path}'")
+    return report.finish()
+
+def ingest_live_pandas(feed_url: str, output_csv: str = 'killmails-live.csv',
+                       shiplist_csv: Optional[str] = None,
+                       typeid_csv: Optional[str] = None,
+                       map_solar_systems_csv: Optional[str] = None,
+                       queue_id: Optional[str] = None,
+                       flush_rows: int = 500,
+                       flush_seconds: float = 60.0,
+                       queue_size: int = 1000,
+                       pollers: int = 1,
+                       sqlite_path: Optional[str] = None,
+                       spatial_enrichment: bool = False,
+                       use_lookup_cache: bool = True,
+                       lookup_cache_path: Optional[str] = None,
+                       max_killmails: Optional[int] = None,
+                       duration: Optional[float] = None,
+                       verbose: bool = True,
+                       report_path: Optional[str] = None) -> dict:
+    """
+    Long-running ingestion from a RedisQ-style feed (see killmail_live) instead of a downloaded day.
     
-    print(f"Successfully converted {len(df)} records to '{output_csv}'")
+    Each killmail is flattened as it arrives; every flush_rows rows or flush_seconds seconds the
+    micro-batch is enriched and appended to output_csv with the STREAM_DTYPES schema (the same
+    rows a stream=True conversion writes), and with sqlite_path upserted into that store.
+    An existing output_csv is only appended to if its header has exactly those columns.
+    At most queue_size received killmails wait for a flush before polling pauses.
     
-    # Statistics
-    print("\n=== STATISTICS ===")
-    print(f"Total records: {len(df)}")
-    print(f"Memory usage: {df.memory_usage(deep=True).sum() / 1024 / 1024:.2f} MB")
-    
-    # Lookup statistics
-    if ship_data:
-        victim_ships_matched = df['victim_ship_name'].notna().sum()
-        attacker_ships_matched = df['attacker_ship_name'].notna().sum()
-        print(f"Ship name matches: {victim_ships_matched} victims, {attacker_ships_matched} attackers")
-    
-    if type_data:
-        weapons_matched = df['attacker_weapon_type_name'].notna().sum()
-        total_weapons = df['attacker_weapon_type_id'].notna().sum()
-        print(f"Weapon type matches: {weapons_matched}/{total_weapons}")
-    
-    if solar_system_data:
-        systems_matched = df['solar_system_name'].notna().sum()
-        total_systems = df['solar_system_id'].notna().sum()
-        print(f"Solar system matches: {systems_matched}/{total_systems}")
-    
-    if errors:
-        print(f"\nErrors encountered: {len(errors)}")
-        for error in errors[:10]:  # Show first 10 errors
-            print(f"  - {error}")
-        if len(errors) > 10:
-            print(f"  ... and {len(errors) - 10} more errors")
+    Runs until interrupted (Ctrl+C), or until max_killmails killmails or duration seconds for
+    scheduled and test runs; the rows received so far are always flushed. Returns the RunReport
+    dict, whose 'feed' stage counts requests, retries, duplicates and flushes.
+    """
+    report = RunReport('pandas_live', {
+        'feed_url': feed_url, 'output': str(output_csv), 'queue_id': queue_id,
+        'flush_rows': flush_rows, 'flush_seconds': flush_seconds, 'queue_size': queue_size,
+        'pollers': pollers, 'sqlite_path': None if sqlite_path is None else str(sqlite_path),
+        'spatial_enrichment': spatial_enrichment,
+    })
+    previous_verbose = set_verbose(verbose)
+    try:
+        with report.stage('lookup_load'):
+            ship_data, type_data, solar_system_data = load_lookup_data(
+                shiplist_csv, typeid_csv, map_solar_systems_csv,
+                cache_path=lookup_cache_path, use_cache=use_lookup_cache)
+            solar_system_table = None
+            if spatial_enrichment:
+                if map_solar_systems_csv:
+                    solar_system_table = SolarSystemTable.from_csv(map_solar_systems_csv)
+                else:
+                    print("Warning: spatial_enrichment needs map_solar_systems_csv, skipping it")
+        reference_tables = build_reference_tables(ship_data, type_data, solar_system_data)
+        
+        append = os.path.exists(output_csv) and os.path.getsize(output_csv) > 0
+        if append:
+            # The columns of the rows to append, from an empty chunk put through the same steps
+            columns = pd.DataFrame([], columns=KILLMAIL_COLUMNS)
+            enrich_killmails(columns, reference_tables)
+            if solar_system_table is not None:
+                enrich_spatial(columns, solar_system_table)
+            with open(output_csv, 'r', encoding='utf-8', newline='') as f:
+                header = next(csv.reader(f), [])
+            if header != list(columns.columns):
+                print(f"Error: '{output_csv}' has other columns than the rows to append "
+                      f"(written with other settings, e.g. spatial_enrichment?); use another output_csv.")
+                report.status = 'failed'
+                return report.finish()
+        
+        errors = []
+        stats = ConversionStats()
+        writer = CsvChunkWriter(output_csv, append=append)
+        store = KillmailStore(sqlite_path) if sqlite_path else None
+        
+        def process(source_name: str, killmail: dict) -> dict:
+            row = flatten_killmail(killmail)
+            row['source_file'] = source_name
+            return row
+        
+        def flush(rows: List[dict]) -> None:
+            write_chunks([BatchResult(rows, [], None)], writer, errors, stats, reference_tables,
+                         report=report, solar_system_table=solar_system_table, store=store)
+            if store is not None:
+                # Dashboards query the store while it fills, so index it from the first batch on
+                store.create_indexes(analyze=False)
+        
+        ingestor = LiveIngestor(feed_url, process, flush, queue_id=queue_id, pollers=pollers,
+                                queue_size=queue_size, flush_rows=flush_rows,
+                                flush_seconds=flush_seconds, max_killmails=max_killmails,
+                                duration=duration)
+        log(f"Ingesting killmails from {feed_url} into '{output_csv}' "
+            f"(flush every {flush_rows} rows or {flush_seconds:g} s)...")
+        try:
+            asyncio.run(ingestor.run())
+        except KeyboardInterrupt:
+            print("Interrupted; the killmails received so far have been written.")
+        finally:
+            report.count('feed', **ingestor.stats)
+            if store is not None:
+                store.close()
+        
+        print(f"Ingested {stats.total_records} killmails into '{output_csv}'")
+        if stats.total_records:
+            stats.print_report(ship_data, type_data, solar_system_data, errors)
+        else:
+            report.status = 'no_data'
+    except BaseException:
+        report.status = 'failed'
+        raise
+    finally:
+        set_verbose(previous_verbose)
+        if report_path:
+            report.write(report_path)
+            log(f"Run report written to '{report_path}'")
+    return report.finish()
 
 # Example usage
 if __name__ == "__main__":
-    # Configuration
+    # Configuration - INPUT_FOLDER can also point at the downloaded killmails-YYYY-MM-DD.tar.bz2
     INPUT_FOLDER = r"C:\Users\kyleh\Downloads\killmails-2025-07-06\killmails"
     OUTPUT_CSV = r"C:\Users\kyleh\OneDrive\Desktop\Professional Projects\Dashboards\Datasets\Eve-Online Killmails\killmails-07-06-25-PANDAS.csv"
     SHIPLIST_CSV = r"C:\Users\kyleh\OneDrive\Desktop\Professional Projects\Dashboards\Datasets\Eve-Online Killmails\shiplist.csv"
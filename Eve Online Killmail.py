@@ -1,8 +1,12 @@
 import json
 import csv
+import itertools
 import os
 from pathlib import Path
 
+from killmail_decoding import DECODE_ERRORS, get_decoder
+from killmail_instrumentation import RunReport, log, set_verbose
+
 def load_ship_data(shiplist_csv_path):
     """
     Load ship data from the CSV file into a dictionary for quick lookups.
@@ -41,7 +45,7 @@ def load_solar_system_data(map_solar_systems_csv_path):
             header = next(reader, None)  # Read the header row
             
             if header:
-                print(f"Solar Systems CSV header: {header}")
+                log(f"Solar Systems CSV header: {header}")
                 # Try to find the correct column indices
                 system_id_col = None
                 system_name_col = None
@@ -59,12 +63,12 @@ def load_solar_system_data(map_solar_systems_csv_path):
                     system_id_col = 2
                     system_name_col = 3
                 
-                print(f"Using column {system_id_col} for solar system ID and column {system_name_col} for solar system name")
+                log(f"Using column {system_id_col} for solar system ID and column {system_name_col} for solar system name")
             else:
                 # No header, assume positions based on your sample
                 system_id_col = 2
                 system_name_col = 3
-                print("No header found, using positions 2 and 3 for ID and name")
+                log("No header found, using positions 2 and 3 for ID and name")
             
             for row_num, row in enumerate(reader, 2):  # Start at 2 since we already read header
                 if len(row) > max(system_id_col, system_name_col):
@@ -78,13 +82,13 @@ def load_solar_system_data(map_solar_systems_csv_path):
                 elif len(row) > 0:  # Skip empty rows but warn about insufficient columns
                     print(f"Warning: Row {row_num} has insufficient columns: {row}")
         
-        print(f"Successfully loaded {len(solar_system_data)} solar system mappings")
+        log(f"Successfully loaded {len(solar_system_data)} solar system mappings")
         
         # Show a few examples of what was loaded
         if solar_system_data:
-            print("Sample solar system mappings:")
+            log("Sample solar system mappings:")
             for i, (system_id, system_name) in enumerate(list(solar_system_data.items())[:5]):
-                print(f"  {system_id}: {system_name}")
+                log(f"  {system_id}: {system_name}")
                 
     except Exception as e:
         print(f"Warning: Could not load solar system data from {map_solar_systems_csv_path}: {e}")
@@ -106,7 +110,7 @@ def load_type_data(typeid_csv_path):
             header = next(reader, None)  # Read the header row
             
             if header:
-                print(f"CSV header: {header}")
+                log(f"CSV header: {header}")
                 # Try to find the correct column indices
                 type_id_col = None
                 type_name_col = None
@@ -123,12 +127,12 @@ def load_type_data(typeid_csv_path):
                     type_id_col = 0
                     type_name_col = 1
                 
-                print(f"Using column {type_id_col} for type ID and column {type_name_col} for type name")
+                log(f"Using column {type_id_col} for type ID and column {type_name_col} for type name")
             else:
                 # No header, assume first two columns
                 type_id_col = 0
                 type_name_col = 1
-                print("No header found, using first two columns")
+                log("No header found, using first two columns")
             
             for row_num, row in enumerate(reader, 2):  # Start at 2 since we already read header
                 if len(row) > max(type_id_col, type_name_col):
@@ -142,13 +146,13 @@ def load_type_data(typeid_csv_path):
                 elif len(row) > 0:  # Skip empty rows but warn about insufficient columns
                     print(f"Warning: Row {row_num} has insufficient columns: {row}")
         
-        print(f"Successfully loaded {len(type_data)} type mappings")
+        log(f"Successfully loaded {len(type_data)} type mappings")
         
         # Show a few examples of what was loaded
         if type_data:
-            print("Sample type mappings:")
+            log("Sample type mappings:")
             for i, (type_id, type_name) in enumerate(list(type_data.items())[:5]):
-                print(f"  {type_id}: {type_name}")
+                log(f"  {type_id}: {type_name}")
                 
     except Exception as e:
         print(f"Warning: Could not load type data from {typeid_csv_path}: {e}")
@@ -249,7 +253,114 @@ def flatten_killmail(data, ship_data=None, type_data=None, solar_system_data=Non
     
     return flattened
 
-def convert_json_folder_to_csv(input_folder, output_csv='killmails.csv', shiplist_csv=None, typeid_csv=None, map_solar_systems_csv=None):
+# Column order used when streaming rows straight to the CSV: the sorted set of every
+# field flatten_killmail can produce, so it is known before the first row is written
+STREAM_COLUMNS = sorted([
+    'killmail_id', 'killmail_time', 'solar_system_id', 'killmail_hash', 'http_last_modified',
+    'solar_system_name', 'victim_alliance_id', 'victim_character_id', 'victim_corporation_id',
+    'victim_damage_taken', 'victim_ship_type_id', 'victim_ship_name', 'victim_ship_type',
+    'victim_position_x', 'victim_position_y', 'victim_position_z', 'attacker_alliance_id',
+    'attacker_character_id', 'attacker_corporation_id', 'attacker_damage_done',
+    'attacker_final_blow', 'attacker_security_status', 'attacker_ship_type_id',
+    'attacker_weapon_type_id', 'attacker_ship_name', 'attacker_ship_type',
+    'attacker_weapon_type_name', 'total_attackers', 'total_items', 'items_destroyed',
+    'items_dropped', 'source_file',
+])
+
+class MatchStatistics:
+    """
+    Running counters for the weapon type and solar system matching report.
+    Rows are added one at a time, so the report never needs the full data set in memory.
+    """
+    
+    def __init__(self, sample_size=5):
+        self.sample_size = sample_size
+        self.records = 0
+        self.weapon_ids_found = 0
+        self.weapon_names_found = 0
+        self.weapon_samples = []
+        self.system_ids_found = 0
+        self.system_names_found = 0
+        self.system_samples = []
+    
+    def add(self, row):
+        self.records += 1
+        
+        if row.get('attacker_weapon_type_id') is not None:
+            self.weapon_ids_found += 1
+        if row.get('attacker_weapon_type_name') is not None:
+            self.weapon_names_found += 1
+            if len(self.weapon_samples) < self.sample_size:
+                self.weapon_samples.append((row.get('attacker_weapon_type_id'), row.get('attacker_weapon_type_name')))
+        
+        if row.get('solar_system_id') is not None:
+            self.system_ids_found += 1
+        if row.get('solar_system_name') is not None:
+            self.system_names_found += 1
+            if len(self.system_samples) < self.sample_size:
+                self.system_samples.append((row.get('solar_system_id'), row.get('solar_system_name')))
+    
+    def print_report(self, type_data=None, solar_system_data=None):
+        # Show some statistics about weapon type matching
+        if type_data:
+            log(f"Weapon type matching: {self.weapon_names_found} out of {self.weapon_ids_found} weapon IDs matched to names")
+            
+            # Show some examples
+            if self.weapon_samples:
+                log("Sample weapon matches:")
+                for weapon_id, weapon_name in self.weapon_samples:
+                    log(f"  ID {weapon_id}: {weapon_name}")
+        
+        # Show some statistics about solar system matching
+        if solar_system_data:
+            log(f"Solar system matching: {self.system_names_found} out of {self.system_ids_found} solar system IDs matched to names")
+            
+            # Show some examples
+            if self.system_samples:
+                log("Sample solar system matches:")
+                for system_id, system_name in self.system_samples:
+                    log(f"  ID {system_id}: {system_name}")
+
+def iter_json_files(input_path):
+    """
+    Yield the JSON files in a folder one at a time.
+    """
+    yield from input_path.glob('*.json')
+
+def iter_parsed_killmails(json_files, errors, decode=json.loads):
+    """
+    Parse each JSON file and yield (file name, killmail) pairs.
+    decode turns the raw file bytes into a killmail (see killmail_decoding.get_decoder).
+    Files that cannot be read or decoded are recorded in errors and skipped.
+    """
+    for json_file in json_files:
+        try:
+            with open(json_file, 'rb') as f:
+                data = decode(f.read())
+        except DECODE_ERRORS as e:
+            errors.append(f"JSON decode error in {json_file.name}: {e}")
+            continue
+        except Exception as e:
+            errors.append(f"Error processing {json_file.name}: {e}")
+            continue
+        
+        yield json_file.name, data
+
+def iter_flattened_killmails(parsed_killmails, errors, ship_data=None, type_data=None, solar_system_data=None):
+    """
+    Flatten each parsed killmail into a CSV row, adding the source filename.
+    """
+    for file_name, data in parsed_killmails:
+        try:
+            flattened = flatten_killmail(data, ship_data, type_data, solar_system_data)
+        except Exception as e:
+            errors.append(f"Error processing {file_name}: {e}")
+            continue
+        
+        flattened['source_file'] = file_name  # Add source filename
+        yield flattened
+
+def convert_json_folder_to_csv(input_folder, output_csv='killmails.csv', shiplist_csv=None, typeid_csv=None, map_solar_systems_csv=None, stream=False, json_backend='auto', verbose=True, report_path=None):
     """
     Convert all JSON files in a folder to a single CSV file.
     
@@ -259,66 +370,102 @@ def convert_json_folder_to_csv(input_folder, output_csv='killmails.csv', shiplis
         shiplist_csv (str): Path to shiplist.csv file for ship name lookups
         typeid_csv (str): Path to typeid.csv file for type name lookups
         map_solar_systems_csv (str): Path to mapSolarSystems.csv file for solar system name lookups
+        stream (bool): Write each row as soon as it is flattened instead of collecting all rows
+            first. Memory use stays flat regardless of the number of files; the columns are
+            the fixed STREAM_COLUMNS list.
+        json_backend (str): JSON decoder to use: 'msgspec' (typed, skips unused fields),
+            'stdlib', or 'auto' to use msgspec when it is installed.
+        verbose (bool): Print progress and debug output. Warnings, errors and the final
+            summary are printed either way.
+        report_path (str): Write the run report (see killmail_instrumentation.RunReport:
+            time, counts and peak RSS per stage, killmails per second) to this JSON file.
+    
+    Returns:
+        dict: The run report.
+    """
+    report = RunReport('original', {'input_folder': str(input_folder), 'output': str(output_csv),
+                                    'stream': stream, 'json_backend': json_backend})
+    previous_verbose = set_verbose(verbose)
+    try:
+        _convert_json_folder_to_csv(report, input_folder, output_csv, shiplist_csv, typeid_csv,
+                                    map_solar_systems_csv, stream, json_backend)
+    except BaseException:
+        report.status = 'failed'
+        raise
+    finally:
+        set_verbose(previous_verbose)
+        if report_path:
+            report.write(report_path)
+            log(f"Run report written to '{report_path}'")
+    return report.finish()
+
+def _convert_json_folder_to_csv(report, input_folder, output_csv, shiplist_csv, typeid_csv, map_solar_systems_csv, stream, json_backend):
+    """
+    The conversion behind convert_json_folder_to_csv, recording into report.
     """
     input_path = Path(input_folder)
     
     if not input_path.exists():
         print(f"Error: Input folder '{input_folder}' does not exist.")
+        report.status = 'no_input'
         return
     
-    # Load ship data if provided
-    ship_data = None
-    if shiplist_csv:
-        ship_data = load_ship_data(shiplist_csv)
-        if ship_data:
-            print(f"Loaded {len(ship_data)} ships from {shiplist_csv}")
-    
-    # Load type data if provided
-    type_data = None
-    if typeid_csv:
-        type_data = load_type_data(typeid_csv)
-        if type_data:
-            print(f"Loaded {len(type_data)} types from {typeid_csv}")
-        else:
-            print("No type data loaded - weapon type names will be empty")
+    with report.stage('lookup_load'):
+        # Load ship data if provided
+        ship_data = None
+        if shiplist_csv:
+            ship_data = load_ship_data(shiplist_csv)
+            if ship_data:
+                log(f"Loaded {len(ship_data)} ships from {shiplist_csv}")
+        
+        # Load type data if provided
+        type_data = None
+        if typeid_csv:
+            type_data = load_type_data(typeid_csv)
+            if type_data:
+                log(f"Loaded {len(type_data)} types from {typeid_csv}")
+            else:
+                print("No type data loaded - weapon type names will be empty")
+        
+        # Load solar system data if provided
+        solar_system_data = None
+        if map_solar_systems_csv:
+            solar_system_data = load_solar_system_data(map_solar_systems_csv)
+            if solar_system_data:
+                log(f"Loaded {len(solar_system_data)} solar systems from {map_solar_systems_csv}")
+            else:
+                print("No solar system data loaded - solar system names will be empty")
     
-    # Load solar system data if provided
-    solar_system_data = None
-    if map_solar_systems_csv:
-        solar_system_data = load_solar_system_data(map_solar_systems_csv)
-        if solar_system_data:
-            print(f"Loaded {len(solar_system_data)} solar systems from {map_solar_systems_csv}")
-        else:
-            print("No solar system data loaded - solar system names will be empty")
+    decode = get_decoder(json_backend)
+    
+    if stream:
+        _convert_json_folder_to_csv_streaming(input_path, output_csv, ship_data, type_data, solar_system_data, decode, report)
+        return
     
     # Find all JSON files
-    json_files = list(input_path.glob('*.json'))
+    with report.stage('discovery'):
+        json_files = list(iter_json_files(input_path))
+        report.count('discovery', files=len(json_files),
+                     bytes_read=sum(json_file.stat().st_size for json_file in json_files))
     
     if not json_files:
         print(f"No JSON files found in '{input_folder}'.")
+        report.status = 'no_data'
         return
     
-    print(f"Found {len(json_files)} JSON files to process...")
+    log(f"Found {len(json_files)} JSON files to process...")
     
-    all_data = []
     errors = []
     
     # Process each JSON file
-    for json_file in json_files:
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                flattened = flatten_killmail(data, ship_data, type_data, solar_system_data)
-                flattened['source_file'] = json_file.name  # Add source filename
-                all_data.append(flattened)
-                
-        except json.JSONDecodeError as e:
-            errors.append(f"JSON decode error in {json_file.name}: {e}")
-        except Exception as e:
-            errors.append(f"Error processing {json_file.name}: {e}")
+    with report.stage('parse_flatten'):
+        all_data = list(iter_flattened_killmails(iter_parsed_killmails(json_files, errors, decode), errors,
+                                                 ship_data, type_data, solar_system_data))
+    report.count('parse_flatten', rows=len(all_data), errors=len(errors))
     
     if not all_data:
         print("No valid data found to convert.")
+        report.status = 'no_data'
         return
     
     # Get all unique column names
@@ -331,40 +478,20 @@ def convert_json_folder_to_csv(input_folder, output_csv='killmails.csv', shiplis
     
     # Write to CSV
     try:
-        with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=columns)
-            writer.writeheader()
-            writer.writerows(all_data)
+        with report.stage('write'):
+            with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(all_data)
+        report.count('write', rows_written=len(all_data))
         
         print(f"Successfully converted {len(all_data)} records to '{output_csv}'")
         
-        # Show some statistics about weapon type matching
-        if type_data:
-            weapon_ids_found = sum(1 for row in all_data if row.get('attacker_weapon_type_id') is not None)
-            weapon_names_found = sum(1 for row in all_data if row.get('attacker_weapon_type_name') is not None)
-            print(f"Weapon type matching: {weapon_names_found} out of {weapon_ids_found} weapon IDs matched to names")
-            
-            # Show some examples
-            sample_matches = [(row.get('attacker_weapon_type_id'), row.get('attacker_weapon_type_name')) 
-                             for row in all_data if row.get('attacker_weapon_type_name') is not None][:5]
-            if sample_matches:
-                print("Sample weapon matches:")
-                for weapon_id, weapon_name in sample_matches:
-                    print(f"  ID {weapon_id}: {weapon_name}")
-        
-        # Show some statistics about solar system matching
-        if solar_system_data:
-            system_ids_found = sum(1 for row in all_data if row.get('solar_system_id') is not None)
-            system_names_found = sum(1 for row in all_data if row.get('solar_system_name') is not None)
-            print(f"Solar system matching: {system_names_found} out of {system_ids_found} solar system IDs matched to names")
-            
-            # Show some examples
-            sample_matches = [(row.get('solar_system_id'), row.get('solar_system_name')) 
-                             for row in all_data if row.get('solar_system_name') is not None][:5]
-            if sample_matches:
-                print("Sample solar system matches:")
-                for system_id, system_name in sample_matches:
-                    print(f"  ID {system_id}: {system_name}")
+        with report.stage('statistics'):
+            stats = MatchStatistics()
+            for row in all_data:
+                stats.add(row)
+        stats.print_report(type_data, solar_system_data)
         
         if errors:
             print(f"\nErrors encountered:")
@@ -373,6 +500,64 @@ def convert_json_folder_to_csv(input_folder, output_csv='killmails.csv', shiplis
                 
     except Exception as e:
         print(f"Error writing CSV file: {e}")
+        report.status = 'failed'
+
+# Rows parsed or written between two readings of the clocks in the streaming run report;
+# timing every row would cost about as much as writing it
+TIMED_BLOCK_ROWS = 1000
+
+def _convert_json_folder_to_csv_streaming(input_path, output_csv, ship_data, type_data, solar_system_data, decode=json.loads, report=None):
+    """
+    Streaming variant of convert_json_folder_to_csv: list files -> parse -> flatten -> write,
+    one killmail at a time, with the statistics kept as running counters.
+    Reading and flattening are timed as 'parse_flatten', writing as 'write', per block of
+    TIMED_BLOCK_ROWS rows.
+    """
+    report = report or RunReport('original')
+    errors = []
+    stats = MatchStatistics()
+    json_files = report.counted('discovery', iter_json_files(input_path), size=lambda json_file: json_file.stat().st_size)
+    rows = iter_flattened_killmails(iter_parsed_killmails(json_files, errors, decode), errors,
+                                    ship_data, type_data, solar_system_data)
+    
+    # Only create the output once there is a row to put in it
+    with report.stage('parse_flatten'):
+        first_row = next(rows, None)
+    if first_row is None:
+        print("No valid data found to convert.")
+        for error in errors:
+            print(f"  - {error}")
+        report.count('parse_flatten', errors=len(errors))
+        report.status = 'no_data'
+        return
+    
+    try:
+        with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=STREAM_COLUMNS)
+            writer.writeheader()
+            block = [first_row]
+            while block:
+                with report.stage('write'):
+                    for row in block:
+                        writer.writerow(row)
+                        stats.add(row)
+                with report.stage('parse_flatten'):
+                    block = list(itertools.islice(rows, TIMED_BLOCK_ROWS))
+    except Exception as e:
+        print(f"Error writing CSV file: {e}")
+        report.status = 'failed'
+        return
+    finally:
+        report.count('parse_flatten', rows=stats.records, errors=len(errors))
+    report.count('write', rows_written=stats.records)
+    
+    print(f"Successfully converted {stats.records} records to '{output_csv}'")
+    stats.print_report(type_data, solar_system_data)
+    
+    if errors:
+        print(f"\nErrors encountered:")
+        for error in errors:
+            print(f"  - {error}")
 
 # Example usage
 if __name__ == "__main__":
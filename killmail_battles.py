@@ -0,0 +1,257 @@
+"""
+Battle detection: group killmails into engagements by time and place.
+
+find_battles works on flattened killmail rows (killmail_time, solar_system_id and the victim
+and final-blow attacker alliance IDs) in three near-linear steps:
+
+1. Sort the kills by (solar system, time) and cut each system's timeline wherever two
+   consecutive kills are more than window_minutes apart. Each piece is a cluster.
+2. Merge every cluster with the clusters of the systems within merge_ly light years
+   (mapSolarSystems.csv coordinates) that overlap it in time, found with one binary search
+   per cluster and neighbour system over the sorted clusters, and join the merged groups with
+   a vectorized union-find. No pairs of kills or clusters are compared.
+3. Keep the merged groups with at least min_kills kills as battles, numbered by start time.
+
+    python killmail_battles.py killmails.csv --map mapSolarSystems.csv --output battles.csv
+"""
+import argparse
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from killmail_spatial import SolarSystemTable
+
+# Columns find_battles reads
+BATTLE_INPUT_COLUMNS = ['killmail_id', 'killmail_time', 'solar_system_id',
+                        'victim_alliance_id', 'attacker_alliance_id', 'total_attackers']
+
+class BattleResult(NamedTuple):
+    """
+    battle_ids: battle of each input row (<NA> for kills outside any battle), aligned to the input.
+    battles: one row per battle (time span, systems, kills, participants).
+    participants: one row per battle and alliance with its kills and losses.
+    """
+    battle_ids: pd.Series
+    battles: pd.DataFrame
+    participants: pd.DataFrame
+
+def _parse_times(times: pd.Series) -> np.ndarray:
+    # Seconds since the epoch, -1 for a missing or malformed killmail_time. Killmail times are
+    # UTC ('2025-06-01T12:00:00Z'); parsing them without the zone suffix takes the fast path
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times.astype('string').str.slice(0, 19), errors='coerce', format='ISO8601')
+    elif getattr(times.dt, 'tz', None) is not None:
+        times = times.dt.tz_convert(None)
+    seconds = times.to_numpy(dtype='datetime64[s]').astype(np.int64)
+    return np.where(times.isna().to_numpy(), -1, seconds)
+
+def _neighbour_edges(system_ids: np.ndarray, table: SolarSystemTable, merge_ly: float):
+    # (from, to) index pairs into system_ids (sorted, unique) of the systems within merge_ly
+    # of each other, in both directions
+    sources, targets = [], []
+    for index, system_id in enumerate(system_ids.tolist()):
+        nearby = table.systems_within(system_id, merge_ly)
+        positions = np.searchsorted(system_ids, nearby).clip(max=len(system_ids) - 1)
+        positions = positions[(system_ids[positions] == nearby) & (positions != index)]
+        sources.append(np.full(len(positions), index, dtype=np.int64))
+        targets.append(positions.astype(np.int64))
+    if not sources:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(sources), np.concatenate(targets)
+
+def _connected_components(count: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Component label (the smallest member) of each of count nodes linked by the edges a[i]-b[i].
+    Union-find in numpy: hook the larger root of every edge under the smaller one, then
+    compress the paths by pointer jumping, until every edge joins nodes of one root.
+    """
+    parent = np.arange(count, dtype=np.int64)
+    while True:
+        root_a, root_b = parent[a], parent[b]
+        apart = root_a != root_b
+        if not apart.any():
+            return parent
+        low, high = np.minimum(root_a[apart], root_b[apart]), np.maximum(root_a[apart], root_b[apart])
+        np.minimum.at(parent, high, low)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+def cluster_killmails(times: np.ndarray, systems: np.ndarray, window_seconds: int,
+                      table: Optional[SolarSystemTable] = None, merge_ly: float = 0.0,
+                      chunk_size: int = 4_000_000) -> np.ndarray:
+    """
+    Group label of every kill (kills with an unknown time or system get -1).
+    Labels are arbitrary integers; kills with the same label belong together.
+    """
+    labels = np.full(len(times), -1, dtype=np.int64)
+    valid = np.flatnonzero((times >= 0) & (systems > 0))
+    if not len(valid):
+        return labels
+
+    # 1. Per-system sliding window over the kills sorted by (system, time)
+    order = valid[np.lexsort((times[valid], systems[valid]))]
+    sorted_times, sorted_systems = times[order], systems[order]
+    breaks = np.ones(len(order), dtype=bool)
+    breaks[1:] = (sorted_systems[1:] != sorted_systems[:-1]) | (np.diff(sorted_times) > window_seconds)
+    cluster_of_kill = np.cumsum(breaks) - 1
+    starts_at = np.flatnonzero(breaks)
+    cluster_start = sorted_times[starts_at]
+    cluster_end = np.maximum.reduceat(sorted_times, starts_at)
+    system_ids, cluster_system, clusters_per_system = np.unique(
+        sorted_systems[starts_at], return_inverse=True, return_counts=True)
+    first_cluster = np.concatenate(([0], np.cumsum(clusters_per_system)[:-1]))
+
+    # 2. Merge time-overlapping clusters of neighbouring systems. The clusters are sorted by
+    # (system, start), so one searchsorted over (system, start) keys finds, for every cluster
+    # and neighbour system, the neighbour's latest cluster that started no later. A system's
+    # clusters are more than the window apart, so that is the only one that can overlap
+    # (clusters starting later find this one from their side).
+    roots = np.arange(len(starts_at), dtype=np.int64)
+    if table is not None and merge_ly > 0:
+        span = int(cluster_end.max() - cluster_start.min()) + 1
+        offsets = cluster_start - cluster_start.min()
+        keys = cluster_system * span + offsets
+        sources, targets = _neighbour_edges(system_ids, table, merge_ly)
+        queries_per_edge = clusters_per_system[sources]
+        queries_before = np.concatenate(([0], np.cumsum(queries_per_edge)))
+
+        linked_a, linked_b = [], []
+        edge = 0
+        while edge < len(sources):
+            # Expand as many edges into (cluster, neighbour system) queries as fit in chunk_size
+            last = int(np.searchsorted(queries_before, queries_before[edge] + chunk_size, 'right')) - 1
+            last = min(max(last, edge + 1), len(sources))
+            edge_queries = queries_per_edge[edge:last]
+            query_edge = np.repeat(np.arange(edge, last), edge_queries)
+            within = np.arange(len(query_edge)) - (queries_before[query_edge] - queries_before[edge])
+            query_cluster = first_cluster[sources[query_edge]] + within
+            target = targets[query_edge]
+
+            candidate = np.searchsorted(keys, target * span + offsets[query_cluster], 'right') - 1
+            candidate_ok = candidate >= 0
+            candidate = candidate.clip(min=0)
+            overlapping = candidate_ok & (cluster_system[candidate] == target) & \
+                (cluster_end[candidate] + window_seconds >= cluster_start[query_cluster])
+            linked_a.append(query_cluster[overlapping])
+            linked_b.append(candidate[overlapping])
+            edge = last
+        if linked_a:
+            roots = _connected_components(len(starts_at), np.concatenate(linked_a), np.concatenate(linked_b))
+
+    labels[order] = roots[cluster_of_kill]
+    return labels
+
+def find_battles(df: pd.DataFrame, table: Optional[SolarSystemTable] = None,
+                 window_minutes: float = 15, merge_ly: float = 2.0,
+                 min_kills: int = 5) -> BattleResult:
+    """
+    Cluster killmail rows into battles. Without a SolarSystemTable, battles never span
+    more than one system. New Eden is dense: the default 2 ly reaches about ten systems,
+    5 ly already about sixty, which chains separate fights of a busy region together.
+    """
+    times = _parse_times(df['killmail_time'])
+    systems = pd.to_numeric(df['solar_system_id'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    labels = cluster_killmails(times, systems, int(window_minutes * 60), table, merge_ly)
+
+    # Keep groups with enough kills and number them by start time
+    groups, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    keep = (groups >= 0) & (counts >= min_kills)
+    first_seen = np.full(len(groups), np.iinfo(np.int64).max)
+    np.minimum.at(first_seen, inverse, times)
+    kept = np.flatnonzero(keep)
+    numbering = np.full(len(groups), -1, dtype=np.int64)
+    numbering[kept[np.lexsort((kept, first_seen[kept]))]] = np.arange(1, len(kept) + 1)
+    battle_numbers = numbering[inverse]
+    battle_ids = pd.Series(pd.arrays.IntegerArray(battle_numbers, battle_numbers < 0),
+                           index=df.index, name='battle_id')
+
+    in_battle = battle_numbers > 0
+    kills = pd.DataFrame({
+        'battle_id': battle_numbers[in_battle],
+        'time': times[in_battle],
+        'solar_system_id': systems[in_battle],
+        'victim_alliance_id': pd.to_numeric(df['victim_alliance_id'], errors='coerce').to_numpy()[in_battle],
+        'attacker_alliance_id': pd.to_numeric(df['attacker_alliance_id'], errors='coerce').to_numpy()[in_battle],
+    })
+    if 'total_attackers' in df.columns:
+        kills['total_attackers'] = pd.to_numeric(df['total_attackers'], errors='coerce').to_numpy()[in_battle]
+    return BattleResult(battle_ids, _battle_table(kills, table), _participant_table(kills))
+
+def _battle_table(kills: pd.DataFrame, table: Optional[SolarSystemTable]) -> pd.DataFrame:
+    grouped = kills.groupby('battle_id', sort=True)
+    battles = grouped.agg(start_time=('time', 'min'), end_time=('time', 'max'),
+                          kills=('time', 'size'), systems=('solar_system_id', 'nunique'))
+    if 'total_attackers' in kills.columns:
+        battles['max_attackers'] = grouped['total_attackers'].max()
+
+    # Main system: the one with the most kills (lowest ID on ties)
+    per_system = kills.groupby(['battle_id', 'solar_system_id']).size().reset_index(name='n')
+    per_system = per_system.sort_values(['battle_id', 'n', 'solar_system_id'], ascending=[True, False, True])
+    battles['main_solar_system_id'] = per_system.drop_duplicates('battle_id').set_index('battle_id')['solar_system_id']
+    if table is not None:
+        positions = table.positions(battles['main_solar_system_id'])
+        battles['main_solar_system_name'] = np.where(positions >= 0, table.names[positions.clip(min=0)], None)
+    # Space-separated system IDs, joined per battle over the (battle, system) pairs in ID order
+    per_system = per_system.sort_values(['battle_id', 'solar_system_id'])
+    names = per_system['solar_system_id'].astype(str).tolist()
+    bounds = np.flatnonzero(np.diff(per_system['battle_id'].to_numpy(), prepend=-1, append=-1)).tolist()
+    battles['solar_system_ids'] = [' '.join(names[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    alliances = pd.concat([kills[['battle_id', 'victim_alliance_id']].set_axis(['battle_id', 'alliance_id'], axis=1),
+                           kills[['battle_id', 'attacker_alliance_id']].set_axis(['battle_id', 'alliance_id'], axis=1)])
+    battles['alliances'] = alliances.dropna().groupby('battle_id')['alliance_id'].nunique()
+    battles['alliances'] = battles['alliances'].fillna(0).astype('int64')
+
+    battles['duration_minutes'] = (battles['end_time'] - battles['start_time']) / 60
+    battles['start_time'] = pd.to_datetime(battles['start_time'], unit='s', utc=True)
+    battles['end_time'] = pd.to_datetime(battles['end_time'], unit='s', utc=True)
+    return battles.reset_index()
+
+def _participant_table(kills: pd.DataFrame) -> pd.DataFrame:
+    """
+    Kills (final blows) and losses per battle and alliance, largest participants first.
+    Pilots without an alliance are counted under alliance_id <NA>.
+    """
+    final_blows = kills.groupby(['battle_id', 'attacker_alliance_id'], dropna=False).size()
+    losses = kills.groupby(['battle_id', 'victim_alliance_id'], dropna=False).size()
+    final_blows.index.names = losses.index.names = ['battle_id', 'alliance_id']
+    participants = pd.concat([final_blows.rename('kills'), losses.rename('losses')], axis=1)
+    participants = participants.fillna(0).astype('int64').reset_index()
+    participants['alliance_id'] = participants['alliance_id'].astype('Int64')
+    participants = participants.sort_values(['battle_id', 'losses', 'kills'], ascending=[True, False, False])
+    return participants.reset_index(drop=True)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Find battles in converted killmails.")
+    parser.add_argument('killmails', help="Killmail CSV file or Parquet dataset written by a converter")
+    parser.add_argument('--map', help="mapSolarSystems.csv, to merge fights across nearby systems")
+    parser.add_argument('--window-minutes', type=float, default=15)
+    parser.add_argument('--merge-ly', type=float, default=2.0)
+    parser.add_argument('--min-kills', type=int, default=5)
+    parser.add_argument('--output', default='battles.csv',
+                        help="Battle table CSV; participants go to <name>_participants.csv")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    if args.killmails.endswith('.csv'):
+        header = pd.read_csv(args.killmails, nrows=0).columns
+        df = pd.read_csv(args.killmails, usecols=[col for col in BATTLE_INPUT_COLUMNS if col in header])
+    else:
+        df = pd.read_parquet(args.killmails, columns=BATTLE_INPUT_COLUMNS)
+    table = SolarSystemTable.from_csv(args.map) if args.map else None
+    result = find_battles(df, table, args.window_minutes, args.merge_ly, args.min_kills)
+
+    result.battles.to_csv(args.output, index=False, encoding='utf-8')
+    participants_path = args.output[:-4] + '_participants.csv' if args.output.endswith('.csv') \
+        else args.output + '_participants.csv'
+    result.participants.to_csv(participants_path, index=False, encoding='utf-8')
+    print(f"Found {len(result.battles)} battles in {len(df)} killmails "
+          f"({time.perf_counter() - start_time:.2f} s); wrote '{args.output}' and '{participants_path}'")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+"""
+Benchmark suite for the two killmail converters.
+
+Generates deterministic synthetic killmail days (real ship, type and solar system IDs from
+shiplist.csv, typeid.csv and mapSolarSystems.csv, with realistic attacker and item counts),
+then times every stage of "Eve Online Killmail.py" and "Eve Online Killmail - Pandas Update.py":
+lookup load, file discovery, parse, flatten, DataFrame build, enrichment, dtype optimization and
+write, plus an end-to-end run of each converter. Each script and day size runs in its own
+process so peak memory is measured separately. Results are appended to a JSON-lines file, and
+every run is compared against the previous one to spot regressions.
+
+Usage:
+    python killmail_benchmark.py --sizes 10000 100000
+    python killmail_benchmark.py --sizes 1000000 --scripts pandas --workers 8
+"""
+import argparse
+import contextlib
+import csv
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from killmail_instrumentation import peak_rss_mb
+
+REPO_DIR = Path(__file__).resolve().parent
+SCRIPTS = {
+    'original': 'Eve Online Killmail.py',
+    'pandas': 'Eve Online Killmail - Pandas Update.py',
+}
+DEFAULT_RESULTS = REPO_DIR / 'benchmark_results.jsonl'
+
+def load_script(script_key: str):
+    """
+    Import one of the converter scripts (their file names contain spaces) as a module.
+    The module is registered in sys.modules so process pool workers can find its functions.
+    """
+    if str(REPO_DIR) not in sys.path:
+        sys.path.insert(0, str(REPO_DIR))
+    module_name = f"killmail_converter_{script_key}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, REPO_DIR / SCRIPTS[script_key])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# --- Synthetic data -----------------------------------------------------------------------
+
+def _read_id_column(csv_path: Path, column: int, has_header: bool) -> List[int]:
+    ids = []
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        if has_header:
+            next(reader, None)
+        for row in reader:
+            try:
+                ids.append(int(row[column]))
+            except (ValueError, IndexError):
+                continue
+    return ids
+
+def _attacker_count(rng: random.Random) -> int:
+    # Mostly solo and small-gang kills, with a long tail of fleet fights
+    roll = rng.random()
+    if roll < 0.45:
+        return 1
+    if roll < 0.80:
+        return rng.randint(2, 10)
+    if roll < 0.97:
+        return rng.randint(11, 60)
+    return rng.randint(61, 500)
+
+def _item_count(rng: random.Random) -> int:
+    # Pods drop nothing, most fits have a few dozen modules, haulers carry big cargo holds
+    roll = rng.random()
+    if roll < 0.15:
+        return 0
+    if roll < 0.90:
+        return rng.randint(5, 40)
+    return rng.randint(41, 300)
+
+def _entity(rng: random.Random, record: dict, alliance_chance: float = 0.6) -> None:
+    record['character_id'] = rng.randint(90000000, 2120000000)
+    record['corporation_id'] = rng.randint(98000000, 98800000)
+    if rng.random() < alliance_chance:
+        record['alliance_id'] = rng.randint(99000000, 99014000)
+
+def make_killmail(rng: random.Random, killmail_id: int, day: str, ship_ids: List[int],
+                  type_ids: List[int], system_ids: List[int]) -> dict:
+    """
+    Build one synthetic killmail in the ESI killmail format.
+    """
+    attackers = []
+    attacker_count = _attacker_count(rng)
+    final_blow = rng.randrange(attacker_count)
+    for index in range(attacker_count):
+        attacker = {
+            'damage_done': rng.randint(0, 20000),
+            'final_blow': index == final_blow,
+            'security_status': round(rng.uniform(-10.0, 5.0), 1),
+            'ship_type_id': rng.choice(ship_ids),
+            'weapon_type_id': rng.choice(type_ids),
+        }
+        if rng.random() < 0.9:  # the rest are NPCs
+            _entity(rng, attacker)
+        attackers.append(attacker)
+
+    items = []
+    for _ in range(_item_count(rng)):
+        item = {'flag': rng.randint(5, 180), 'item_type_id': rng.choice(type_ids), 'singleton': 0}
+        quantity = 'quantity_destroyed' if rng.random() < 0.6 else 'quantity_dropped'
+        item[quantity] = rng.randint(1, 500)
+        if rng.random() < 0.03:  # containers with contents
+            item['items'] = [{'flag': 5, 'item_type_id': rng.choice(type_ids), 'singleton': 0,
+                              'quantity_dropped': rng.randint(1, 1000)}]
+        items.append(item)
+
+    victim = {
+        'damage_taken': rng.randint(100, 500000),
+        'ship_type_id': rng.choice(ship_ids),
+        'items': items,
+        'position': {'x': rng.uniform(-1e12, 1e12), 'y': rng.uniform(-1e12, 1e12), 'z': rng.uniform(-1e12, 1e12)},
+    }
+    _entity(rng, victim, alliance_chance=0.5)
+
+    seconds = rng.randrange(86400)
+    return {
+        'attackers': attackers,
+        'killmail_id': killmail_id,
+        'killmail_time': f"{day}T{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}Z",
+        'solar_system_id': rng.choice(system_ids),
+        'victim': victim,
+        'killmail_hash': f"{rng.getrandbits(160):040x}",
+    }
+
+def generate_day(output_dir: Path, count: int, seed: int = 1, day: str = '2025-07-07',
+                 reference_dir: Path = REPO_DIR) -> Path:
+    """
+    Write count synthetic killmails as <killmail_id>.json files into output_dir/killmails.
+    The same count and seed always produce the same files. An existing complete day is reused.
+    Returns the killmails folder.
+    """
+    killmails_dir = Path(output_dir) / 'killmails'
+    marker = Path(output_dir) / 'complete.json'
+    settings = {'count': count, 'seed': seed, 'day': day}
+    if marker.exists() and json.loads(marker.read_text()) == settings:
+        return killmails_dir
+
+    ship_ids = _read_id_column(reference_dir / 'shiplist.csv', 0, has_header=False)
+    type_ids = _read_id_column(reference_dir / 'typeid.csv', 0, has_header=True)
+    system_ids = _read_id_column(reference_dir / 'mapSolarSystems.csv', 2, has_header=True)
+
+    if killmails_dir.exists():
+        shutil.rmtree(killmails_dir)
+    killmails_dir.mkdir(parents=True)
+
+    rng = random.Random(seed)
+    first_id = 128000000
+    for killmail_id in range(first_id, first_id + count):
+        killmail = make_killmail(rng, killmail_id, day, ship_ids, type_ids, system_ids)
+        (killmails_dir / f"{killmail_id}.json").write_text(json.dumps(killmail), encoding='utf-8')
+
+    marker.write_text(json.dumps(settings))
+    return killmails_dir
+
+# --- Stage timing -------------------------------------------------------------------------
+
+class StageTimer:
+    """
+    Collects wall time and peak RSS per stage. Stages timed with add() can be accumulated
+    over many small steps (e.g. parse and flatten of each file).
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        stage = self.stages.setdefault(name, {'seconds': 0.0})
+        stage['seconds'] += seconds
+        stage['peak_rss_mb'] = peak_rss_mb()
+
+def _parse_and_flatten(module, json_files, timer: StageTimer, decode, *lookups) -> List[dict]:
+    """
+    Parse and flatten every file, timing the two steps separately.
+    lookups are passed on to flatten_killmail (the pandas script enriches afterwards instead).
+    """
+    rows = []
+    clock = time.perf_counter
+    parse_seconds = flatten_seconds = 0.0
+    for json_file in json_files:
+        start = clock()
+        with open(json_file, 'rb') as f:
+            data = decode(f.read())
+        parsed = clock()
+        row = module.flatten_killmail(data, *lookups)
+        row['source_file'] = json_file.name
+        rows.append(row)
+        flatten_seconds += clock() - parsed
+        parse_seconds += parsed - start
+    timer.add('parse', parse_seconds)
+    timer.add('flatten', flatten_seconds)
+    return rows
+
+def benchmark_original(killmails_dir: Path, output_dir: Path, json_backend: str) -> StageTimer:
+    module = load_script('original')
+    timer = StageTimer()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with timer.stage('lookup_load'):
+            ship_data = module.load_ship_data(str(REPO_DIR / 'shiplist.csv'))
+            type_data = module.load_type_data(str(REPO_DIR / 'typeid.csv'))
+            solar_system_data = module.load_solar_system_data(str(REPO_DIR / 'mapSolarSystems.csv'))
+
+        with timer.stage('discovery'):
+            json_files = list(module.iter_json_files(killmails_dir))
+
+        rows = _parse_and_flatten(module, json_files, timer, module.get_decoder(json_backend),
+                                  ship_data, type_data, solar_system_data)
+
+        with timer.stage('write'):
+            columns = sorted({column for row in rows for column in row})
+            with open(output_dir / 'original.csv', 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+        del rows
+
+        with timer.stage('end_to_end'):
+            module.convert_json_folder_to_csv(
+                str(killmails_dir), str(output_dir / 'original_end_to_end.csv'),
+                str(REPO_DIR / 'shiplist.csv'), str(REPO_DIR / 'typeid.csv'),
+                str(REPO_DIR / 'mapSolarSystems.csv'), json_backend=json_backend)
+
+    return timer
+
+def benchmark_pandas(killmails_dir: Path, output_dir: Path, json_backend: str,
+                     workers: Optional[int]) -> StageTimer:
+    module = load_script('pandas')
+    timer = StageTimer()
+
+    lookup_sources = [str(REPO_DIR / 'shiplist.csv'), str(REPO_DIR / 'typeid.csv'),
+                      str(REPO_DIR / 'mapSolarSystems.csv')]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with timer.stage('lookup_load'):
+            lookups = module.load_lookup_data(*lookup_sources, use_cache=False)
+
+        # The first call compiles the cache, the timed second call is a warm start
+        module.load_lookup_data(*lookup_sources, cache_path=str(output_dir / 'lookup_cache.pickle'))
+        with timer.stage('lookup_load_cached'):
+            module.load_lookup_data(*lookup_sources, cache_path=str(output_dir / 'lookup_cache.pickle'))
+
+        with timer.stage('discovery'):
+            json_files = list(module.iter_json_files(killmails_dir))
+
+        rows = _parse_and_flatten(module, json_files, timer, module.get_decoder(json_backend))
+
+        with timer.stage('dataframe_build'):
+            df = module.pd.DataFrame(rows)
+        del rows
+
+        with timer.stage('enrich'):
+            module.enrich_killmails(df, module.build_reference_tables(*lookups))
+
+        with timer.stage('dtype_optimize'):
+            module.optimize_dtypes(df)
+
+        with timer.stage('write'):
+            df.to_csv(output_dir / 'pandas.csv', index=False, encoding='utf-8')
+        del df
+
+        with timer.stage('end_to_end'):
+            module.convert_json_folder_to_csv_pandas(
+                str(killmails_dir), str(output_dir / 'pandas_end_to_end.csv'), *lookup_sources, workers=workers,
+                lookup_cache_path=str(output_dir / 'lookup_cache.pickle'), json_backend=json_backend)
+
+    return timer
+
+def run_child(script_key: str, killmails_dir: Path, result_path: Path, json_backend: str,
+              workers: Optional[int]) -> None:
+    """
+    Benchmark one script on one day in this (fresh) process and write the result as JSON.
+    """
+    with tempfile.TemporaryDirectory(prefix='killmail-bench-') as tmp:
+        if script_key == 'original':
+            timer = benchmark_original(killmails_dir, Path(tmp), json_backend)
+        else:
+            timer = benchmark_pandas(killmails_dir, Path(tmp), json_backend, workers)
+
+    result_path.write_text(json.dumps({'stages': timer.stages, 'peak_rss_mb': peak_rss_mb()}))
+
+# --- Driver -------------------------------------------------------------------------------
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def _load_previous(results_path: Path) -> Dict[tuple, dict]:
+    """
+    Latest previous result for each (script, size, json_backend).
+    """
+    previous = {}
+    if results_path.exists():
+        for line in results_path.read_text(encoding='utf-8').splitlines():
+            if line.strip():
+                record = json.loads(line)
+                previous[(record['script'], record['killmails'], record.get('json_backend'))] = record
+    return previous
+
+def print_result(record: dict, previous: Optional[dict]) -> None:
+    killmails = record['killmails']
+    print(f"\n{record['script']} - {killmails} killmails ({record['json_backend']} JSON)")
+    print(f"  {'stage':<20}{'seconds':>10}{'killmails/s':>14}{'peak MB':>10}{'vs last':>10}")
+    for name, stage in record['stages'].items():
+        seconds = stage['seconds']
+        rate = killmails / seconds if seconds > 0 else float('inf')
+        peak = stage.get('peak_rss_mb')
+        change = ''
+        if previous and name in previous['stages'] and previous['stages'][name]['seconds'] > 0:
+            change = f"{(seconds / previous['stages'][name]['seconds'] - 1) * 100:+.0f}%"
+        peak_text = f"{peak:.0f}" if peak is not None else '-'
+        print(f"  {name:<20}{seconds:>10.3f}{rate:>14,.0f}{peak_text:>10}{change:>10}")
+    if record['peak_rss_mb'] is not None:
+        print(f"  peak RSS: {record['peak_rss_mb']:.0f} MB")
+
+def run_benchmarks(sizes: List[int], scripts: List[str], data_dir: Path, results_path: Path,
+                   seed: int = 1, json_backend: str = 'auto', workers: Optional[int] = None) -> List[dict]:
+    """
+    Generate (or reuse) a synthetic day for each size, benchmark each script on it in a
+    separate process, print the report and append the results to results_path.
+    """
+    previous = _load_previous(results_path)
+    records = []
+
+    for size in sizes:
+        print(f"Preparing synthetic day with {size} killmails...")
+        killmails_dir = generate_day(data_dir / f"synthetic-{size}-seed{seed}", size, seed)
+
+        for script_key in scripts:
+            with tempfile.TemporaryDirectory(prefix='killmail-bench-') as tmp:
+                result_path = Path(tmp) / 'result.json'
+                command = [sys.executable, str(Path(__file__).resolve()), '--child', script_key,
+                           str(killmails_dir), str(result_path), '--json-backend', json_backend]
+                if workers is not None:
+                    command += ['--workers', str(workers)]
+                subprocess.run(command, check=True)
+                result = json.loads(result_path.read_text())
+
+            record = {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'script': script_key,
+                'killmails': size,
+                'seed': seed,
+                'json_backend': json_backend,
+                'workers': workers,
+                **result,
+            }
+            print_result(record, previous.get((script_key, size, json_backend)))
+            records.append(record)
+            with open(results_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+
+    return records
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000], help="killmails per synthetic day")
+    parser.add_argument('--scripts', choices=['both', 'original', 'pandas'], default='both')
+    parser.add_argument('--data-dir', type=Path, default=Path(tempfile.gettempdir()) / 'killmail-benchmark-data',
+                        help="where the synthetic days are generated (and reused)")
+    parser.add_argument('--results', type=Path, default=DEFAULT_RESULTS, help="JSON-lines results file")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json-backend', choices=['auto', 'msgspec', 'stdlib'], default='auto')
+    parser.add_argument('--workers', type=int, default=None, help="workers for the pandas end-to-end run")
+    parser.add_argument('--child', nargs=3, metavar=('SCRIPT', 'KILLMAILS_DIR', 'RESULT_JSON'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        script_key, killmails_dir, result_path = args.child
+        run_child(script_key, Path(killmails_dir), Path(result_path), args.json_backend, args.workers)
+        return
+
+    scripts = ['original', 'pandas'] if args.scripts == 'both' else [args.scripts]
+    run_benchmarks(args.sizes, scripts, args.data_dir, args.results, args.seed, args.json_backend, args.workers)
+
+if __name__ == "__main__":
+    main()
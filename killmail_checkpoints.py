@@ -0,0 +1,147 @@
+"""
+Crash-safe checkpoints of a conversion's batch results.
+
+A long conversion spends nearly all of its time parsing batches of JSON files, and without
+checkpoints a crash near the end throws all of that away. BatchCheckpoints saves the result
+of every completed batch to its own pickle in checkpoint_dir (written to a temporary file
+and renamed, so a checkpoint is either complete or absent) and then appends a line for it
+to journal.jsonl, flushed to disk. A rerun with the same settings loads the journalled
+batches instead of parsing them again and carries on from the first missing one. Since the
+loaded results are the very objects the original run produced, everything downstream of the
+batches, and so the final output, comes out byte for byte the same.
+
+Each journal line records the batch's fingerprint (a hash of its source names and sizes).
+If the input has changed since, the checkpoints from the first batch that no longer matches
+onwards are discarded and redone.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from collections import deque
+from typing import Callable, Iterable, Iterator, List
+
+from killmail_instrumentation import log
+
+JOURNAL_FILE = 'journal.jsonl'
+
+class BatchCheckpoints:
+    """
+    Checkpoints of the batches of one run, identified by settings (anything that changes
+    what the batches produce: input, batch size, decoder, ...). Checkpoints left by a run with
+    other settings are discarded.
+    """
+
+    def __init__(self, checkpoint_dir: str, settings: dict):
+        self.checkpoint_dir = str(checkpoint_dir)
+        self.journal_path = os.path.join(self.checkpoint_dir, JOURNAL_FILE)
+        self.settings = settings
+        self.completed = []  # journal entries of batches 0, 1, ... in order
+        self.resumed = 0
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self._load_journal()
+
+    def _load_journal(self) -> None:
+        entries = []
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:  # a line torn by the crash
+                        break
+        if not entries or entries[0].get('settings') != self.settings:
+            if entries:
+                log(f"Checkpoints in '{self.checkpoint_dir}' are from a run with other settings; starting over")
+            self._reset()
+            self._append({'settings': self.settings})
+            return
+        for entry in entries[1:]:
+            if entry.get('batch') != len(self.completed) or not os.path.exists(self._path(entry['batch'])):
+                break
+            self.completed.append(entry)
+        if self.completed:
+            log(f"Resuming from checkpoints: {len(self.completed)} batches already done")
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.checkpoint_dir, f"batch-{number:06d}.pickle")
+
+    def _append(self, entry: dict) -> None:
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncate(self, number: int) -> None:
+        # Forget batches number and later, e.g. because the input changed
+        self.completed = self.completed[:number]
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            for entry in [{'settings': self.settings}] + self.completed:
+                f.write(json.dumps(entry) + '\n')
+
+    @staticmethod
+    def fingerprint(source_keys: List[str]) -> str:
+        return hashlib.sha256('\n'.join(source_keys).encode('utf-8')).hexdigest()
+
+    def _save(self, number: int, source_keys: List[str], result: tuple) -> None:
+        path = self._path(number)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(tuple(result), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        entry = {'batch': number, 'sources': len(source_keys), 'fingerprint': self.fingerprint(source_keys)}
+        self._append(entry)
+        self.completed.append(entry)
+
+    def iter_results(self, batches: Iterable[list], process: Callable[[Iterable[list]], Iterator[tuple]],
+                     source_key: Callable[[object], str]) -> Iterator[tuple]:
+        """
+        Yield the result of each batch in order: loaded from its checkpoint when the batch is
+        journalled with the same sources, otherwise computed by process (which gets the
+        remaining batches and yields their results in order) and checkpointed. Loaded results
+        are plain tuples of the results' fields.
+        """
+        batch_iter = iter(batches)
+        pending = None
+        for number, entry in enumerate(list(self.completed)):
+            batch = next(batch_iter, None)
+            if batch is None:
+                break
+            if self.fingerprint([source_key(source) for source in batch]) != entry['fingerprint']:
+                log(f"Input changed at batch {number}; redoing it and the batches after it")
+                self._truncate(number)
+                pending = batch
+                break
+            with open(self._path(number), 'rb') as f:
+                result = pickle.load(f)
+            self.resumed += 1
+            yield result
+
+        # Source keys of the batches handed to process, matched up with its results in order
+        handed_out = deque()
+
+        def remaining() -> Iterator[list]:
+            for batch in ([pending] if pending is not None else []):
+                handed_out.append([source_key(source) for source in batch])
+                yield batch
+            for batch in batch_iter:
+                handed_out.append([source_key(source) for source in batch])
+                yield batch
+
+        number = len(self.completed)
+        for result in process(remaining()):
+            self._save(number, handed_out.popleft(), result)
+            number += 1
+            yield result
+
+    def _reset(self) -> None:
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.completed = []
+
+    def remove(self) -> None:
+        """
+        Delete the checkpoints and the journal, once the output they were for is complete.
+        """
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
@@ -0,0 +1,221 @@
+"""
+Daily aggregate cubes of converted killmails.
+
+The dashboards group the same killmail rows again and again: kills by hour, by victim and
+attacker ship, by solar system. build_cubes computes those group-bys once per conversion, with
+killmail_date as the leading key and only additive measures (counts and sums), so any date
+range is answered by adding cubes up instead of rescanning raw rows. Averages are sums divided
+by kills.
+
+write_cubes stores one small CSV per cube, day and input (<cube_dir>/<cube>/<YYYY-MM-DD>/
+<source>.csv, source from cube_source). A day's folder of killmails usually holds a few from
+the neighbouring days too (kills just before midnight, late arrivals), so a day's cube is the
+sum of several inputs' files, and re-converting one input only replaces that input's files.
+load_cubes reads back just the days of a range and adds up their inputs; rollup_cubes then
+merges them by month, by day or into one total.
+
+    python killmail_cubes.py cubes --start 2025-06-01 --end 2025-06-30 --output june
+"""
+import argparse
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+# Cube name -> dimension columns (besides killmail_date)
+CUBE_DIMENSIONS: Dict[str, List[str]] = {
+    'hourly': ['killmail_hour'],
+    'solar_system': ['solar_system_id', 'solar_system_name'],
+    'victim_ship': ['victim_ship_type', 'victim_ship_name'],
+    'attacker_ship': ['attacker_ship_type', 'attacker_ship_name'],
+    'ship_matchup': ['victim_ship_type', 'attacker_ship_type'],
+}
+
+# Additive measures: the killmail count plus sums of these killmail columns
+MEASURES = ['kills', 'victim_damage_taken', 'attacker_damage_done', 'total_attackers',
+            'total_items', 'items_destroyed', 'items_dropped']
+
+# Day folder of the rows whose killmail_time is missing
+UNKNOWN_DATE = 'unknown'
+
+# Column dtypes when cubes are read back from CSV
+_CSV_DTYPES = {'killmail_date': str, 'killmail_hour': 'Int64', 'solar_system_id': 'Int64',
+               **{measure: 'int64' for measure in MEASURES}}
+
+def build_cubes(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Aggregate enriched killmail rows into the cubes of CUBE_DIMENSIONS.
+    Missing dimension values (e.g. an unknown ship) form their own group.
+    """
+    times = df['killmail_time'].astype('string')
+    frame = pd.DataFrame({
+        'killmail_date': times.str.slice(0, 10),
+        'killmail_hour': pd.to_numeric(times.str.slice(11, 13), errors='coerce').astype('Int64'),
+        'kills': 1,
+    }, index=df.index)
+    for dimensions in CUBE_DIMENSIONS.values():
+        for col in dimensions:
+            if col not in frame.columns:
+                frame[col] = df[col]
+    for measure in MEASURES[1:]:
+        frame[measure] = pd.to_numeric(df[measure], errors='coerce').fillna(0).astype('int64')
+
+    return {name: _aggregate(frame, name) for name in CUBE_DIMENSIONS}
+
+def _aggregate(frame: pd.DataFrame, name: str, date_column: Optional[str] = 'killmail_date') -> pd.DataFrame:
+    keys = ([date_column] if date_column else []) + CUBE_DIMENSIONS[name]
+    cube = frame.groupby(keys, observed=True, dropna=False, sort=True)[MEASURES].sum()
+    return cube.reset_index()
+
+def merge_cubes(cube_sets: Iterable[Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+    """
+    Add up several sets of cubes (chunks of one run, or days) into one set.
+    """
+    collected = {}
+    for cubes in cube_sets:
+        for name, cube in cubes.items():
+            collected.setdefault(name, []).append(cube)
+    return {name: _aggregate(_concat(parts), name) for name, parts in collected.items()}
+
+def _concat(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    if len(parts) == 1:
+        return parts[0]
+    # Name columns of different chunks have different categories; combine them as plain strings
+    parts = [part.astype({col: object for col in part.columns if isinstance(part[col].dtype, pd.CategoricalDtype)})
+             for part in parts]
+    return pd.concat(parts, ignore_index=True)
+
+class CubeBuilder:
+    """
+    Running cubes of a chunked (streaming) conversion: each chunk is aggregated and merged in
+    as it is written, so only the small cubes are kept, never the rows.
+    """
+
+    def __init__(self):
+        self.cubes = None
+
+    def add(self, df: pd.DataFrame) -> None:
+        chunk_cubes = build_cubes(df)
+        self.cubes = chunk_cubes if self.cubes is None else merge_cubes([self.cubes, chunk_cubes])
+
+def cube_source(input_path: str) -> str:
+    """
+    The name of an input's cube files: its file or folder name plus a CRC-32 of its absolute
+    path, so that inputs with the same name in different places don't share files.
+    """
+    path = Path(input_path).resolve()
+    return f"{path.name}-{zlib.crc32(str(path).encode('utf-8')):08x}"
+
+def write_cubes(cubes: Dict[str, pd.DataFrame], cube_dir: str, source: str,
+                merge_existing: bool = False) -> int:
+    """
+    Write the cubes of one input as cube_dir/<cube>/<day>/<source>.csv files. Only this
+    source's files are touched: they are replaced, and the ones of days the cubes no longer
+    have deleted, or with merge_existing=True (incremental runs) added to. Other inputs' files
+    for the same days are kept. Returns the number of files written.
+    """
+    files_written = 0
+    for name in CUBE_DIMENSIONS:
+        directory = Path(cube_dir) / name
+        written = set()
+        if name in cubes:
+            for date, day in cubes[name].groupby('killmail_date', dropna=False, sort=True):
+                day_dir = directory / (date if isinstance(date, str) else UNKNOWN_DATE)
+                day_dir.mkdir(parents=True, exist_ok=True)
+                path = day_dir / f"{source}.csv"
+                if merge_existing and path.exists():
+                    day = merge_cubes([{name: _read_cubes([path])}, {name: day}])[name]
+                # Write to a temporary file and rename, so a crash never leaves a half-written day
+                tmp_path = f"{path}.tmp"
+                day.to_csv(tmp_path, index=False, encoding='utf-8')
+                os.replace(tmp_path, path)
+                written.add(path)
+                files_written += 1
+        if not merge_existing and directory.is_dir():
+            # Days this input no longer has, e.g. after a late killmail was removed from it
+            for day_dir in directory.iterdir():
+                path = day_dir / f"{source}.csv"
+                if path not in written and path.is_file():
+                    path.unlink()
+    return files_written
+
+def _read_cubes(paths: List[Path]) -> pd.DataFrame:
+    # Read with the default parser types and convert once after concatenating: per-file dtype
+    # conversion costs more than parsing these small files
+    cube = pd.concat([pd.read_csv(path, encoding='utf-8') for path in paths], ignore_index=True)
+    return cube.astype({col: dtype for col, dtype in _CSV_DTYPES.items() if col in cube.columns})
+
+def load_cubes(cube_dir: str, start: Optional[str] = None, end: Optional[str] = None,
+               names: Optional[Iterable[str]] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Read the daily cubes between start and end (inclusive 'YYYY-MM-DD' dates; open-ended when
+    omitted), with the files of all inputs of a day added up. Only the files of those days are
+    opened. Rows without a date are only included when no range is given.
+    """
+    cubes = {}
+    for name in names or CUBE_DIMENSIONS:
+        directory = Path(cube_dir) / name
+        if not directory.is_dir():
+            continue
+        paths = []
+        for day_dir in sorted(directory.iterdir()):
+            day = day_dir.name
+            if not day_dir.is_dir():
+                continue
+            if day == UNKNOWN_DATE:
+                if start is not None or end is not None:
+                    continue
+            elif (start is not None and day < start) or (end is not None and day > end):
+                continue
+            paths.extend(sorted(day_dir.glob('*.csv')))
+        if paths:
+            cubes[name] = _aggregate(_read_cubes(paths), name)
+    return cubes
+
+def rollup_cubes(cubes: Dict[str, pd.DataFrame], period: str = 'month') -> Dict[str, pd.DataFrame]:
+    """
+    Merge daily cubes by 'day', 'month' (killmail_month = YYYY-MM) or 'total' (no date key).
+    """
+    if period not in ('day', 'month', 'total'):
+        raise ValueError(f"Unknown rollup period '{period}', expected 'day', 'month' or 'total'")
+
+    rolled = {}
+    for name, cube in cubes.items():
+        if period == 'day':
+            rolled[name] = _aggregate(cube, name)
+        elif period == 'month':
+            monthly = cube.assign(killmail_month=cube['killmail_date'].str.slice(0, 7))
+            rolled[name] = _aggregate(monthly, name, 'killmail_month')
+        else:
+            rolled[name] = _aggregate(cube, name, None)
+    return rolled
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Roll daily killmail cubes up over a date range.")
+    parser.add_argument('cube_dir', help="Directory written by the converter's cube_dir option")
+    parser.add_argument('--start', help="First day (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Last day (YYYY-MM-DD)")
+    parser.add_argument('--period', choices=['day', 'month', 'total'], default='month')
+    parser.add_argument('--output', help="Write each rolled-up cube to <output>/<cube>.csv")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    cubes = rollup_cubes(load_cubes(args.cube_dir, args.start, args.end), args.period)
+    elapsed = time.perf_counter() - start_time
+
+    if not cubes:
+        print(f"No cubes found in '{args.cube_dir}' for that range.")
+        return
+
+    for name, cube in cubes.items():
+        print(f"{name}: {len(cube)} rows, {int(cube['kills'].sum())} kills")
+        if args.output:
+            Path(args.output).mkdir(parents=True, exist_ok=True)
+            cube.to_csv(Path(args.output) / f"{name}.csv", index=False, encoding='utf-8')
+    print(f"Rolled up in {elapsed:.3f} s")
+
+if __name__ == '__main__':
+    main()
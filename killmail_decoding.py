@@ -0,0 +1,130 @@
+"""
+Killmail JSON decoding for the killmail converters.
+
+get_decoder returns a function that turns the raw bytes of one killmail file into something
+flatten_killmail can read. With msgspec installed (pip install msgspec) the JSON is decoded
+straight into the typed structs below, which only declare the fields the converters and the
+fact tables (killmail_facts) use: everything else is skipped by the parser instead of being
+built into throwaway dicts. Without msgspec the standard library json module is used.
+
+The structs answer .get() and `in` like the dicts json produces, so flatten_killmail works
+unchanged with either backend.
+"""
+import json
+from typing import Callable, List, Optional, Union
+
+try:
+    import msgspec
+except ImportError:  # Optional; falls back to the standard library
+    msgspec = None
+
+JSON_BACKENDS = ('auto', 'msgspec', 'stdlib')
+
+# Exceptions that mean "this file is not a valid killmail", whichever backend raised them
+DECODE_ERRORS = (json.JSONDecodeError,) + ((msgspec.DecodeError,) if msgspec is not None else ())
+
+if msgspec is not None:
+    class _Record(msgspec.Struct):
+        """
+        Base for the killmail structs: dict-style access, where a field that is missing from
+        the JSON (None) behaves like a missing key.
+        """
+
+        def get(self, key, default=None):
+            value = getattr(self, key, None)
+            return default if value is None else value
+
+        def __contains__(self, key):
+            return getattr(self, key, None) is not None
+
+    # Numbers that may be written either way: a float field would turn JSON's 1 into 1.0, which
+    # the original script's CSV would show, so integers stay integers as with json
+    class Position(_Record):
+        x: Optional[Union[int, float]] = None
+        y: Optional[Union[int, float]] = None
+        z: Optional[Union[int, float]] = None
+
+    class Item(_Record):
+        item_type_id: Optional[int] = None
+        flag: Optional[int] = None
+        singleton: Optional[int] = None
+        quantity_destroyed: Optional[int] = None
+        quantity_dropped: Optional[int] = None
+        items: Optional[List['Item']] = None  # contents of a container
+
+    class Attacker(_Record):
+        alliance_id: Optional[int] = None
+        character_id: Optional[int] = None
+        corporation_id: Optional[int] = None
+        damage_done: Optional[int] = None
+        faction_id: Optional[int] = None
+        final_blow: Optional[bool] = None
+        security_status: Optional[Union[int, float]] = None
+        ship_type_id: Optional[int] = None
+        weapon_type_id: Optional[int] = None
+
+    class VictimWithoutItems(_Record):
+        alliance_id: Optional[int] = None
+        character_id: Optional[int] = None
+        corporation_id: Optional[int] = None
+        damage_taken: Optional[int] = None
+        ship_type_id: Optional[int] = None
+        position: Optional[Position] = None
+
+    class Victim(VictimWithoutItems):
+        items: Optional[List[Item]] = None
+
+    class _KillmailHeader(_Record):
+        killmail_id: Optional[int] = None
+        killmail_time: Optional[str] = None
+        solar_system_id: Optional[int] = None
+        killmail_hash: Optional[str] = None
+        http_last_modified: Optional[str] = None
+
+    class Killmail(_KillmailHeader):
+        victim: Optional[Victim] = None
+        attackers: Optional[List[Attacker]] = None
+
+    # Leaner structs for runs that use neither the attackers nor the items (see get_decoder)
+    class KillmailWithoutAttackers(_KillmailHeader):
+        victim: Optional[Victim] = None
+
+    class KillmailWithoutItems(_KillmailHeader):
+        victim: Optional[VictimWithoutItems] = None
+        attackers: Optional[List[Attacker]] = None
+
+    class KillmailWithoutAttackersOrItems(_KillmailHeader):
+        victim: Optional[VictimWithoutItems] = None
+
+    # (attackers, items) -> decoder
+    _killmail_decoders = {
+        (True, True): msgspec.json.Decoder(Killmail),
+        (False, True): msgspec.json.Decoder(KillmailWithoutAttackers),
+        (True, False): msgspec.json.Decoder(KillmailWithoutItems),
+        (False, False): msgspec.json.Decoder(KillmailWithoutAttackersOrItems),
+    }
+
+def resolve_backend(backend: str = 'auto') -> str:
+    """
+    Pick the decoding backend: 'auto' means msgspec when it is installed, else 'stdlib'.
+    Asking for 'msgspec' without it installed falls back to 'stdlib' with a warning.
+    """
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend '{backend}', expected one of {JSON_BACKENDS}")
+    if backend == 'auto':
+        return 'msgspec' if msgspec is not None else 'stdlib'
+    if backend == 'msgspec' and msgspec is None:
+        print("Warning: msgspec is not installed, using the standard library json module")
+        return 'stdlib'
+    return backend
+
+def get_decoder(backend: str = 'auto', attackers: bool = True, items: bool = True) -> Callable[[bytes], object]:
+    """
+    Return a function decoding the raw bytes of one killmail file for the given backend.
+    With attackers=False or items=False the msgspec decoder skips the attackers or the
+    victim's items (the bulk of a killmail) without building them; they read as missing.
+    The stdlib decoder always builds everything.
+    """
+    if resolve_backend(backend) == 'msgspec':
+        return _killmail_decoders[attackers, items].decode
+    return json.loads
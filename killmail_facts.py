@@ -0,0 +1,158 @@
+"""
+Attacker and item fact tables for the killmail converters.
+
+flatten_killmail keeps one row per killmail (the final-blow attacker and item counts).
+KillmailFacts collects the full detail in the same parse pass: one row per attacker and one
+row per item (container contents included), both keyed by killmail_id.
+
+Rows are appended to typed array.array column buffers instead of being kept as one dict per
+attacker, so a killmail with hundreds of attackers costs a few bytes per value. The buffers
+pickle as raw bytes, which keeps handing them back from process pool workers cheap.
+"""
+from array import array
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# (column, array typecode, pandas dtype). For the nullable (Int) columns a 0 in the buffer
+# means the value was missing from the killmail, as with IDs everywhere else in the converters.
+ATTACKER_COLUMNS: List[Tuple[str, str, str]] = [
+    ('killmail_id', 'q', 'Int64'),
+    ('attacker_index', 'i', 'int32'),
+    ('character_id', 'q', 'Int64'),
+    ('corporation_id', 'q', 'Int64'),
+    ('alliance_id', 'q', 'Int64'),
+    ('faction_id', 'i', 'Int32'),
+    ('ship_type_id', 'i', 'Int32'),
+    ('weapon_type_id', 'i', 'Int32'),
+    ('damage_done', 'i', 'int32'),
+    ('final_blow', 'b', 'bool'),
+    ('security_status', 'd', 'float32'),
+]
+
+ITEM_COLUMNS: List[Tuple[str, str, str]] = [
+    ('killmail_id', 'q', 'Int64'),
+    ('item_index', 'i', 'int32'),  # depth-first position in the victim's item list
+    ('parent_index', 'i', 'int32'),  # item_index of the containing item, -1 at the top level
+    ('item_type_id', 'i', 'Int32'),
+    ('flag', 'i', 'int32'),
+    ('singleton', 'i', 'int32'),
+    ('quantity_destroyed', 'q', 'int64'),
+    ('quantity_dropped', 'q', 'int64'),
+]
+
+class FactTable:
+    """
+    An append-only table stored as one typed array.array per column.
+    """
+
+    def __init__(self, columns: List[Tuple[str, str, str]]):
+        self.columns = columns
+        self.buffers = {name: array(typecode) for name, typecode, _ in columns}
+
+    def __len__(self) -> int:
+        return len(self.buffers[self.columns[0][0]])
+
+    def extend(self, other: 'FactTable') -> None:
+        for name, buffer in self.buffers.items():
+            buffer.extend(other.buffers[name])
+
+    def truncate(self, length: int) -> None:
+        for buffer in self.buffers.values():
+            del buffer[length:]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Copy the buffers into a DataFrame with the column dtypes (0 -> <NA> for Int columns).
+        """
+        data = {}
+        for name, typecode, dtype in self.columns:
+            values = np.frombuffer(self.buffers[name], dtype=typecode).copy()
+            if dtype[0] == 'I':
+                data[name] = pd.arrays.IntegerArray(values.astype(dtype.lower()), values == 0)
+            else:
+                data[name] = values.astype(dtype)
+        return pd.DataFrame(data)
+
+class KillmailFacts:
+    """
+    Attacker and item fact tables filled one parsed killmail at a time.
+    Works with the dicts from json and the structs from killmail_decoding alike.
+    With attackers=False only the item table is filled (e.g. for valuation).
+    """
+
+    def __init__(self, attackers: bool = True):
+        self.collect_attackers = attackers
+        self.attackers = FactTable(ATTACKER_COLUMNS)
+        self.items = FactTable(ITEM_COLUMNS)
+
+    def add(self, killmail) -> None:
+        """
+        Append the attackers and items of one killmail. If the killmail turns out to be
+        malformed halfway through, the rows already appended for it are removed again.
+        """
+        lengths = len(self.attackers), len(self.items)
+        try:
+            self._add(killmail)
+        except Exception:
+            self.attackers.truncate(lengths[0])
+            self.items.truncate(lengths[1])
+            raise
+
+    def _add(self, killmail) -> None:
+        killmail_id = killmail.get('killmail_id') or 0
+
+        if self.collect_attackers:
+            buffers = self.attackers.buffers
+            for attacker_index, attacker in enumerate(killmail.get('attackers', [])):
+                buffers['killmail_id'].append(killmail_id)
+                buffers['attacker_index'].append(attacker_index)
+                buffers['character_id'].append(attacker.get('character_id') or 0)
+                buffers['corporation_id'].append(attacker.get('corporation_id') or 0)
+                buffers['alliance_id'].append(attacker.get('alliance_id') or 0)
+                buffers['faction_id'].append(attacker.get('faction_id') or 0)
+                buffers['ship_type_id'].append(attacker.get('ship_type_id') or 0)
+                buffers['weapon_type_id'].append(attacker.get('weapon_type_id') or 0)
+                buffers['damage_done'].append(attacker.get('damage_done') or 0)
+                buffers['final_blow'].append(1 if attacker.get('final_blow') else 0)
+                security_status = attacker.get('security_status')
+                buffers['security_status'].append(float('nan') if security_status is None else security_status)
+
+        # Bound append methods in ITEM_COLUMNS order: a killmail can carry hundreds of items
+        (append_killmail_id, append_item_index, append_parent_index, append_type_id, append_flag,
+         append_singleton, append_destroyed, append_dropped) = (
+            self.items.buffers[name].append for name, _, _ in ITEM_COLUMNS)
+        # Depth-first walk so container contents follow their container
+        stack = [(item, -1) for item in reversed(killmail.get('victim', {}).get('items', []))]
+        item_index = 0
+        while stack:
+            item, parent_index = stack.pop()
+            append_killmail_id(killmail_id)
+            append_item_index(item_index)
+            append_parent_index(parent_index)
+            append_type_id(item.get('item_type_id') or 0)
+            append_flag(item.get('flag') or 0)
+            append_singleton(item.get('singleton') or 0)
+            append_destroyed(item.get('quantity_destroyed') or 0)
+            append_dropped(item.get('quantity_dropped') or 0)
+            contents = item.get('items')
+            if contents:
+                stack.extend((content, item_index) for content in reversed(contents))
+            item_index += 1
+
+    def extend(self, other: 'KillmailFacts') -> None:
+        self.attackers.extend(other.attackers)
+        self.items.extend(other.items)
+
+    def to_frames(self) -> Dict[str, pd.DataFrame]:
+        """
+        Return {'attackers': DataFrame, 'items': DataFrame}.
+        """
+        return {'attackers': self.attackers.to_frame(), 'items': self.items.to_frame()}
+
+# Key columns of each fact table: unique per row, used to drop duplicated killmails
+FACT_TABLE_KEYS = {
+    'attackers': ['killmail_id', 'attacker_index'],
+    'items': ['killmail_id', 'item_index'],
+}
@@ -0,0 +1,167 @@
+"""
+Run instrumentation for the killmail converters.
+
+RunReport records wall time, CPU time, counters (files, rows, bytes read, errors) and peak RSS
+for each stage of a conversion run and writes them as one JSON document, so scheduled jobs can
+track throughput (killmails per second) without scraping the console output.
+
+log() is the switchable replacement for the converters' progress and debug prints:
+set_verbose(False) silences it, leaving only warnings, errors and the final summary.
+"""
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_verbose = True
+
+def set_verbose(verbose: bool) -> bool:
+    """
+    Turn the converters' progress and debug output on or off. Returns the previous setting.
+    """
+    global _verbose
+    previous, _verbose = _verbose, verbose
+    return previous
+
+def log(*args, **kwargs) -> None:
+    """
+    print() that only prints while verbose output is on.
+    """
+    if _verbose:
+        print(*args, **kwargs)
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process so far, in MB (None if it cannot be measured).
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 1024 / 1024
+    return None
+
+def _children_cpu_seconds() -> float:
+    # CPU time of finished child processes (e.g. process pool workers)
+    times = os.times()
+    return times.children_user + times.children_system
+
+class RunReport:
+    """
+    Per-stage timing and resource figures of one conversion run.
+
+    Time a stage with `with report.stage('name'):` (repeated entries accumulate), or wrap a
+    lazily consumed iterator with report.timed_iter('name', iterator) to charge the time spent
+    producing each item to that stage. Add counters with report.count('name', rows=...).
+    """
+
+    def __init__(self, script: str, settings: Optional[dict] = None):
+        self.script = script
+        self.settings = settings or {}
+        self.status = 'ok'
+        self.stages = {}
+        self.started_at = time.time()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._start_children_cpu = _children_cpu_seconds()
+        self._finished = None
+
+    def _stage(self, name: str) -> dict:
+        return self.stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+
+    def add_time(self, name: str, wall_seconds: float, cpu_seconds: float) -> None:
+        stage = self._stage(name)
+        stage['wall_seconds'] += wall_seconds
+        stage['cpu_seconds'] += cpu_seconds
+        stage['peak_rss_mb'] = peak_rss_mb()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_wall, time.process_time() - start_cpu)
+
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+        iterator = iter(iterable)
+        while True:
+            start_wall, start_cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start_wall, time.process_time() - start_cpu)
+                return
+            self.add_time(name, time.perf_counter() - start_wall, time.process_time() - start_cpu)
+            yield item
+
+    def counted(self, name: str, iterable: Iterable,
+                size: Optional[Callable[[object], int]] = None) -> Iterator:
+        """
+        Yield from iterable, counting each item as a file (and size(item) as bytes read) of stage name.
+        """
+        for item in iterable:
+            self.count(name, files=1, bytes_read=size(item) if size is not None else 0)
+            yield item
+
+    def count(self, name: str, **counters: int) -> None:
+        stage = self._stage(name)
+        for counter, value in counters.items():
+            stage[counter] = stage.get(counter, 0) + value
+
+    def _total(self, counter: str) -> int:
+        return sum(stage.get(counter, 0) for stage in self.stages.values())
+
+    def finish(self) -> dict:
+        """
+        Close the run (the first call fixes the totals) and return the report as a dict.
+        """
+        if self._finished is None:
+            self._finished = self._to_dict()
+        return self._finished
+
+    def _to_dict(self) -> dict:
+        wall_seconds = time.perf_counter() - self._start_wall
+        rows = self._total('rows')
+        return {
+            'script': self.script,
+            'status': self.status,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'settings': self.settings,
+            'stages': self.stages,
+            'totals': {
+                'wall_seconds': wall_seconds,
+                'cpu_seconds': time.process_time() - self._start_cpu,
+                'worker_cpu_seconds': _children_cpu_seconds() - self._start_children_cpu,
+                'peak_rss_mb': peak_rss_mb(),
+                'files': self._total('files'),
+                'rows': rows,
+                'rows_written': self._total('rows_written'),
+                'errors': self._total('errors'),
+                'bytes_read': self._total('bytes_read'),
+                'killmails_per_second': rows / wall_seconds if wall_seconds > 0 else None,
+            },
+        }
+
+    def write(self, path: str) -> dict:
+        """
+        Finish the run, write the report as JSON to path and return it.
+        """
+        report = self.finish()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return report
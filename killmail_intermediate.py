@@ -0,0 +1,263 @@
+"""
+Columnar intermediate files of flattened, un-enriched killmail rows.
+
+Parsing the JSON is by far the most expensive part of a conversion, but the names joined on
+afterwards come from shiplist.csv, typeid.csv and mapSolarSystems.csv, which change after
+every patch. An intermediate keeps the flattened rows of a day, before enrichment, so those
+names can be joined on again (see the converters' reenrich_intermediate_pandas) without
+touching the JSON.
+
+An intermediate is a directory with one .npy file per column and a schema.json:
+
+    int     <column>.npy          int64, INT_MISSING where the value is missing
+    float   <column>.npy          float64, NaN where missing
+    bool    <column>.npy          int8: 1, 0, or -1 where missing
+    str     <column>.lengths.npy  int32 UTF-8 byte length of each value, -1 where missing
+            <column>.data.npy     uint8, the values' UTF-8 bytes back to back
+    derived (no file)             filled in again by enrichment
+
+All of them are plain .npy files, so IntermediateReader memory-maps them and only copies the
+rows it is asked for. IntermediateWriter appends each chunk to raw column files and turns
+them into the .npy files on close(); the directory is built next to its final path and
+renamed into place, so a crash never leaves a half-written intermediate behind.
+"""
+import json
+import os
+import shutil
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+SCHEMA_FILE = 'schema.json'
+
+# Stored in int columns where the value is missing
+INT_MISSING = np.iinfo(np.int64).min
+
+# (file suffix, dtype) of the arrays stored for each column kind
+_KIND_FILES: Dict[str, List[Tuple[str, str]]] = {
+    'int': [('', 'int64')],
+    'float': [('', 'float64')],
+    'bool': [('', 'int8')],
+    'str': [('.lengths', 'int32'), ('.data', 'uint8')],
+    'derived': [],
+}
+
+def column_kind(name: str, dtype, dtypes: Dict[str, str]) -> str:
+    """
+    Storage kind of a column: from its entry in dtypes (e.g. the converters' STREAM_DTYPES)
+    when it has one, otherwise from the pandas dtype, with anything non-numeric stored as text.
+    """
+    if name in dtypes:
+        dtype = pd.api.types.pandas_dtype(dtypes[name])
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'int'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float'
+    return 'str'
+
+def _encode(series: pd.Series, kind: str) -> List[np.ndarray]:
+    # The arrays of one column chunk, in _KIND_FILES order
+    if kind == 'int':
+        values = pd.to_numeric(series, errors='coerce')
+        missing = values.isna().to_numpy()
+        encoded = values.fillna(0).to_numpy(dtype=np.int64, copy=True)
+        encoded[missing] = INT_MISSING
+        return [encoded]
+    if kind == 'float':
+        return [pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)]
+    if kind == 'bool':
+        present = series.notna().to_numpy()
+        encoded = np.full(len(series), -1, dtype=np.int8)
+        encoded[present] = series[present].astype(bool).to_numpy()
+        return [encoded]
+    values = series.to_numpy(dtype=object)
+    present = ~pd.isna(values)
+    encoded = [str(value).encode('utf-8') for value in values[present]]
+    lengths = np.full(len(values), -1, dtype=np.int32)
+    lengths[present] = [len(value) for value in encoded]
+    return [lengths, np.frombuffer(b''.join(encoded), dtype=np.uint8)]
+
+def _skip_npy_header(f) -> None:
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        np.lib.format.read_array_header_1_0(f)
+    else:
+        np.lib.format.read_array_header_2_0(f)
+
+def _load(path: str) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:  # empty arrays cannot be memory-mapped
+        return np.load(path)
+
+class IntermediateWriter:
+    """
+    Write DataFrame chunks to an intermediate directory.
+
+    The column kinds are fixed by the first chunk (see column_kind); derived_columns are
+    recorded in the schema at their position but not stored. With append=True an existing
+    intermediate at path is extended instead of replaced.
+    """
+
+    def __init__(self, path: str, dtypes: Optional[Dict[str, str]] = None,
+                 derived_columns: Iterable[str] = (), append: bool = False):
+        self.path = str(path)
+        self.tmp_path = f"{self.path}.tmp"
+        self.dtypes = dtypes or {}
+        self.derived_columns = set(derived_columns)
+        self.columns = None  # [(name, kind)], fixed by the first chunk
+        self.rows = 0
+        self._files = {}
+
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        if append and os.path.exists(os.path.join(self.path, SCHEMA_FILE)):
+            self._copy_existing()
+
+    def _raw_path(self, file_name: str) -> str:
+        return os.path.join(self.tmp_path, f"{file_name}.raw")
+
+    def _open(self, columns: List[Tuple[str, str]]) -> None:
+        self.columns = columns
+        for name, kind in columns:
+            for suffix, _ in _KIND_FILES[kind]:
+                self._files[name + suffix] = open(self._raw_path(name + suffix), 'ab')
+
+    def _copy_existing(self) -> None:
+        with open(os.path.join(self.path, SCHEMA_FILE), 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+        columns = [(column['name'], column['kind']) for column in schema['columns']]
+        for file_name in (name + suffix for name, kind in columns for suffix, _ in _KIND_FILES[kind]):
+            with open(os.path.join(self.path, f"{file_name}.npy"), 'rb') as src, \
+                    open(self._raw_path(file_name), 'wb') as dst:
+                _skip_npy_header(src)
+                shutil.copyfileobj(src, dst)
+        self._open(columns)
+        self.rows = schema['rows']
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        if self.columns is None:
+            self._open([(col, 'derived' if col in self.derived_columns
+                         else column_kind(col, chunk[col].dtype, self.dtypes)) for col in chunk.columns])
+        names = [name for name, _ in self.columns]
+        if list(chunk.columns) != names:
+            raise ValueError(f"Chunk columns {list(chunk.columns)} do not match the intermediate's {names}")
+        for name, kind in self.columns:
+            if kind == 'derived':
+                continue
+            for (suffix, dtype), values in zip(_KIND_FILES[kind], _encode(chunk[name], kind)):
+                self._files[name + suffix].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        self.rows += len(chunk)
+
+    def close(self) -> None:
+        """
+        Turn the raw column files into .npy files, write the schema and move the directory to
+        path, replacing what was there. Without any chunk written nothing is created.
+        """
+        for f in self._files.values():
+            f.close()
+        if self.columns is None:
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+            return
+
+        for name, kind in self.columns:
+            for suffix, dtype in _KIND_FILES[kind]:
+                raw_path = self._raw_path(name + suffix)
+                dtype = np.dtype(dtype)
+                header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                          'shape': (os.path.getsize(raw_path) // dtype.itemsize,)}
+                with open(os.path.join(self.tmp_path, f"{name}{suffix}.npy"), 'wb') as dst, \
+                        open(raw_path, 'rb') as src:
+                    np.lib.format.write_array_header_1_0(dst, header)
+                    shutil.copyfileobj(src, dst)
+                os.remove(raw_path)
+
+        schema = {'format_version': FORMAT_VERSION, 'rows': self.rows,
+                  'columns': [{'name': name, 'kind': kind} for name, kind in self.columns]}
+        with open(os.path.join(self.tmp_path, SCHEMA_FILE), 'w', encoding='utf-8') as f:
+            json.dump(schema, f, indent=2)
+
+        old_path = f"{self.path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(self.tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+class IntermediateReader:
+    """
+    Memory-mapped access to an intermediate: read() rebuilds any row range as the DataFrame
+    pd.DataFrame(rows) of the flattened row dicts would have been, with the derived columns
+    present but empty.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        with open(os.path.join(self.path, SCHEMA_FILE), 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+        if schema.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported intermediate format version {schema.get('format_version')} "
+                             f"in '{self.path}'")
+        self.rows = schema['rows']
+        self.columns = [(column['name'], column['kind']) for column in schema['columns']]
+        self.arrays = {name + suffix: _load(os.path.join(self.path, f"{name}{suffix}.npy"))
+                       for name, kind in self.columns for suffix, _ in _KIND_FILES[kind]}
+        # Byte offset of each text value, from the lengths (missing values take no bytes)
+        self.offsets = {}
+        for name, kind in self.columns:
+            if kind == 'str':
+                lengths = np.maximum(self.arrays[f"{name}.lengths"], 0)
+                self.offsets[name] = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def _decode(self, name: str, kind: str, start: int, stop: int) -> np.ndarray:
+        count = stop - start
+        if kind == 'derived':
+            return np.full(count, None, dtype=object)
+        if kind == 'float':
+            return np.array(self.arrays[name][start:stop])
+        if kind == 'int':
+            values = np.array(self.arrays[name][start:stop])
+            missing = values == INT_MISSING
+            if missing.any():
+                # Like a column of ints and Nones: float64 with NaN
+                values = values.astype(np.float64)
+                values[missing] = np.nan
+            return values
+        if kind == 'bool':
+            values = np.array(self.arrays[name][start:stop])
+            if (values < 0).any():
+                decoded = np.full(count, None, dtype=object)
+                decoded[values >= 0] = values[values >= 0].astype(bool)
+                return decoded
+            return values.astype(bool)
+
+        lengths = self.arrays[f"{name}.lengths"][start:stop]
+        offsets = self.offsets[name][start:stop + 1]
+        blob = bytes(self.arrays[f"{name}.data"][offsets[0]:offsets[-1]])
+        offsets = (offsets - offsets[0]).tolist()
+        decoded = np.full(count, None, dtype=object)
+        for i in np.flatnonzero(lengths >= 0).tolist():
+            decoded[i] = blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+        return decoded
+
+    def read(self, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """
+        Rows start to stop (default: to the end) as a DataFrame.
+        """
+        stop = self.rows if stop is None else min(stop, self.rows)
+        start = min(start, stop)
+        return pd.DataFrame({name: self._decode(name, kind, start, stop) for name, kind in self.columns})
+
+    def iter_chunks(self, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Yield the rows as DataFrames of at most chunk_size rows.
+        """
+        for start in range(0, self.rows, chunk_size):
+            yield self.read(start, start + chunk_size)
@@ -0,0 +1,270 @@
+"""
+Live killmail ingestion from a RedisQ-style feed.
+
+zKillboard's RedisQ hands out one killmail per request: GET <feed>?queueID=<id>&ttw=<seconds>
+answers {"package": {"killID": ..., "killmail": {...}, "zkb": {...}}} as soon as a kill
+arrives, or {"package": null} after ttw seconds without one. The queue is kept per queueID on
+the server, so a consumer that stops polling for a while picks up where it left off.
+
+LiveIngestor polls such a feed with asyncio: poller tasks fetch over a small pool of keep-alive
+http.client connections (in worker threads, the stdlib has no async HTTP client) and put the
+killmails on a bounded asyncio.Queue. A consumer task turns each killmail into a row as it
+arrives and hands the rows to flush() every flush_rows rows or flush_seconds seconds. When
+flushing falls behind, the queue fills up and the pollers wait on it instead of fetching more
+(backpressure). Failed requests are retried after an exponential backoff with full jitter.
+
+The converters' ingest_live_pandas wires this to flatten_killmail and the chunk writers.
+"""
+import asyncio
+import http.client
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+from killmail_instrumentation import log
+
+class FeedError(Exception):
+    """
+    The feed answered with something other than a RedisQ response.
+    """
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Seconds to wait before retry number attempt (0-based): "full jitter", a uniform draw
+    between 0 and min(cap, base * 2**attempt), so many clients never retry in lockstep.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections to one host. Each request takes an idle connection (or
+    opens one) and puts it back afterwards unless the server closed it. Thread-safe, so
+    concurrent requests from worker threads each get their own connection.
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0, user_agent: str = 'eve-killmail-converter'):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported feed URL '{url}'")
+        self.scheme, self.host, self.port = parsed.scheme, parsed.hostname, parsed.port
+        self.timeout = timeout
+        self.headers = {'User-Agent': user_agent, 'Accept': 'application/json', 'Connection': 'keep-alive'}
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def get(self, path: str) -> Tuple[int, bytes]:
+        """
+        GET path and return (status, body).
+        """
+        return self.request('GET', path)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                content_type: str = 'application/json') -> Tuple[int, bytes]:
+        """
+        Send one request and return (status, body).
+        """
+        headers = self.headers if body is None else {**self.headers, 'Content-Type': content_type}
+        with self._lock:
+            connection = self._idle.pop() if self._idle else self._connect()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                self._idle.append(connection)
+        return response.status, body
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._idle = self._idle, []
+        for connection in connections:
+            connection.close()
+
+def parse_package(body: bytes) -> Optional[Tuple[str, dict]]:
+    """
+    (source name, killmail) of a RedisQ response, or None when it carries no killmail.
+    The zkb hash is copied into the killmail, which the ESI format leaves out.
+    """
+    try:
+        package = json.loads(body).get('package')
+    except (ValueError, AttributeError) as e:
+        raise FeedError(f"Not a RedisQ response: {e}") from e
+    if not package:
+        return None
+    killmail = package.get('killmail')
+    if not isinstance(killmail, dict):
+        raise FeedError("RedisQ package without a killmail")
+    if 'killmail_hash' not in killmail and isinstance(package.get('zkb'), dict):
+        killmail['killmail_hash'] = package['zkb'].get('hash')
+    kill_id = package.get('killID', killmail.get('killmail_id'))
+    return f"redisq:{kill_id}", killmail
+
+class LiveIngestor:
+    """
+    Poll a RedisQ-style feed and flush the killmails in micro-batches.
+
+    process(source_name, killmail) turns one killmail into a row (or raises, which counts it
+    as an error and skips it); flush(rows) writes a micro-batch and runs in a worker thread,
+    so polling goes on meanwhile. run() returns once stop() is called, max_killmails have
+    been processed or duration seconds have passed, after flushing what is left. A request
+    still in flight at that point is abandoned; with RedisQ its kill is lost to this queueID.
+    """
+
+    def __init__(self, feed_url: str, process: Callable[[str, dict], dict],
+                 flush: Callable[[List[dict]], None], queue_id: Optional[str] = None,
+                 ttw: int = 10, pollers: int = 1, queue_size: int = 1000,
+                 flush_rows: int = 500, flush_seconds: float = 60.0,
+                 retry_base: float = 1.0, retry_cap: float = 60.0,
+                 max_killmails: Optional[int] = None, duration: Optional[float] = None):
+        parsed = urllib.parse.urlsplit(feed_url)
+        query = urllib.parse.parse_qsl(parsed.query)
+        if queue_id is not None:
+            query.append(('queueID', queue_id))
+        query.append(('ttw', str(ttw)))
+        self.path = (parsed.path or '/') + '?' + urllib.parse.urlencode(query)
+        # Long polls answer after ttw seconds, so wait a bit longer than that for a response
+        self.pool = ConnectionPool(feed_url, timeout=ttw + 30)
+        self.process = process
+        self.flush = flush
+        self.pollers = pollers
+        self.queue_size = queue_size
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.max_killmails = max_killmails
+        self.duration = duration
+        self.stats = {'requests': 0, 'killmails': 0, 'duplicates': 0, 'errors': 0,
+                      'retries': 0, 'flushes': 0, 'rows_flushed': 0}
+        # Recently seen killmail names; RedisQ can deliver a kill again after a reconnect
+        self._recent = deque(maxlen=100000)
+        self._recent_set = set()
+        self._stopping = None
+
+    def stop(self) -> None:
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def _is_duplicate(self, name: str) -> bool:
+        if name in self._recent_set:
+            return True
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_set.discard(self._recent[0])
+        self._recent.append(name)
+        self._recent_set.add(name)
+        return False
+
+    async def _poll(self, queue: asyncio.Queue) -> None:
+        attempt = 0
+        while not self._stopping.is_set():
+            try:
+                self.stats['requests'] += 1
+                status, body = await asyncio.to_thread(self.pool.get, self.path)
+                if status != 200:
+                    raise FeedError(f"HTTP {status}: {body[:200]!r}")
+                package = parse_package(body)
+            except (OSError, http.client.HTTPException, FeedError) as e:
+                delay = backoff_delay(attempt, self.retry_base, self.retry_cap)
+                attempt += 1
+                self.stats['retries'] += 1
+                print(f"Warning: Feed request failed ({e}); retrying in {delay:.1f} s")
+                await self._sleep(delay)
+                continue
+            attempt = 0
+            if package is None:
+                continue
+            if self._is_duplicate(package[0]):
+                self.stats['duplicates'] += 1
+                continue
+            # Blocks while the queue is full: the backpressure that stops polling
+            await queue.put(package)
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _flush(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+        await asyncio.to_thread(self.flush, rows)
+        self.stats['flushes'] += 1
+        self.stats['rows_flushed'] += len(rows)
+        log(f"Flushed {len(rows)} killmails ({self.stats['killmails']} so far)")
+
+    async def _consume(self, queue: asyncio.Queue) -> None:
+        rows = []
+        deadline = time.monotonic() + self.flush_seconds
+        while not self._stopping.is_set():
+            # Wake up at least once a second to notice stop()
+            timeout = min(max(deadline - time.monotonic(), 0), 1.0)
+            try:
+                rows.append(self._process(*await asyncio.wait_for(queue.get(), timeout)))
+            except asyncio.TimeoutError:
+                pass
+            if len(rows) >= self.flush_rows or time.monotonic() >= deadline:
+                batch, rows = [row for row in rows if row is not None], []
+                await self._flush(batch)
+                deadline = time.monotonic() + self.flush_seconds
+
+        # Stopping: flush what has been received, in one last batch
+        while not queue.empty():
+            rows.append(self._process(*queue.get_nowait()))
+        await self._flush([row for row in rows if row is not None])
+
+    def _process(self, name: str, killmail: dict) -> Optional[dict]:
+        try:
+            row = self.process(name, killmail)
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"Warning: Skipping killmail {name}: {e}")
+            return None
+        self.stats['killmails'] += 1
+        if self.max_killmails is not None and self.stats['killmails'] >= self.max_killmails:
+            self._stopping.set()
+        return row
+
+    async def run(self) -> dict:
+        """
+        Ingest until stopped and return the counters (requests, killmails, errors, ...).
+        """
+        self._stopping = asyncio.Event()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        pollers = [asyncio.create_task(self._poll(queue)) for _ in range(self.pollers)]
+        consumer = asyncio.create_task(self._consume(queue))
+        try:
+            if self.duration is not None:
+                await self._sleep(self.duration)
+                self._stopping.set()
+            await asyncio.shield(consumer)
+        except asyncio.CancelledError:
+            # Interrupted (Ctrl+C): stop polling, but still flush the killmails already received
+            self._stopping.set()
+            await consumer
+            raise
+        finally:
+            self._stopping.set()
+            # Pollers may be waiting on a long poll or on a full queue; neither matters now
+            for poller in pollers:
+                poller.cancel()
+            await asyncio.gather(*pollers, return_exceptions=True)
+            if not consumer.done():
+                consumer.cancel()
+                await asyncio.gather(consumer, return_exceptions=True)
+            self.pool.close()
+        return self.stats
@@ -0,0 +1,210 @@
+"""
+Out-of-core merge of daily CSV outputs into one killmail_time-ordered, de-duplicated CSV.
+
+A month of daily outputs is more than fits in memory at once, so the merge is an external
+sort in two passes, holding at most about memory_rows rows at any time:
+
+1. Runs: every input is read in chunks of memory_rows rows, and each chunk is sorted by
+   (killmail_time, killmail_id) and written to a run file in a temporary directory.
+2. Merge: the runs are read back together, memory_rows / (number of runs) rows from each at a
+   time. Every row no later than the smallest of the runs' last buffered keys can be written,
+   since nothing still unread can sort before it; those rows are sorted with one lexsort and
+   appended to the output, and the emptied buffers are refilled.
+
+A killmail that is in several inputs (overlapping days, a rerun) has the same time and ID in
+each, so its copies end up next to each other and only one of them is kept. Rows whose time
+or ID cannot be parsed are never taken for copies of each other; they are all kept.
+Rows are copied as lines of text and only the two key columns are parsed, so every row comes
+out exactly as it was written, with Unix line ends. Values must not contain line breaks;
+the converters' outputs never do.
+
+    python killmail_merge.py killmails-07-*.csv --output killmails-07.csv
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from killmail_instrumentation import log
+
+TIME_COLUMN = 'killmail_time'
+ID_COLUMN = 'killmail_id'
+
+# Sort keys of times and IDs that are missing or cannot be parsed (NaT is the same value)
+KEY_MISSING = np.iinfo(np.int64).min
+
+def _read_line_chunks(path: str, chunk_rows: int) -> Tuple[str, Iterator[List[str]]]:
+    # The header line and an iterator of lists of up to chunk_rows row lines, without line ends
+    f = open(path, 'r', encoding='utf-8', newline='')
+    header = f.readline().rstrip('\r\n')
+
+    def chunks() -> Iterator[List[str]]:
+        with f:
+            while True:
+                lines = [line.rstrip('\r\n') for line in itertools.islice(f, chunk_rows)]
+                if not lines:
+                    return
+                yield lines
+    return header, chunks()
+
+def _sort_keys(path: str, header: str, lines: List[str]) -> np.ndarray:
+    # (time in ns since the epoch, killmail ID) of each row, as a 2 x n array; rows without
+    # either sort first. Only the two key columns are parsed.
+    keys = pd.read_csv(io.StringIO('\n'.join([header] + lines)), usecols=[TIME_COLUMN, ID_COLUMN],
+                       dtype=str, keep_default_na=False, na_filter=False)
+    if len(keys) != len(lines):
+        raise ValueError(f"'{path}' has values with line breaks in them, which cannot be merged line by line")
+    times = pd.to_datetime(keys[TIME_COLUMN], format='ISO8601', utc=True, errors='coerce')
+    times = times.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    ids = pd.to_numeric(keys[ID_COLUMN], errors='coerce').fillna(KEY_MISSING).to_numpy(dtype=np.int64)
+    return np.stack([times, ids])
+
+def _write_runs(input_paths: List[str], temp_dir: str, chunk_rows: int,
+                stats: Dict[str, int]) -> Tuple[List[str], str]:
+    # Sorted runs of all inputs, in input order, and their common header. A run is a text file
+    # of row lines plus a .npy of their sort keys, so the merge never parses the rows again.
+    runs = []
+    header = None
+    for path in input_paths:
+        input_header, chunks = _read_line_chunks(path, chunk_rows)
+        if header is None:
+            header = input_header
+            columns = next(csv.reader([header]), [])
+            for column in (TIME_COLUMN, ID_COLUMN):
+                if column not in columns:
+                    raise ValueError(f"'{path}' has no {column} column")
+        elif input_header != header:
+            raise ValueError(f"'{path}' has other columns than '{input_paths[0]}'")
+        for lines in chunks:
+            keys = _sort_keys(path, header, lines)
+            order = np.lexsort((keys[1], keys[0]))
+            run_path = os.path.join(temp_dir, f"run-{len(runs):06d}")
+            with open(f"{run_path}.csv", 'w', encoding='utf-8', newline='') as f:
+                f.write('\n'.join(lines[i] for i in order.tolist()) + '\n')
+            np.save(f"{run_path}.npy", keys[:, order])
+            runs.append(run_path)
+            stats['rows_read'] += len(lines)
+        log(f"Sorted '{path}' ({len(runs)} runs so far)")
+    return runs, header or ''
+
+class _RunBuffer:
+    """
+    The rows of one sorted run currently in memory, with their sort keys.
+    """
+
+    def __init__(self, run_path: str, chunk_rows: int):
+        self.lines = open(f"{run_path}.csv", 'r', encoding='utf-8', newline='')
+        self.keys = np.load(f"{run_path}.npy", mmap_mode='r')
+        self.chunk_rows = chunk_rows
+        self.position = 0
+        self.rows = None
+        self.refill()
+
+    def refill(self) -> None:
+        rows = [line.rstrip('\n') for line in itertools.islice(self.lines, self.chunk_rows)]
+        if not rows:
+            self.lines.close()
+            self.rows = None
+            return
+        self.rows = rows
+        keys = np.array(self.keys[:, self.position:self.position + len(rows)])
+        self.times, self.ids = keys[0], keys[1]
+        self.position += len(rows)
+
+    def take(self, count: int) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        taken = (self.rows[:count], self.times[:count], self.ids[:count])
+        if count == len(self.rows):
+            self.refill()
+        else:
+            self.rows = self.rows[count:]
+            self.times, self.ids = self.times[count:], self.ids[count:]
+        return taken
+
+def merge_sorted_outputs(input_paths: List[str], output_path: str, memory_rows: int = 500000,
+                         temp_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Merge the CSV outputs at input_paths (all with the same header, as written by the
+    converters) into output_path, sorted by killmail_time and killmail ID, each killmail once.
+    At most about memory_rows rows are held in memory. The sorted runs go to a temporary
+    directory in temp_dir (default: next to output_path) and are deleted afterwards; the
+    output is written to output_path + '.tmp' and renamed into place.
+    Returns the counts: inputs, runs, rows_read, rows_written, duplicates and missing_keys
+    (rows written without a parseable time or ID, which are never dropped as duplicates).
+    """
+    stats = {'inputs': len(input_paths), 'runs': 0, 'rows_read': 0, 'rows_written': 0, 'duplicates': 0,
+             'missing_keys': 0}
+    if temp_dir is None:
+        temp_dir = os.path.dirname(os.path.abspath(output_path))
+    run_dir = tempfile.mkdtemp(prefix='killmail_merge_', dir=temp_dir)
+    tmp_path = f"{output_path}.tmp"
+    try:
+        runs, header = _write_runs(input_paths, run_dir, memory_rows, stats)
+        stats['runs'] = len(runs)
+        log(f"Merging {len(runs)} sorted runs of {stats['rows_read']} rows...")
+
+        buffers = [_RunBuffer(run, max(1000, memory_rows // max(len(runs), 1))) for run in runs]
+        last_time = last_id = None  # key of the last row written
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(header + '\n')
+            while True:
+                buffers = [buffer for buffer in buffers if buffer.rows is not None]
+                if not buffers:
+                    break
+                # The smallest last buffered key: no unread row sorts before it
+                bound_time, bound_id = min((buffer.times[-1], buffer.ids[-1]) for buffer in buffers)
+                rows, times, ids = [], [], []
+                for buffer in buffers:
+                    ready = (buffer.times < bound_time) | ((buffer.times == bound_time) & (buffer.ids <= bound_id))
+                    count = int(np.count_nonzero(ready))
+                    if count:
+                        run_rows, run_times, run_ids = buffer.take(count)
+                        rows.extend(run_rows)
+                        times.append(run_times)
+                        ids.append(run_ids)
+                times, ids = np.concatenate(times), np.concatenate(ids)
+                # lexsort is stable, so rows with equal keys stay in run order
+                order = np.lexsort((ids, times))
+                times, ids = times[order], ids[order]
+                duplicate = np.zeros(len(order), dtype=bool)
+                duplicate[1:] = (times[1:] == times[:-1]) & (ids[1:] == ids[:-1])
+                if last_time is not None:
+                    duplicate[0] = times[0] == last_time and ids[0] == last_id
+                # Only rows with both keys can be copies of one killmail
+                keyed = (times != KEY_MISSING) & (ids != KEY_MISSING)
+                duplicate &= keyed
+                keep = order[~duplicate].tolist()
+                f.write('\n'.join(rows[i] for i in keep) + '\n')
+                stats['rows_written'] += len(keep)
+                stats['duplicates'] += len(order) - len(keep)
+                stats['missing_keys'] += int(np.count_nonzero(~keyed))
+                last_time, last_id = times[-1], ids[-1]
+        os.replace(tmp_path, output_path)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Merge daily killmail CSV outputs into one time-ordered, "
+                                                 "de-duplicated CSV.")
+    parser.add_argument('inputs', nargs='+', help="Daily CSV outputs")
+    parser.add_argument('--output', required=True, help="Merged CSV to write")
+    parser.add_argument('--memory-rows', type=int, default=500000,
+                        help="Rows held in memory at a time (default: 500000)")
+    parser.add_argument('--temp-dir', help="Where to put the sorted runs (default: next to the output)")
+    args = parser.parse_args(argv)
+
+    stats = merge_sorted_outputs(args.inputs, args.output, args.memory_rows, args.temp_dir)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == '__main__':
+    main()
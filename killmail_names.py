@@ -0,0 +1,194 @@
+"""
+Character, corporation and alliance names for the killmail ID columns.
+
+NameResolver turns IDs into names the way ESI's POST /universe/names/ does: up to 1000 IDs per
+request, answered with [{"id": ..., "name": ..., "category": ...}]. A run's unique IDs are
+collected first and only the ones missing from the local cache are requested, in batches of
+batch_size with a few requests in flight at once over keep-alive connections.
+
+The cache is a small SQLite database. Entries expire after ttl_days (characters can be
+renamed and corporations change their names); the least recently used entries are evicted
+once the cache holds more than max_entries. IDs ESI does not know are cached too, so a warm
+run makes next to no requests. add_entity_names adds the *_name columns to killmail rows.
+"""
+import http.client
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from killmail_live import ConnectionPool, backoff_delay
+
+ESI_NAMES_URL = 'https://esi.evetech.net/latest/universe/names/?datasource=tranquility'
+
+# ID column -> name column added by add_entity_names
+ENTITY_NAME_COLUMNS = {
+    'victim_character_id': 'victim_character_name',
+    'victim_corporation_id': 'victim_corporation_name',
+    'victim_alliance_id': 'victim_alliance_name',
+    'attacker_character_id': 'attacker_character_name',
+    'attacker_corporation_id': 'attacker_corporation_name',
+    'attacker_alliance_id': 'attacker_alliance_name',
+}
+
+class NameResolver:
+    """
+    Bulk ID -> name resolution through a POST /universe/names/ style endpoint, with a
+    persistent TTL + LRU cache in front of it.
+    """
+
+    def __init__(self, cache_path: str = '.killmail_names_cache.sqlite', url: str = ESI_NAMES_URL,
+                 ttl_days: float = 30, max_entries: int = 2_000_000, batch_size: int = 1000,
+                 concurrency: int = 4, retries: int = 4, retry_base: float = 1.0):
+        self.url = url
+        parsed = urllib.parse.urlsplit(url)
+        self.path = (parsed.path or '/') + (f'?{parsed.query}' if parsed.query else '')
+        self.pool = ConnectionPool(url)
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.retry_base = retry_base
+        self.stats = {'requested_ids': 0, 'cache_hits': 0, 'requests': 0, 'resolved': 0,
+                      'unknown': 0, 'failed': 0}
+        self._stats_lock = threading.Lock()
+
+        self.cache = sqlite3.connect(cache_path)
+        self.cache.execute('CREATE TABLE IF NOT EXISTS names (id INTEGER PRIMARY KEY, name TEXT, '
+                           'category TEXT, fetched_at REAL, used_at REAL)')
+        self.cache.execute('CREATE INDEX IF NOT EXISTS idx_names_used_at ON names (used_at)')
+
+    def resolve(self, ids: Iterable) -> Dict[int, str]:
+        """
+        Names of the given IDs (missing values and 0 are ignored). IDs that ESI does not know,
+        or that could not be fetched, are left out of the result.
+        """
+        unique_ids = pd.to_numeric(pd.Series(list(ids), dtype=object), errors='coerce').dropna().unique()
+        unique_ids = [int(value) for value in unique_ids if value > 0]
+        self.stats['requested_ids'] += len(unique_ids)
+        if not unique_ids:
+            return {}
+
+        now = time.time()
+        cached = self._cached(unique_ids, now)
+        self.stats['cache_hits'] += len(cached)
+        missing = [value for value in unique_ids if value not in cached]
+
+        fetched = {}
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for result in executor.map(self._fetch_batch, batches):
+                    fetched.update(result)
+            self._store(fetched, now)
+
+        names = {key: value for key, value in cached.items() if value is not None}
+        names.update((key, value[0]) for key, value in fetched.items() if value is not None)
+        return names
+
+    def _cached(self, ids: List[int], now: float) -> Dict[int, Optional[str]]:
+        # Fresh cache entries (name None for IDs ESI does not know); marks them as used
+        found = {}
+        with self.cache:
+            self.cache.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (id INTEGER PRIMARY KEY)')
+            self.cache.execute('DELETE FROM wanted')
+            self.cache.executemany('INSERT OR IGNORE INTO wanted VALUES (?)', ((value,) for value in ids))
+            for key, name in self.cache.execute(
+                    'SELECT names.id, names.name FROM names JOIN wanted USING (id) WHERE names.fetched_at >= ?',
+                    (now - self.ttl_seconds,)):
+                found[key] = name
+            self.cache.execute('UPDATE names SET used_at = ? WHERE id IN (SELECT id FROM wanted)', (now,))
+        return found
+
+    def _store(self, fetched: Dict[int, Optional[tuple]], now: float) -> None:
+        with self.cache:
+            self.cache.executemany(
+                'INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?, ?)',
+                ((key, *(value if value is not None else (None, None)), now, now)
+                 for key, value in fetched.items()))
+            excess = self.cache.execute('SELECT COUNT(*) FROM names').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.cache.execute('DELETE FROM names WHERE id IN '
+                                   '(SELECT id FROM names ORDER BY used_at LIMIT ?)', (excess,))
+
+    def _count(self, **counters: int) -> None:
+        with self._stats_lock:
+            for counter, value in counters.items():
+                self.stats[counter] += value
+
+    def _post(self, ids: List[int]):
+        # (status, parsed body) of one POST: 200 with the entries, 404 (an invalid ID in the
+        # batch) or None after retrying connection errors, rate limits (420/429) and 5xx
+        for attempt in range(self.retries + 1):
+            self._count(requests=1)
+            try:
+                status, body = self.pool.request('POST', self.path, json.dumps(ids).encode())
+            except (OSError, http.client.HTTPException) as e:
+                error = str(e)
+            else:
+                if status == 200:
+                    return status, json.loads(body)
+                if status == 404:
+                    return status, None
+                error = f"HTTP {status}: {body[:200]!r}"
+                if status < 500 and status not in (420, 429):
+                    break
+            if attempt < self.retries:
+                time.sleep(backoff_delay(attempt, self.retry_base))
+        print(f"Warning: Name lookup of {len(ids)} IDs failed ({error})")
+        return None, None
+
+    def _fetch_batch(self, ids: List[int]) -> Dict[int, Optional[tuple]]:
+        """
+        {id: (name, category)} for one batch, None for IDs ESI does not know. ESI rejects the
+        whole batch (404) if any ID is invalid, so a rejected batch is split in halves until
+        the invalid IDs are isolated. IDs of failed requests are left out (not cached), so
+        the next run asks for them again.
+        """
+        status, entries = self._post(ids)
+        if status == 200:
+            found = {entry['id']: (entry.get('name'), entry.get('category')) for entry in entries}
+            self._count(resolved=len(found), unknown=sum(value not in found for value in ids))
+            return {value: found.get(value) for value in ids}
+        if status is None:
+            self._count(failed=len(ids))
+            return {}
+        if len(ids) == 1:
+            self._count(unknown=1)
+            return {ids[0]: None}
+        middle = len(ids) // 2
+        return {**self._fetch_batch(ids[:middle]), **self._fetch_batch(ids[middle:])}
+
+    def close(self) -> None:
+        self.pool.close()
+        self.cache.close()
+
+def add_entity_names(df: pd.DataFrame, resolver: NameResolver,
+                     id_columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Resolve the unique character, corporation and alliance IDs of df in one go and add the
+    ENTITY_NAME_COLUMNS as categoricals (missing where the ID is missing or unknown).
+    id_columns limits this to the names of those ID columns (default: all of df's).
+    """
+    if id_columns is None:
+        id_columns = ENTITY_NAME_COLUMNS
+    id_columns = [col for col in id_columns if col in ENTITY_NAME_COLUMNS and col in df.columns]
+    if not id_columns:
+        return df
+    ids = pd.concat([pd.to_numeric(df[col], errors='coerce') for col in id_columns]).dropna().unique()
+    names = resolver.resolve(ids)
+
+    lookup = pd.Index(list(names.keys()), dtype='int64')
+    categories, name_codes = np.unique(np.array(list(names.values()), dtype=str), return_inverse=True)
+    name_codes = np.append(name_codes, -1)  # position -1 (not found) -> code -1 (missing)
+    for col in id_columns:
+        positions = lookup.get_indexer(pd.to_numeric(df[col], errors='coerce').astype('Int64'))
+        df[ENTITY_NAME_COLUMNS[col]] = pd.Categorical.from_codes(name_codes[positions], categories=categories)
+    return df
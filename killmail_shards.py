@@ -0,0 +1,108 @@
+"""
+Sharded conversion: split a day's killmails over several machines and merge the results.
+
+Every source file is assigned to one of shard_count shards by a stable hash of the killmail
+ID in its name (zKillboard names them <killmail_id>.json), so any machine can work out which
+files are its own without coordination. A shard writes a partial output, an intermediate of
+killmail_intermediate with a SOURCE_INDEX_COLUMN (each row's position in the full, sorted
+input listing), plus a JSON stats sidecar. The merge step reads the partials back in
+SOURCE_INDEX_COLUMN order, which is the order a single-node run processes the files in, and
+finishes them exactly like that run would, batch by batch: since a batch of chunk_size files
+holds the sources at positions k * chunk_size to (k + 1) * chunk_size - 1, the source index
+alone gives the batch every row was in (see the converters' convert_shard_pandas and
+merge_shards_pandas).
+"""
+import json
+import os
+import zlib
+from pathlib import PurePosixPath
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from killmail_intermediate import IntermediateReader
+
+# Position of a row's source in the input listing, stored in partial outputs only
+SOURCE_INDEX_COLUMN = 'source_index'
+
+def shard_of(source_name: str, shard_count: int) -> int:
+    """
+    Shard (0 to shard_count - 1) of a killmail source, by a CRC-32 of the killmail ID in its
+    file name, or of the whole name when the name is not an ID. Stable across machines,
+    processes and Python versions, unlike hash().
+    """
+    stem = PurePosixPath(source_name).stem
+    key = stem if stem.isdigit() else source_name
+    return zlib.crc32(key.encode('utf-8')) % shard_count
+
+def sidecar_path(partial_path: str) -> str:
+    return f"{partial_path}.stats.json"
+
+def write_sidecar(partial_path: str, sidecar: dict) -> None:
+    # Written last and renamed into place: a partial with a sidecar is complete
+    path = sidecar_path(partial_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(sidecar, f, indent=2)
+    os.replace(tmp_path, path)
+
+def read_sidecars(partial_paths: List[str]) -> List[Tuple[str, dict]]:
+    """
+    (partial path, sidecar) pairs sorted by shard index. Raises ValueError unless the
+    partials are exactly the shards 0 to shard_count - 1 of one input.
+    """
+    sidecars = []
+    for partial_path in partial_paths:
+        with open(sidecar_path(partial_path), 'r', encoding='utf-8') as f:
+            sidecars.append((partial_path, json.load(f)))
+    sidecars.sort(key=lambda pair: pair[1]['shard_index'])
+    if not sidecars:
+        raise ValueError("No partial outputs to merge")
+    shard_count = sidecars[0][1]['shard_count']
+    shard_indexes = [sidecar['shard_index'] for _, sidecar in sidecars]
+    if shard_indexes != list(range(shard_count)):
+        missing = sorted(set(range(shard_count)) - set(shard_indexes))
+        raise ValueError(f"Expected shards 0-{shard_count - 1} once each, got {shard_indexes}"
+                         + (f" (missing {missing})" if missing else ""))
+    # Every shard lists the whole input, so they all saw the same number of sources
+    for partial_path, sidecar in sidecars:
+        if sidecar['sources'] != sidecars[0][1]['sources']:
+            raise ValueError(f"'{partial_path}' saw {sidecar['sources']} input files, "
+                             f"'{sidecars[0][0]}' {sidecars[0][1]['sources']}: not shards of the same input")
+    return sidecars
+
+def _merge_order(readers: List[IntermediateReader]) -> Tuple[np.ndarray, np.ndarray]:
+    # Partial number and source index of every row in merged order. Each partial is already in
+    # source order, so the rows a merged range takes from one partial are contiguous there.
+    source_indexes = [np.asarray(reader.arrays[SOURCE_INDEX_COLUMN]) for reader in readers]
+    partials = np.concatenate([np.full(len(indexes), number, dtype=np.int32)
+                               for number, indexes in enumerate(source_indexes)])
+    source_indexes = np.concatenate(source_indexes)
+    order = np.argsort(source_indexes, kind='stable')
+    return partials[order], source_indexes[order]
+
+def iter_merged_chunks(readers: List[IntermediateReader], batch_size: Optional[int]) -> Iterator[pd.DataFrame]:
+    """
+    Yield the rows of all partials in source order, without the SOURCE_INDEX_COLUMN: one
+    DataFrame per batch of batch_size sources, holding exactly the rows a single-node run with
+    chunk_size=batch_size gets from that batch (batches without rows are skipped), or all rows
+    in one DataFrame if batch_size is None. Only one batch is read into memory at a time.
+    """
+    partials, source_indexes = _merge_order(readers)
+    if batch_size is None:
+        bounds = [0, len(partials)]
+    else:
+        batches = source_indexes // batch_size
+        bounds = [0] + (np.flatnonzero(np.diff(batches)) + 1).tolist() + [len(partials)]
+    starts = np.zeros(len(readers), dtype=np.int64)
+    for chunk_start, chunk_end in zip(bounds[:-1], bounds[1:]):
+        counts = np.bincount(partials[chunk_start:chunk_end], minlength=len(readers))
+        parts = []
+        for number, count in enumerate(counts.tolist()):
+            if count:
+                parts.append(readers[number].read(int(starts[number]), int(starts[number]) + count))
+                starts[number] += count
+        chunk = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        order = np.argsort(chunk[SOURCE_INDEX_COLUMN].to_numpy(), kind='stable')
+        yield chunk.take(order).reset_index(drop=True).drop(columns=SOURCE_INDEX_COLUMN)
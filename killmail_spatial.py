@@ -0,0 +1,243 @@
+"""
+Solar system geography for the killmail converters.
+
+SolarSystemTable keeps the columns of mapSolarSystems.csv that the name lookup throws away
+(region, constellation, security, coordinates) as numpy arrays sorted by solarSystemID, so a
+column of killmail system IDs is joined against it with one searchsorted. enrich_spatial adds
+the region, constellation, security band and light-year coordinates to every killmail.
+
+KDTree is a static k-d tree over the system coordinates for light-year range queries, and
+KillSpatialIndex combines it with the killmail times to answer "kills within N ly of system X
+between two times" in microseconds per query.
+"""
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Metres per light year (the SDE coordinates are in metres)
+LIGHT_YEAR = 9_460_730_472_580_800.0
+
+SECURITY_BANDS = ['highsec', 'lowsec', 'nullsec', 'wormhole']
+
+# Regions from this ID on are wormhole (and other unreachable) space
+WORMHOLE_REGION_ID = 11000000
+
+# Columns added by enrich_spatial
+SPATIAL_COLUMNS = ['region_id', 'constellation_id', 'solar_system_security', 'security_band',
+                   'solar_system_x_ly', 'solar_system_y_ly', 'solar_system_z_ly']
+
+_MAP_COLUMNS = ['solarSystemID', 'solarSystemName', 'regionID', 'constellationID',
+                'x', 'y', 'z', 'security']
+
+def security_bands(security: np.ndarray, region_ids: np.ndarray) -> pd.Categorical:
+    """
+    Classify systems the way the game does: the security status is shown rounded to one
+    decimal (anything above 0.0 shows as at least 0.1), 0.5 and up is highsec, 0.1-0.4 lowsec,
+    0.0 and below nullsec. Wormhole regions are their own band.
+    """
+    shown = np.where((security > 0) & (security < 0.05), 0.1, np.round(security, 1))
+    codes = np.select([region_ids >= WORMHOLE_REGION_ID, shown >= 0.5, shown > 0.0],
+                      [3, 0, 1], default=2)
+    return pd.Categorical.from_codes(codes, categories=SECURITY_BANDS)
+
+class SolarSystemTable:
+    """
+    Solar systems as parallel arrays sorted by ID; coordinates are in light years.
+    """
+
+    def __init__(self, ids: np.ndarray, names: np.ndarray, region_ids: np.ndarray,
+                 constellation_ids: np.ndarray, security: np.ndarray, coordinates: np.ndarray):
+        order = np.argsort(ids, kind='stable')
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.names = np.asarray(names, dtype=object)[order]
+        self.region_ids = np.asarray(region_ids, dtype=np.int32)[order]
+        self.constellation_ids = np.asarray(constellation_ids, dtype=np.int32)[order]
+        self.security = np.asarray(security, dtype=np.float32)[order]
+        self.coordinates = np.asarray(coordinates, dtype=np.float64)[order]
+        self.security_bands = security_bands(self.security, self.region_ids)
+        self._tree = None
+
+    @classmethod
+    def from_csv(cls, map_solar_systems_csv_path: str) -> Optional['SolarSystemTable']:
+        """
+        Load the table from mapSolarSystems.csv (SDE column names). Returns None on failure.
+        """
+        try:
+            df = pd.read_csv(map_solar_systems_csv_path, encoding='utf-8', usecols=_MAP_COLUMNS)
+            df = df.dropna(subset=['solarSystemID', 'x', 'y', 'z'])
+            return cls(df['solarSystemID'].to_numpy(dtype=np.int64),
+                       df['solarSystemName'].astype(str).to_numpy(),
+                       df['regionID'].fillna(0).to_numpy(dtype=np.int32),
+                       df['constellationID'].fillna(0).to_numpy(dtype=np.int32),
+                       df['security'].fillna(0).to_numpy(dtype=np.float32),
+                       df[['x', 'y', 'z']].to_numpy(dtype=np.float64) / LIGHT_YEAR)
+        except Exception as e:
+            print(f"Warning: Could not load solar system table from {map_solar_systems_csv_path}: {e}")
+            return None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def positions(self, system_ids) -> np.ndarray:
+        """
+        Row positions of the given system IDs in the table, -1 for unknown or missing IDs.
+        """
+        ids = pd.to_numeric(pd.Series(system_ids), errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        known = ~np.isnan(ids)
+        ids = np.where(known, ids, -1).astype(np.int64)
+        positions = np.searchsorted(self.ids, ids).clip(max=len(self.ids) - 1)
+        return np.where(known & (self.ids[positions] == ids), positions, -1)
+
+    def position(self, system_id: int) -> int:
+        """
+        Row position of one system ID, -1 if it is not in the table.
+        """
+        position = int(np.searchsorted(self.ids, system_id))
+        return position if position < len(self.ids) and self.ids[position] == system_id else -1
+
+    @property
+    def tree(self) -> 'KDTree':
+        if self._tree is None:
+            self._tree = KDTree(self.coordinates)
+        return self._tree
+
+    def systems_within(self, system_id: int, light_years: float) -> np.ndarray:
+        """
+        IDs of the systems within light_years of system_id (including itself).
+        """
+        position = self.position(system_id)
+        if position < 0:
+            return np.empty(0, dtype=np.int64)
+        return self.ids[self.tree.query_radius(self.coordinates[position], light_years)]
+
+def enrich_spatial(df: pd.DataFrame, table: SolarSystemTable) -> pd.DataFrame:
+    """
+    Add the SPATIAL_COLUMNS of each killmail's solar system (missing for unknown systems).
+    """
+    positions = table.positions(df['solar_system_id'])
+    known = positions >= 0
+    taken = np.where(known, positions, 0)
+
+    df['region_id'] = pd.arrays.IntegerArray(table.region_ids[taken], ~known)
+    df['constellation_id'] = pd.arrays.IntegerArray(table.constellation_ids[taken], ~known)
+    df['solar_system_security'] = np.where(known, table.security[taken], np.nan).astype(np.float32)
+    df['security_band'] = pd.Categorical.from_codes(
+        np.where(known, table.security_bands.codes[taken], -1), categories=SECURITY_BANDS)
+    for axis, name in enumerate(['solar_system_x_ly', 'solar_system_y_ly', 'solar_system_z_ly']):
+        df[name] = np.where(known, table.coordinates[taken, axis], np.nan)
+    return df
+
+class KDTree:
+    """
+    Static k-d tree over 3-D points for radius queries.
+
+    Each node splits its points at the median of its widest axis until at most leaf_size
+    remain. The points are stored in tree order, so every node covers one contiguous slice:
+    a query walks the nodes whose bounding box can reach the sphere, takes whole slices of
+    nodes that lie entirely inside it, and checks the rest leaf by leaf with numpy.
+    Checking a few hundred points in numpy costs about as much as visiting one node in Python,
+    hence the large default leaf_size.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = 256):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.order = np.arange(len(points))
+        # Per node: slice bounds, children (-1 for a leaf) and bounding box
+        starts, ends, lefts, rights, boxes = [], [], [], [], []
+
+        stack = [(0, len(points), None, None)]  # (start, end, parent node, is right child)
+        while stack:
+            start, end, parent, is_right = stack.pop()
+            node = len(starts)
+            if parent is not None:
+                (rights if is_right else lefts)[parent] = node
+
+            members = self.order[start:end]
+            node_points = points[members]
+            low, high = (node_points.min(axis=0), node_points.max(axis=0)) if end > start else \
+                (np.zeros(3), np.zeros(3))
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            boxes.append((*low.tolist(), *high.tolist()))
+
+            if end - start > leaf_size:
+                axis = int(np.argmax(high - low))
+                middle = (end - start) // 2
+                split = np.argpartition(node_points[:, axis], middle)
+                self.order[start:end] = members[split]
+                stack.append((start + middle, end, node, True))
+                stack.append((start, start + middle, node, False))
+
+        self.points = points[self.order]
+        self._starts, self._ends = starts, ends
+        self._lefts, self._rights = lefts, rights
+        self._boxes = boxes
+
+    def query_radius(self, center, radius: float) -> np.ndarray:
+        """
+        Indices (into the original points) of the points within radius of center.
+        """
+        cx, cy, cz = (float(value) for value in center)
+        radius_squared = radius * radius
+        found = []
+        stack = [0] if self._starts else []
+        while stack:
+            node = stack.pop()
+            x0, y0, z0, x1, y1, z1 = self._boxes[node]
+            # Squared distance from the center to the nearest and farthest box points
+            dx = x0 - cx if cx < x0 else (cx - x1 if cx > x1 else 0.0)
+            dy = y0 - cy if cy < y0 else (cy - y1 if cy > y1 else 0.0)
+            dz = z0 - cz if cz < z0 else (cz - z1 if cz > z1 else 0.0)
+            if dx * dx + dy * dy + dz * dz > radius_squared:
+                continue
+            fx, fy, fz = max(cx - x0, x1 - cx), max(cy - y0, y1 - cy), max(cz - z0, z1 - cz)
+            start, end = self._starts[node], self._ends[node]
+            if fx * fx + fy * fy + fz * fz <= radius_squared:
+                found.append(self.order[start:end])
+            elif self._lefts[node] < 0:
+                offsets = self.points[start:end] - (cx, cy, cz)
+                inside = np.einsum('ij,ij->i', offsets, offsets) <= radius_squared
+                found.append(self.order[start:end][inside])
+            else:
+                stack.append(self._rights[node])
+                stack.append(self._lefts[node])
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+class KillSpatialIndex:
+    """
+    Killmails indexed for "kills within N ly of system X between two times" queries.
+
+    The kills are sorted by time once; a query finds its time window with a binary search,
+    the systems in range with the SolarSystemTable's k-d tree, and keeps the kills of the
+    window whose system is one of them. Results are row positions in the original frame.
+    """
+
+    def __init__(self, killmails: pd.DataFrame, table: SolarSystemTable):
+        self.table = table
+        times = pd.to_datetime(killmails['killmail_time'], errors='coerce', utc=True)
+        times = times.dt.tz_localize(None).to_numpy(dtype='datetime64[s]')
+        self.order = np.argsort(times, kind='stable')
+        self.times = times[self.order]
+        self.system_positions = table.positions(killmails['solar_system_id'])[self.order]
+
+    def kills_within(self, system_id: int, light_years: float,
+                     start: Optional[Union[str, np.datetime64]] = None,
+                     end: Optional[Union[str, np.datetime64]] = None) -> np.ndarray:
+        """
+        Row positions of the kills within light_years of system_id with start <= time < end.
+        """
+        first = 0 if start is None else np.searchsorted(self.times, np.datetime64(start, 's'), 'left')
+        last = len(self.times) if end is None else np.searchsorted(self.times, np.datetime64(end, 's'), 'left')
+        position = self.table.position(system_id)
+        if position < 0 or first >= last:
+            return np.empty(0, dtype=np.int64)
+
+        in_range = np.zeros(len(self.table) + 1, dtype=bool)  # last slot: kills in unknown systems
+        in_range[self.table.tree.query_radius(self.table.coordinates[position], light_years)] = True
+        window = self.system_positions[first:last]
+        return self.order[first:last][in_range[window]]
@@ -0,0 +1,171 @@
+"""
+Embedded SQLite store of converted killmails for ad-hoc queries.
+
+KillmailStore bulk-loads flattened killmail rows (DataFrame chunks, as the converters write
+them) into one `killmails` table keyed by killmail_id. Each chunk goes in with one executemany
+inside one transaction, as an upsert, so re-running a day replaces its rows instead of
+duplicating them. The lookup columns (time, system, alliance, corporation and ship type IDs)
+are indexed, which turns "kills for alliance X this week" into an index range scan.
+
+    python killmail_store.py killmails.db killmails-07-06-25.csv killmails-07-07-25.csv
+    python killmail_store.py killmails.db --query "SELECT COUNT(*) FROM killmails WHERE victim_alliance_id = 99003581"
+"""
+import argparse
+import sqlite3
+import time
+from typing import List, Optional
+
+import pandas as pd
+
+TABLE = 'killmails'
+
+# Columns that get an index (killmail_id is the primary key)
+INDEXED_COLUMNS = ['killmail_time', 'solar_system_id',
+                   'victim_alliance_id', 'victim_corporation_id', 'victim_ship_type_id',
+                   'attacker_alliance_id', 'attacker_corporation_id', 'attacker_ship_type_id']
+
+def _sql_type(name: str, dtype) -> str:
+    # ID columns are INTEGER even when a CSV chunk reads them as floats (because of missing
+    # values): SQLite stores 99003581.0 in an INTEGER column as the integer 99003581
+    if name.endswith('_id') or pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+class KillmailStore:
+    """
+    A SQLite database holding one row per killmail_id.
+
+    The table is created from the columns of the first chunk written; columns that show up in
+    later chunks (e.g. with spatial_enrichment) are added on the fly. When the table starts out
+    empty, the indexes are only built by close(), which is much faster than maintaining them
+    row by row during a bulk load; an existing store keeps its indexes up to date instead.
+    """
+
+    def __init__(self, path: str, batch_size: int = 50000):
+        self.path = str(path)
+        self.batch_size = batch_size
+        # Not tied to the opening thread: live ingestion writes from its flush worker thread
+        # (one write at a time)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL lets dashboards read while a conversion writes; NORMAL sync is safe with WAL
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.columns = self._table_columns()
+        self._defer_indexes = not self.columns or self._is_empty()
+        self.rows_written = 0
+
+    def _table_columns(self) -> List[str]:
+        return [row[1] for row in self.connection.execute(f'PRAGMA table_info({TABLE})')]
+
+    def _is_empty(self) -> bool:
+        return self.connection.execute(f'SELECT 1 FROM {TABLE} LIMIT 1').fetchone() is None
+
+    def _ensure_columns(self, chunk: pd.DataFrame) -> None:
+        if not self.columns:
+            definitions = ['killmail_id INTEGER PRIMARY KEY'] + [
+                f'{_quote(col)} {_sql_type(col, chunk[col].dtype)}' for col in chunk.columns if col != 'killmail_id']
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} ({", ".join(definitions)})')
+            self.columns = self._table_columns()
+            return
+        for col in chunk.columns:
+            if col not in self.columns:
+                self.connection.execute(f'ALTER TABLE {TABLE} ADD COLUMN {_quote(col)} {_sql_type(col, chunk[col].dtype)}')
+                self.columns.append(col)
+
+    def write(self, chunk: pd.DataFrame) -> int:
+        """
+        Upsert killmail rows, one transaction per batch_size rows: rows whose killmail_id is
+        already stored replace it. Rows without a killmail_id cannot be keyed and are skipped.
+        Returns the number of rows written.
+        """
+        chunk = chunk[chunk['killmail_id'].notna()]
+        if chunk.empty:
+            return 0
+        self._ensure_columns(chunk)
+        for start in range(0, len(chunk), self.batch_size):
+            self._upsert(chunk.iloc[start:start + self.batch_size])
+        self.rows_written += len(chunk)
+        return len(chunk)
+
+    def _upsert(self, chunk: pd.DataFrame) -> None:
+        # Plain Python values with None for every kind of missing value, column by column
+        values = []
+        for col in chunk.columns:
+            series = chunk[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype(object)
+            elif pd.api.types.is_bool_dtype(series.dtype):
+                series = series.astype('Int8')
+            values.append(series.astype(object).where(series.notna(), None).tolist())
+
+        names = ', '.join(_quote(col) for col in chunk.columns)
+        placeholders = ', '.join('?' * len(chunk.columns))
+        updates = ', '.join(f'{_quote(col)} = excluded.{_quote(col)}' for col in chunk.columns if col != 'killmail_id')
+        sql = f'INSERT INTO {TABLE} ({names}) VALUES ({placeholders}) ON CONFLICT(killmail_id) DO '
+        sql += f'UPDATE SET {updates}' if updates else 'NOTHING'
+        with self.connection:
+            self.connection.executemany(sql, zip(*values))
+
+    def create_indexes(self, analyze: bool = True) -> None:
+        """
+        Create the INDEXED_COLUMNS indexes that do not exist yet, and with analyze refresh the
+        statistics SQLite's query planner picks indexes by.
+        """
+        with self.connection:
+            for col in INDEXED_COLUMNS:
+                if col in self.columns:
+                    self.connection.execute(
+                        f'CREATE INDEX IF NOT EXISTS {_quote(f"idx_{TABLE}_{col}")} ON {TABLE} ({_quote(col)})')
+            if analyze:
+                self.connection.execute('ANALYZE')
+        self._defer_indexes = False
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        """
+        Run a SELECT against the store and return the result as a DataFrame.
+        """
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def close(self) -> None:
+        if self.columns:
+            self.create_indexes(analyze=self._defer_indexes)
+        self.connection.close()
+
+    def __enter__(self) -> 'KillmailStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def _read_killmails(path: str, chunk_size: int):
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, chunksize=chunk_size, low_memory=False)
+    else:
+        yield pd.read_parquet(path)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load converted killmails into a SQLite store, or query it.")
+    parser.add_argument('database', help="SQLite database file (created if missing)")
+    parser.add_argument('inputs', nargs='*', help="Killmail CSV files or Parquet datasets written by a converter")
+    parser.add_argument('--query', help="SQL to run after loading; the result is printed")
+    parser.add_argument('--chunk-size', type=int, default=50000, help="Rows per transaction")
+    args = parser.parse_args(argv)
+
+    with KillmailStore(args.database, args.chunk_size) as store:
+        for path in args.inputs:
+            start_time = time.perf_counter()
+            rows = sum(store.write(chunk) for chunk in _read_killmails(path, args.chunk_size))
+            print(f"Loaded {rows} killmails from '{path}' ({time.perf_counter() - start_time:.2f} s)")
+        if args.query:
+            start_time = time.perf_counter()
+            result = store.query(args.query)
+            print(result.to_string(index=False))
+            print(f"{len(result)} rows ({(time.perf_counter() - start_time) * 1000:.1f} ms)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Kills-per-interval time series of killmail outputs, for charts that would otherwise be built
+from millions of raw rows.
+
+parse_killmail_times turns killmail_time strings into int64 seconds since the epoch in one
+vectorized pass: the fixed-width 'YYYY-MM-DDTHH:MM:SSZ' strings are read as a byte matrix and
+their digits combined with array arithmetic, and only values in any other format go through
+pandas' general parser.
+
+KillSeries buckets rows into tumbling windows of a fixed resolution (a minute, an hour, ...),
+optionally per solar system, region or any other ID column, and sums the kills, damage and
+(with price_csv outputs) ISK value per window. It takes any number of chunks in any order and
+only keeps the per-window sums, so a month of rows reduces to a table of (group, window)
+points. table(rolling=...) adds rolling sums over a longer window at every point, from prefix
+sums: each window is the previous one plus what enters and minus what leaves, instead of a
+sum over the window's points per point.
+
+    python killmail_timeseries.py killmails-07.csv --resolution 1min --by solar_system_id \\
+        --rolling 1h --output series-07.csv
+"""
+import argparse
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from killmail_instrumentation import log
+
+TIME_COLUMN = 'killmail_time'
+# Summed per window when present, besides the kill count, and the dtype of their sums
+SUM_COLUMNS = {'victim_damage_taken': np.int64, 'total_value': np.float64}
+
+# Stored for times that are missing or cannot be parsed
+TIME_MISSING = np.iinfo(np.int64).min
+
+# 'YYYY-MM-DDTHH:MM:SSZ': positions of the separators and of each field's digits
+_ISO_LENGTH = 20
+_ISO_SEPARATORS = {4: b'-', 7: b'-', 10: b'T', 13: b':', 16: b':', 19: b'Z'}
+_ISO_FIELDS = {'year': (0, 4), 'month': (5, 7), 'day': (8, 10),
+               'hour': (11, 13), 'minute': (14, 16), 'second': (17, 19)}
+# Days in each month of a common year
+_MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+def _days_in_month(year: np.ndarray, month: np.ndarray) -> np.ndarray:
+    # Length of each month (1-12; others are clipped), February 29 days in leap years
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    return _MONTH_DAYS[np.clip(month, 1, 12) - 1] + ((month == 2) & leap)
+
+def _days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    # Days since 1970-01-01 of proleptic Gregorian dates (H. Hinnant's days_from_civil)
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def parse_killmail_times(times: Union[pd.Series, Iterable]) -> np.ndarray:
+    """
+    killmail_time values as int64 seconds since the epoch (UTC), TIME_MISSING where missing
+    or unparseable. ISO 8601 strings in the fixed 'YYYY-MM-DDTHH:MM:SSZ' form of the ESI
+    killmails are parsed with array arithmetic; anything else falls back to pd.to_datetime.
+    """
+    times = pd.Series(times, copy=False)
+    if pd.api.types.is_datetime64_any_dtype(times.dtype):
+        parsed = pd.to_datetime(times, utc=True)
+        return np.where(parsed.isna(), TIME_MISSING, parsed.to_numpy(dtype='datetime64[s]').view(np.int64))
+
+    text = times.astype('string')
+    result = np.full(len(times), TIME_MISSING, dtype=np.int64)
+    fixed = (text.str.len() == _ISO_LENGTH).fillna(False).to_numpy(dtype=bool)
+    try:
+        raw = text[fixed].to_numpy(dtype=object).astype(f'S{_ISO_LENGTH}')
+    except UnicodeEncodeError:  # not ASCII, so not the fixed form anyway
+        fixed[:] = False
+        raw = np.empty(0, dtype=f'S{_ISO_LENGTH}')
+    chars = raw.view(np.uint8).reshape(-1, _ISO_LENGTH)
+
+    valid = np.ones(len(chars), dtype=bool)
+    for position, separator in _ISO_SEPARATORS.items():
+        valid &= chars[:, position] == ord(separator)
+    digits = chars.astype(np.int64) - ord('0')
+    fields = {}
+    for name, (start, stop) in _ISO_FIELDS.items():
+        part = digits[:, start:stop]
+        valid &= ((part >= 0) & (part <= 9)).all(axis=1)
+        fields[name] = part @ (10 ** np.arange(stop - start - 1, -1, -1))
+    # Impossible dates (February 30th) and leap seconds go to the general parser, which rejects them
+    valid &= ((fields['month'] >= 1) & (fields['month'] <= 12) & (fields['day'] >= 1)
+              & (fields['day'] <= _days_in_month(fields['year'], fields['month']))
+              & (fields['hour'] <= 23) & (fields['minute'] <= 59) & (fields['second'] <= 59))
+    seconds = (_days_from_civil(fields['year'], fields['month'], fields['day']) * 86400
+               + fields['hour'] * 3600 + fields['minute'] * 60 + fields['second'])
+
+    fixed_positions = np.flatnonzero(fixed)
+    result[fixed_positions[valid]] = seconds[valid]
+
+    # Everything else (other formats, fractional seconds, offsets): the general parser
+    others = ~fixed
+    others[fixed_positions[~valid]] = True
+    others &= text.notna().to_numpy(dtype=bool)
+    if others.any():
+        parsed = pd.to_datetime(text[others], format='ISO8601', utc=True, errors='coerce')
+        result[others] = np.where(parsed.isna(), TIME_MISSING,
+                                  parsed.to_numpy(dtype='datetime64[s]').view(np.int64))
+    return result
+
+def resolution_seconds(resolution: Union[int, str]) -> int:
+    """
+    A window length as whole seconds, from seconds or a pandas offset string ('1min', '1h').
+    """
+    if isinstance(resolution, str):
+        seconds = pd.Timedelta(resolution).total_seconds()
+    else:
+        seconds = float(resolution)
+    if seconds < 1 or seconds != int(seconds):
+        raise ValueError(f"Window length must be a whole number of seconds, got {resolution!r}")
+    return int(seconds)
+
+def _aggregate(groups: np.ndarray, windows: np.ndarray, sums: Dict[str, np.ndarray]):
+    # Sum rows with the same (group, window); returns them sorted by group, then window
+    if not len(windows):
+        return groups, windows, sums
+    order = np.lexsort((windows, groups))
+    groups, windows = groups[order], windows[order]
+    starts = np.flatnonzero(np.concatenate([[True], (groups[1:] != groups[:-1]) | (windows[1:] != windows[:-1])]))
+    return (groups[starts], windows[starts],
+            {col: np.add.reduceat(values[order], starts) for col, values in sums.items()})
+
+class KillSeries:
+    """
+    Tumbling-window sums of killmail rows: the kill count and the SUM_COLUMNS present in the
+    rows, per window of resolution (seconds or e.g. '1min', '1h'), and per value of the by
+    column (e.g. 'solar_system_id' or 'region_id') when given. Windows are aligned to the epoch,
+    so series built from different files line up and merge.
+    """
+
+    def __init__(self, resolution: Union[int, str] = '1h', by: Optional[str] = None):
+        self.resolution = resolution_seconds(resolution)
+        self.by = by
+        self.sum_columns = None  # fixed by the first chunk
+        self.rows = 0
+        self.skipped = 0  # rows without a usable time
+        self._parts = []  # (groups, windows, sums) of aggregated chunks
+
+    def add(self, df: pd.DataFrame) -> None:
+        if self.sum_columns is None:
+            self.sum_columns = [col for col in SUM_COLUMNS if col in df.columns]
+        times = parse_killmail_times(df[TIME_COLUMN])
+        known = times != TIME_MISSING
+        self.rows += len(df)
+        self.skipped += int(np.count_nonzero(~known))
+
+        windows = times[known] // self.resolution
+        if self.by is not None:
+            groups = pd.to_numeric(df[self.by], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)[known]
+        else:
+            groups = np.zeros(len(windows), dtype=np.int64)
+        sums = {'kills': np.ones(len(windows), dtype=np.int64)}
+        for col in self.sum_columns:
+            values = pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy(dtype=SUM_COLUMNS[col])
+            sums[col] = values[known]
+        self._parts.append(_aggregate(groups, windows, sums))
+        if len(self._parts) >= 64:
+            self._parts = [self._combined()]
+
+    def merge(self, other: 'KillSeries') -> None:
+        """
+        Add the windows of another series with the same resolution and grouping.
+        """
+        if (other.resolution, other.by) != (self.resolution, self.by):
+            raise ValueError("Cannot merge series with different resolutions or groupings")
+        if self.sum_columns is None:
+            self.sum_columns = other.sum_columns
+        self.rows += other.rows
+        self.skipped += other.skipped
+        self._parts.extend(other._parts)
+
+    def _combined(self):
+        columns = ['kills'] + (self.sum_columns or [])
+        parts = [part for part in self._parts if len(part[1])]
+        if not parts:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                    {col: np.zeros(0, dtype=SUM_COLUMNS.get(col, np.int64)) for col in columns})
+        return _aggregate(np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]),
+                          {col: np.concatenate([part[2][col] for part in parts]) for col in columns})
+
+    def table(self, rolling: Optional[Union[int, str]] = None, fill: bool = False) -> pd.DataFrame:
+        """
+        The series as a DataFrame: [by,] window_start (ISO 8601 UTC), kills and the summed
+        columns, sorted by group and time. Only windows with kills are listed, unless fill=True
+        adds the empty windows between each group's first and last one.
+
+        rolling (a whole number of windows, e.g. '1h' over '1min') adds <column>_rolling: the
+        sums over the rolling period ending with each window.
+        """
+        groups, windows, sums = self._combined()
+        self._parts = [(groups, windows, sums)]
+        # Where each group's points start and stop
+        starts = np.flatnonzero(np.concatenate([[True], groups[1:] != groups[:-1]])) if len(groups) else groups
+        stops = np.concatenate([starts[1:], [len(groups)]])
+
+        if fill and len(windows):
+            first_windows = windows[starts]
+            spans = windows[stops - 1] - first_windows + 1
+            offsets = np.concatenate([[0], np.cumsum(spans)[:-1]])  # of each group in the filled table
+            filled_groups = np.repeat(groups[starts], spans)
+            filled_windows = np.repeat(first_windows - offsets, spans) + np.arange(int(spans.sum()))
+            positions = np.repeat(offsets - first_windows, stops - starts) + windows
+            filled_sums = {}
+            for col, values in sums.items():
+                filled_sums[col] = np.zeros(len(filled_windows), dtype=values.dtype)
+                filled_sums[col][positions] = values
+            groups, windows, sums = filled_groups, filled_windows, filled_sums
+            starts = offsets
+
+        table = {}
+        if self.by is not None:
+            table[self.by] = pd.arrays.IntegerArray(np.where(groups >= 0, groups, 0), groups < 0)
+        table['window_start'] = np.char.add(np.datetime_as_string(
+            (windows * self.resolution).astype('datetime64[s]'), unit='s'), 'Z').astype(object)
+        table.update(sums)
+        df = pd.DataFrame(table)
+
+        if rolling is not None:
+            periods = resolution_seconds(rolling) / self.resolution
+            if periods != int(periods):
+                raise ValueError(f"Rolling period {rolling!r} is not a whole number of {self.resolution} s windows")
+            periods = int(periods)
+            # One increasing key over all groups, with groups further apart than a rolling period,
+            # so that the first point of each point's period is found with one searchsorted
+            group_numbers = np.zeros(len(groups), dtype=np.int64)
+            group_numbers[starts[1:]] = 1
+            origin = windows.min() if len(windows) else 0
+            keys = np.cumsum(group_numbers) * (int(windows.max() - origin if len(windows) else 0) + periods) \
+                + (windows - origin)
+            period_starts = np.searchsorted(keys, keys - (periods - 1), side='left')
+            for col, values in sums.items():
+                # Each period's sum is a difference of prefix sums: O(1) per point
+                prefix = np.concatenate([[0], np.cumsum(values)])
+                df[f"{col}_rolling"] = prefix[1:] - prefix[period_starts]
+        return df
+
+def build_series(paths: List[str], resolution: Union[int, str] = '1h', by: Optional[str] = None,
+                 chunk_rows: int = 500000) -> KillSeries:
+    """
+    The KillSeries of the CSV outputs at paths, read chunk_rows rows at a time and only the
+    columns the series uses.
+    """
+    series = KillSeries(resolution, by)
+    wanted = {TIME_COLUMN, *SUM_COLUMNS} | ({by} if by else set())
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=lambda col: col in wanted, chunksize=chunk_rows,
+                                 encoding='utf-8'):
+            series.add(chunk)
+        log(f"Read '{path}' ({series.rows} rows so far)")
+    return series
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Kills, damage and value per time window of killmail CSV outputs.")
+    parser.add_argument('inputs', nargs='+', help="Killmail CSV outputs (daily or merged)")
+    parser.add_argument('--output', required=True, help="Series CSV to write")
+    parser.add_argument('--resolution', default='1h', help="Window length, e.g. 1min, 15min, 1h, 1d (default: 1h)")
+    parser.add_argument('--by', help="ID column to split the series by, e.g. solar_system_id or region_id")
+    parser.add_argument('--rolling', help="Also add rolling sums over this period, e.g. 1h")
+    parser.add_argument('--fill', action='store_true', help="List empty windows too")
+    args = parser.parse_args(argv)
+
+    series = build_series(args.inputs, args.resolution, args.by)
+    table = series.table(rolling=args.rolling, fill=args.fill)
+    table.to_csv(args.output, index=False, encoding='utf-8')
+    print(f"Wrote {len(table)} points for {series.rows} killmails to '{args.output}'"
+          + (f" ({series.skipped} without a usable time)" if series.skipped else ""))
+
+if __name__ == '__main__':
+    main()
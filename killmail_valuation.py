@@ -0,0 +1,119 @@
+"""
+ISK valuation of killmails.
+
+PriceTable holds one price per type ID (the IDs of typeid.csv), read from a local CSV or from a
+saved copy of ESI's GET /markets/prices/ JSON. value_killmails prices the victim's items of a
+whole batch at once: the item fact table of killmail_facts already lists every item, container
+contents included, as typed arrays, so the unit prices are one searchsorted over those arrays
+and the per-killmail sums one bincount. No item is visited in Python.
+
+Items and hulls without a price count as 0 ISK.
+"""
+import json
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from killmail_facts import KillmailFacts
+
+# Columns added by value_killmails
+VALUE_COLUMNS = ['destroyed_value', 'dropped_value', 'hull_value', 'total_value']
+
+# Price columns tried in this order when a price file has several
+PRICE_COLUMNS = ['average_price', 'adjusted_price', 'price', 'average', 'adjusted']
+
+_TYPE_ID_COLUMNS = ['type_id', 'typeid', 'item_type_id']
+
+class PriceTable:
+    """
+    Unit prices as parallel arrays sorted by type ID.
+    """
+
+    def __init__(self, type_ids: np.ndarray, prices: np.ndarray):
+        order = np.argsort(type_ids, kind='stable')
+        self.type_ids = np.asarray(type_ids, dtype=np.int64)[order]
+        self.prices = np.asarray(prices, dtype=np.float64)[order]
+
+    @classmethod
+    def from_file(cls, price_path: str, price_column: Optional[str] = None) -> Optional['PriceTable']:
+        """
+        Load prices from a CSV (a type ID column such as typeID or type_id plus a price column)
+        or from ESI /markets/prices/ JSON. Without price_column the first of PRICE_COLUMNS that
+        exists is used. Returns None on failure.
+        """
+        try:
+            if str(price_path).lower().endswith('.json'):
+                with open(price_path, 'r', encoding='utf-8') as f:
+                    df = pd.DataFrame(json.load(f))
+            else:
+                df = pd.read_csv(price_path, encoding='utf-8')
+            columns = {col.lower(): col for col in df.columns}
+            type_column = next((columns[name] for name in _TYPE_ID_COLUMNS if name in columns), None)
+            if price_column is None:
+                price_column = next((columns[name] for name in PRICE_COLUMNS if name in columns), None)
+            if type_column is None or price_column not in df.columns:
+                raise ValueError(f"expected a type ID column and one of {PRICE_COLUMNS}, "
+                                 f"found {list(df.columns)}")
+            type_ids = pd.to_numeric(df[type_column], errors='coerce')
+            prices = pd.to_numeric(df[price_column], errors='coerce')
+            keep = (type_ids.notna() & prices.notna()).to_numpy()
+            return cls(type_ids.to_numpy()[keep].astype(np.int64), prices.to_numpy()[keep])
+        except Exception as e:
+            print(f"Warning: Could not load prices from {price_path}: {e}")
+            return None
+
+    def __len__(self) -> int:
+        return len(self.type_ids)
+
+    def lookup(self, type_ids) -> np.ndarray:
+        """
+        Unit price of each type ID, 0.0 for missing or unpriced types.
+        """
+        type_ids = np.asarray(type_ids, dtype=np.int64)
+        if not len(self.type_ids):
+            return np.zeros(len(type_ids))
+        positions = np.searchsorted(self.type_ids, type_ids).clip(max=len(self.type_ids) - 1)
+        return np.where(self.type_ids[positions] == type_ids, self.prices[positions], 0.0)
+
+def value_killmails(df: pd.DataFrame, facts: KillmailFacts, prices: PriceTable) -> pd.DataFrame:
+    """
+    Add the VALUE_COLUMNS (ISK, float64) to killmail rows, from the item fact table filled in
+    the same parse pass: destroyed and dropped value of the items (quantity x unit price,
+    container contents included), the victim's hull and their total.
+    """
+    items = facts.items.buffers
+    killmail_ids = np.frombuffer(items['killmail_id'], dtype=np.int64)
+    item_index = np.frombuffer(items['item_index'], dtype=np.int32)
+    type_ids = np.frombuffer(items['item_type_id'], dtype=np.int32)
+    destroyed = np.frombuffer(items['quantity_destroyed'], dtype=np.int64)
+    dropped = np.frombuffer(items['quantity_dropped'], dtype=np.int64)
+
+    # A killmail parsed twice (the same kill in two files) has its items twice; count them once
+    first_items = killmail_ids[item_index == 0]
+    if len(np.unique(first_items)) < len(first_items):
+        _, keep = np.unique(np.stack([killmail_ids, item_index.astype(np.int64)]), axis=1, return_index=True)
+        keep.sort()
+        killmail_ids, type_ids, destroyed, dropped = (killmail_ids[keep], type_ids[keep],
+                                                      destroyed[keep], dropped[keep])
+
+    unit_prices = prices.lookup(type_ids)
+    kill_keys, item_kill = np.unique(killmail_ids, return_inverse=True)
+    destroyed_sums = np.bincount(item_kill, weights=destroyed * unit_prices, minlength=len(kill_keys))
+    dropped_sums = np.bincount(item_kill, weights=dropped * unit_prices, minlength=len(kill_keys))
+
+    row_ids = pd.to_numeric(df['killmail_id'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    row_ids = np.where(np.isnan(row_ids), -1, row_ids).astype(np.int64)
+    if len(kill_keys):
+        positions = np.searchsorted(kill_keys, row_ids).clip(max=len(kill_keys) - 1)
+        has_items = kill_keys[positions] == row_ids
+        df['destroyed_value'] = np.where(has_items, destroyed_sums[positions], 0.0)
+        df['dropped_value'] = np.where(has_items, dropped_sums[positions], 0.0)
+    else:
+        df['destroyed_value'] = 0.0
+        df['dropped_value'] = 0.0
+
+    hull_types = pd.to_numeric(df['victim_ship_type_id'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    df['hull_value'] = prices.lookup(hull_types)
+    df['total_value'] = df['destroyed_value'] + df['dropped_value'] + df['hull_value']
+    return df
@@ -0,0 +1,116 @@
+"""
+Shared helpers for the tests: the repository root on sys.path (the modules live there, not in
+a package), the pandas converter loaded as a module, a generator of killmail JSON files and a
+local HTTP server standing in for ESI and RedisQ.
+"""
+import importlib.util
+import json
+import random
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Tuple
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.insert(0, str(REPO_DIR))
+
+LOOKUPS = {
+    'shiplist_csv': str(REPO_DIR / 'shiplist.csv'),
+    'typeid_csv': str(REPO_DIR / 'typeid.csv'),
+    'map_solar_systems_csv': str(REPO_DIR / 'mapSolarSystems.csv'),
+}
+
+def load_script(name: str):
+    # The converters are scripts with spaces in their names, so they can't be imported by name
+    spec = importlib.util.spec_from_file_location(name.replace(' ', '_'), REPO_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope='session')
+def pandas_converter():
+    return load_script('Eve Online Killmail - Pandas Update')
+
+@pytest.fixture(scope='session')
+def original_converter():
+    return load_script('Eve Online Killmail')
+
+def make_killmail(killmail_id: int, rng: random.Random, day: str = '2025-07-07') -> dict:
+    attackers = []
+    attacker_count = rng.choice([1, 1, 2, 3, 5, 10])
+    final_blow = rng.randrange(attacker_count)
+    for index in range(attacker_count):
+        attacker = {'damage_done': rng.randrange(0, 5000), 'final_blow': index == final_blow,
+                    'security_status': round(rng.uniform(-10, 5), 1),
+                    'ship_type_id': rng.choice([587, 24690, 17738]),
+                    'weapon_type_id': rng.choice([2488, 3001, 2873])}
+        if rng.random() < 0.9:
+            attacker['character_id'] = rng.randrange(90000000, 2120000000)
+            attacker['corporation_id'] = rng.randrange(98000000, 98800000)
+        if rng.random() < 0.6:
+            attacker['alliance_id'] = rng.randrange(99000000, 99014000)
+        attackers.append(attacker)
+    victim = {'character_id': rng.randrange(90000000, 2120000000),
+              'corporation_id': rng.randrange(98000000, 98800000),
+              'damage_taken': rng.randrange(100, 100000), 'ship_type_id': rng.choice([587, 24690, 17738]),
+              'items': [], 'position': {'x': rng.uniform(-1e12, 1e12), 'y': 0.0, 'z': rng.uniform(-1e12, 1e12)}}
+    return {'attackers': attackers, 'killmail_id': killmail_id,
+            'killmail_time': '%sT%02d:%02d:%02dZ' % (day, rng.randrange(24), rng.randrange(60), rng.randrange(60)),
+            'solar_system_id': 30000142, 'victim': victim}
+
+def write_killmails(folder: Path, count: int, seed: int = 42, day: str = '2025-07-07',
+                    first_id: int = 128000000) -> Path:
+    """
+    Write count killmails of day as <killmail_id>.json files to folder, the same ones for the
+    same arguments.
+    """
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        killmail_id = first_id + index
+        (folder / f"{killmail_id}.json").write_text(json.dumps(make_killmail(killmail_id, rng, day)))
+    return folder
+
+@pytest.fixture
+def http_stub():
+    """
+    Start local HTTP/1.1 (keep-alive) servers: http_stub(respond) serves every request with
+    respond(method, path, body) -> (status, body bytes) and returns the server's base URL.
+    The servers are shut down after the test.
+    """
+    servers = []
+
+    def start(respond: Callable[[str, str, bytes], Tuple[int, bytes]]) -> str:
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; don't let them wait for delayed ACKs
+            disable_nagle_algorithm = True
+
+            def _answer(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                status, body = respond(self.command, self.path, self.rfile.read(length))
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _answer
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
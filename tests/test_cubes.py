@@ -0,0 +1,139 @@
+import json
+import random
+
+import numpy as np
+import pandas as pd
+from conftest import LOOKUPS, make_killmail, write_killmails
+
+from killmail_cubes import (CUBE_DIMENSIONS, MEASURES, CubeBuilder, build_cubes, load_cubes, rollup_cubes,
+                            write_cubes)
+
+def convert(pandas_converter, input_folder, cube_dir, output_csv):
+    report = pandas_converter.convert_json_folder_to_csv_pandas(
+        str(input_folder), str(output_csv), workers=1, cube_dir=str(cube_dir),
+        use_lookup_cache=False, verbose=False, **LOOKUPS)
+    assert report['status'] == 'ok'
+    return pd.read_csv(output_csv)
+
+def write_two_days(tmp_path):
+    # Two days' folders: the second also holds a kill from just before midnight, and both one without a time
+    first = write_killmails(tmp_path / '07-07', 300, seed=1, day='2025-07-07', first_id=128000000)
+    second = write_killmails(tmp_path / '07-08', 300, seed=2, day='2025-07-08', first_id=129000000)
+    late = make_killmail(129999998, random.Random(3), '2025-07-07')
+    late['killmail_time'] = '2025-07-07T23:59:58Z'
+    (second / '129999998.json').write_text(json.dumps(late))
+    for folder, killmail_id in ((first, 128999999), (second, 129999999)):
+        undated = make_killmail(killmail_id, random.Random(4))
+        del undated['killmail_time']
+        (folder / f"{killmail_id}.json").write_text(json.dumps(undated))
+    return first, second
+
+def table(cube, name, date_column='killmail_date'):
+    # A cube as a frame indexed by its keys (as text), for comparisons
+    keys = ([date_column] if date_column else []) + CUBE_DIMENSIONS[name]
+    cube = cube.assign(**{key: cube[key].astype(object).where(cube[key].notna(), None).map(str) for key in keys})
+    return cube.set_index(keys)[MEASURES].astype('int64').sort_index()
+
+def test_rerun_keeps_other_inputs_days(tmp_path, pandas_converter):
+    first, second = write_two_days(tmp_path)
+    cube_dir = tmp_path / 'cubes'
+    convert(pandas_converter, first, cube_dir, tmp_path / 'first.csv')
+    convert(pandas_converter, second, cube_dir, tmp_path / 'second.csv')
+    before = load_cubes(str(cube_dir))
+    assert load_cubes(str(cube_dir), '2025-07-07', '2025-07-07')['hourly']['kills'].sum() == 301
+    assert before['hourly'].loc[before['hourly']['killmail_date'].isna(), 'kills'].sum() == 2
+
+    # Re-running the second day only replaces its own share of 2025-07-07 and of the undated rows
+    convert(pandas_converter, second, cube_dir, tmp_path / 'second.csv')
+    after = load_cubes(str(cube_dir))
+    for name in CUBE_DIMENSIONS:
+        pd.testing.assert_frame_equal(table(after[name], name), table(before[name], name))
+
+def test_rollup_matches_groupby_of_rows(tmp_path, pandas_converter):
+    first, second = write_two_days(tmp_path)
+    cube_dir = tmp_path / 'cubes'
+    rows = pd.concat([convert(pandas_converter, first, cube_dir, tmp_path / 'first.csv'),
+                      convert(pandas_converter, second, cube_dir, tmp_path / 'second.csv')], ignore_index=True)
+    rows = rows.assign(kills=1, killmail_date=rows['killmail_time'].str.slice(0, 10),
+                       killmail_month=rows['killmail_time'].str.slice(0, 7),
+                       killmail_hour=rows['killmail_time'].str.slice(11, 13).astype(float))
+    cubes = load_cubes(str(cube_dir))
+
+    for period, date_column in (('day', 'killmail_date'), ('month', 'killmail_month'), ('total', None)):
+        rolled = rollup_cubes(cubes, period)
+        for name in CUBE_DIMENSIONS:
+            keys = ([date_column] if date_column else []) + CUBE_DIMENSIONS[name]
+            expected = rows.groupby(keys, dropna=False)[MEASURES].sum().reset_index()
+            # Hours as the cubes' integers, not floats
+            if 'killmail_hour' in keys:
+                expected['killmail_hour'] = expected['killmail_hour'].astype('Int64')
+            pd.testing.assert_frame_equal(table(rolled[name], name, date_column),
+                                          table(expected, name, date_column))
+
+def test_load_cubes_date_range(tmp_path, pandas_converter):
+    first, second = write_two_days(tmp_path)
+    cube_dir = tmp_path / 'cubes'
+    convert(pandas_converter, first, cube_dir, tmp_path / 'first.csv')
+    convert(pandas_converter, second, cube_dir, tmp_path / 'second.csv')
+
+    assert set(load_cubes(str(cube_dir))['hourly']['killmail_date'].fillna('unknown')) == {
+        '2025-07-07', '2025-07-08', 'unknown'}
+    later = load_cubes(str(cube_dir), start='2025-07-08')
+    assert set(later) == set(CUBE_DIMENSIONS)
+    assert set(later['hourly']['killmail_date']) == {'2025-07-08'}
+    assert later['hourly']['kills'].sum() == 300
+    earlier = load_cubes(str(cube_dir), end='2025-07-07', names=['solar_system'])
+    assert list(earlier) == ['solar_system']
+    assert set(earlier['solar_system']['killmail_date']) == {'2025-07-07'}
+    assert earlier['solar_system']['kills'].sum() == 301
+    assert load_cubes(str(cube_dir), '2025-08-01', '2025-08-31') == {}
+
+def make_rows(count, seed=0):
+    rng = np.random.default_rng(seed)
+    ships = np.array(['Frigate', 'Cruiser', 'Battleship'])
+    days = np.array(['2025-07-06', '2025-07-07'])
+    frame = pd.DataFrame({
+        'killmail_time': [f"{day}T{hour:02d}:15:00Z" for day, hour in zip(rng.choice(days, count),
+                                                                           rng.integers(0, 24, count))],
+        'solar_system_id': rng.integers(30000001, 30000005, count),
+        'victim_ship_type': rng.choice(ships, count),
+        'attacker_ship_type': rng.choice(ships, count),
+    })
+    frame['solar_system_name'] = 'System ' + frame['solar_system_id'].astype(str)
+    frame['victim_ship_name'] = frame['victim_ship_type'] + ' hull'
+    frame['attacker_ship_name'] = frame['attacker_ship_type'] + ' hull'
+    for measure in MEASURES[1:]:
+        frame[measure] = rng.integers(0, 1000, count)
+    return frame
+
+def test_builder_and_merge_existing(tmp_path):
+    rows = make_rows(400)
+    whole = build_cubes(rows)
+    builder = CubeBuilder()
+    for start in range(0, len(rows), 90):
+        builder.add(rows.iloc[start:start + 90])
+    for name in CUBE_DIMENSIONS:
+        pd.testing.assert_frame_equal(table(builder.cubes[name], name), table(whole[name], name))
+
+    cube_dir = str(tmp_path / 'cubes')
+
+    def kills():
+        return load_cubes(cube_dir)['ship_matchup']['kills'].sum()
+
+    write_cubes(whole, cube_dir, 'a')
+    assert kills() == 400
+    write_cubes(whole, cube_dir, 'a', merge_existing=True)  # an incremental run adds to its files
+    assert kills() == 800
+    pd.testing.assert_frame_equal(
+        table(load_cubes(cube_dir)['hourly'], 'hourly'),
+        table(whole['hourly'].assign(**{measure: whole['hourly'][measure] * 2 for measure in MEASURES}), 'hourly'))
+    write_cubes(whole, cube_dir, 'a')  # a full run replaces them
+    assert kills() == 400
+    write_cubes(whole, cube_dir, 'b')  # another input adds its own
+    assert kills() == 800
+    # An input whose days are gone takes its files with it
+    write_cubes(build_cubes(rows[rows['killmail_time'].str.startswith('2025-07-06')]), cube_dir, 'b')
+    assert load_cubes(cube_dir, '2025-07-07')['hourly']['kills'].sum() == (
+        rows['killmail_time'].str.startswith('2025-07-07').sum())
+    write_cubes({}, cube_dir, 'b')
+    assert kills() == 400
@@ -0,0 +1,47 @@
+import json
+import random
+
+import pytest
+from conftest import LOOKUPS, make_killmail
+
+from killmail_decoding import get_decoder, msgspec
+
+pytestmark = pytest.mark.skipif(msgspec is None, reason="msgspec is not installed")
+
+# Numbers that are floats in ESI's schema but may be written as integers
+NUMBERS = [-10, 0, 5, -3.5, 0.0, 1e2, 2.25]
+
+def write_int_valued_killmails(folder):
+    folder.mkdir()
+    rng = random.Random(5)
+    for index, number in enumerate(NUMBERS):
+        killmail = make_killmail(128000000 + index, rng)
+        killmail['victim']['position'] = {'x': number, 'y': 1, 'z': -number}
+        for attacker in killmail['attackers']:
+            attacker['security_status'] = number
+        (folder / f"{killmail['killmail_id']}.json").write_text(json.dumps(killmail))
+    return folder
+
+def test_backends_decode_numbers_alike(tmp_path):
+    for path in write_int_valued_killmails(tmp_path / 'day').glob('*.json'):
+        raw = path.read_bytes()
+        expected = json.loads(raw)
+        decoded = get_decoder('msgspec')(raw)
+        position = decoded.victim.position
+        for axis in 'xyz':
+            value = position.get(axis)
+            assert value == expected['victim']['position'][axis]
+            assert type(value) is type(expected['victim']['position'][axis])
+        for attacker, expected_attacker in zip(decoded.attackers, expected['attackers']):
+            assert type(attacker.get('security_status')) is type(expected_attacker['security_status'])
+
+def test_original_csv_does_not_depend_on_backend(tmp_path, original_converter):
+    input_folder = write_int_valued_killmails(tmp_path / 'day')
+    outputs = {}
+    for backend in ('stdlib', 'msgspec'):
+        output_csv = tmp_path / f"{backend}.csv"
+        original_converter.convert_json_folder_to_csv(str(input_folder), str(output_csv), json_backend=backend,
+                                                      verbose=False, **LOOKUPS)
+        outputs[backend] = output_csv.read_bytes()
+    assert b',-10,' in outputs['stdlib']
+    assert outputs['msgspec'] == outputs['stdlib']
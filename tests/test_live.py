@@ -0,0 +1,100 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+import pandas as pd
+from conftest import LOOKUPS, make_killmail
+
+from killmail_live import LiveIngestor
+
+class RedisQStub:
+    """
+    A RedisQ stand-in that answers with the packages of kill_ids in order (those in
+    redelivered twice), a 503 every fail_every requests, and {"package": null}
+    once the kills run out.
+    """
+
+    def __init__(self, kill_ids, redelivered=(), fail_every=None, delay=0.0):
+        rng = random.Random(7)
+        self.killmails = {kill_id: make_killmail(kill_id, rng) for kill_id in kill_ids}
+        self.deliveries = []
+        for kill_id in kill_ids:
+            self.deliveries.append(kill_id)
+            if kill_id in redelivered:
+                self.deliveries.append(kill_id)
+        self.fail_every = fail_every
+        self.delay = delay
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, method, path, body):
+        time.sleep(self.delay)
+        with self.lock:
+            self.requests += 1
+            if self.fail_every and self.requests % self.fail_every == 0:
+                self.failures += 1
+                return 503, b'Service Unavailable'
+            if not self.deliveries:
+                return 200, b'{"package": null}'
+            kill_id = self.deliveries.pop(0)
+        package = {'killID': kill_id, 'killmail': self.killmails[kill_id], 'zkb': {'hash': f"{kill_id:040x}"}}
+        return 200, json.dumps({'package': package}).encode()
+
+def run_ingestor(url, **kwargs):
+    flushed = []
+    ingestor = LiveIngestor(f"{url}/listen.php", lambda name, killmail: {'name': name},
+                            flushed.append, queue_id='test', retry_base=0.001, **kwargs)
+    stats = asyncio.run(ingestor.run())
+    return stats, flushed
+
+def test_retries_duplicates_and_flush_rows(http_stub):
+    kill_ids = list(range(1000, 1100))
+    stub = RedisQStub(kill_ids, redelivered=kill_ids[::5], fail_every=7)
+    stats, flushed = run_ingestor(http_stub(stub), flush_rows=10, flush_seconds=3600, max_killmails=100)
+
+    names = [row['name'] for rows in flushed for row in rows]
+    assert names == [f"redisq:{kill_id}" for kill_id in kill_ids]
+    assert [len(rows) for rows in flushed] == [10] * 10
+    assert stats['killmails'] == 100
+    assert stats['duplicates'] == 20
+    # A request still in flight at the stop is abandoned, so its 503 may go unnoticed
+    assert stub.failures - 1 <= stats['retries'] <= stub.failures
+    assert stats['retries'] > 0
+    assert stats['flushes'] == 10
+    assert stats['rows_flushed'] == 100
+
+def test_flush_seconds_and_duration(http_stub):
+    # One kill every 0.05 s: time, not flush_rows, decides when to flush
+    stub = RedisQStub(list(range(1000, 1030)), delay=0.05)
+    start = time.monotonic()
+    stats, flushed = run_ingestor(http_stub(stub), flush_rows=1000, flush_seconds=0.3, duration=2.0)
+    elapsed = time.monotonic() - start
+
+    assert 2.0 <= elapsed < 5.0
+    assert stats['rows_flushed'] == sum(len(rows) for rows in flushed) == stats['killmails'] > 0
+    assert len(flushed) >= 3
+    assert all(len(rows) < 1000 for rows in flushed)
+
+def test_ingest_live_appends_to_matching_csv_only(tmp_path, http_stub, pandas_converter):
+    output_csv = tmp_path / 'live.csv'
+    settings = dict(LOOKUPS, flush_rows=20, use_lookup_cache=False, verbose=False)
+    first = pandas_converter.ingest_live_pandas(http_stub(RedisQStub(range(1000, 1050))) + '/listen.php',
+                                                str(output_csv), max_killmails=50, **settings)
+    assert first['status'] == 'ok'
+    second = pandas_converter.ingest_live_pandas(http_stub(RedisQStub(range(2000, 2030))) + '/listen.php',
+                                                 str(output_csv), max_killmails=30, **settings)
+    assert second['status'] == 'ok'
+    df = pd.read_csv(output_csv)
+    assert df['killmail_id'].tolist() == list(range(1000, 1050)) + list(range(2000, 2030))
+
+    # Rows with the spatial columns do not fit the existing header: nothing is appended
+    before = output_csv.read_bytes()
+    stub = RedisQStub(range(3000, 3010))
+    third = pandas_converter.ingest_live_pandas(http_stub(stub) + '/listen.php', str(output_csv),
+                                                spatial_enrichment=True, max_killmails=10, **settings)
+    assert third['status'] == 'failed'
+    assert stub.requests == 0
+    assert output_csv.read_bytes() == before
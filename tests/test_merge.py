@@ -0,0 +1,35 @@
+import pandas as pd
+
+from killmail_merge import merge_sorted_outputs
+
+HEADER = 'killmail_id,killmail_time,source_file'
+
+def write_csv(path, rows):
+    path.write_text('\n'.join([HEADER] + rows) + '\n')
+    return str(path)
+
+def test_only_rows_with_both_keys_are_deduplicated(tmp_path):
+    first = write_csv(tmp_path / 'a.csv', [
+        '3,2025-07-07T10:00:00Z,a',
+        '1,2025-07-07T09:00:00Z,a',
+        ',2025-07-07T09:30:00Z,a-no-id-1',
+        'x,2025-07-07T09:30:00Z,a-no-id-2',
+        '5,,a-no-time',
+    ])
+    second = write_csv(tmp_path / 'b.csv', [
+        '1,2025-07-07T09:00:00Z,b',
+        ',2025-07-07T09:30:00Z,b-no-id',
+        '5,,b-no-time',
+        '2,2025-07-07T09:00:00Z,b',
+    ])
+    output = tmp_path / 'merged.csv'
+    # Runs of two rows, so the copies of killmail 1 meet from different runs
+    stats = merge_sorted_outputs([first, second], str(output), memory_rows=2)
+
+    merged = pd.read_csv(output, dtype=str, keep_default_na=False)
+    assert list(zip(merged['killmail_id'], merged['source_file'])) == [
+        ('5', 'a-no-time'), ('5', 'b-no-time'), ('1', 'a'), ('2', 'b'),
+        ('', 'a-no-id-1'), ('x', 'a-no-id-2'), ('', 'b-no-id'), ('3', 'a')]
+    assert stats['duplicates'] == 1
+    assert stats['missing_keys'] == 5
+    assert stats['rows_written'] == stats['rows_read'] - 1 == 8
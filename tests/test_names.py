@@ -0,0 +1,145 @@
+import json
+import threading
+
+import pandas as pd
+from conftest import LOOKUPS, write_killmails
+
+import killmail_names
+from killmail_names import NameResolver
+
+# IDs the stub ESI rejects: any batch holding one of them is answered with a 404
+INVALID_IDS = {90000500, 90001777}
+
+class NamesStub:
+    """
+    A POST /universe/names/ stand-in that names every ID it gets and records the batches.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, method, path, body):
+        ids = json.loads(body)
+        with self.lock:
+            self.batches.append(ids)
+        if INVALID_IDS.intersection(ids):
+            return 404, b'{"error": "Ensure all IDs are valid before resolving."}'
+        return 200, json.dumps([{'id': value, 'name': f"Pilot {value}", 'category': 'character'}
+                                for value in ids]).encode()
+
+class Clock:
+    """
+    A time.time() that only moves when told to.
+    """
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def make_resolver(tmp_path, url, **kwargs):
+    return NameResolver(str(tmp_path / 'names.sqlite'), f"{url}/universe/names/", retries=0, **kwargs)
+
+def test_batches_of_1000_and_invalid_ids_isolated(tmp_path, http_stub):
+    stub = NamesStub()
+    resolver = make_resolver(tmp_path, http_stub(stub))
+    ids = list(range(90000000, 90002499))
+    names = resolver.resolve(ids + [None, 0, 90000001])
+    resolver.close()
+
+    valid_ids = [value for value in ids if value not in INVALID_IDS]
+    assert names == {value: f"Pilot {value}" for value in valid_ids}
+    # Three batches of up to 1000 IDs (duplicates and missing values dropped) ...
+    for start in (0, 1000, 2000):
+        assert ids[start:start + 1000] in stub.batches
+    assert all(len(batch) <= 1000 for batch in stub.batches)
+    # ... and a rejected batch is halved until its invalid ID is alone; valid halves are not split
+    rejected = [batch for batch in stub.batches if INVALID_IDS.intersection(batch)]
+    assert all(len(INVALID_IDS.intersection(batch)) == 1 for batch in rejected)
+    assert sum(len(batch) == 1 for batch in rejected) == len(INVALID_IDS)
+    assert len(stub.batches) == 3 + 2 * (len(rejected) - len(INVALID_IDS))
+    assert resolver.stats['requests'] == len(stub.batches)
+    assert resolver.stats['unknown'] == len(INVALID_IDS)
+    assert resolver.stats['resolved'] == len(valid_ids)
+
+def test_warm_cache_makes_no_requests(tmp_path, http_stub):
+    stub = NamesStub()
+    url = http_stub(stub)
+    ids = list(range(90000000, 90002499))
+    resolver = make_resolver(tmp_path, url)
+    cold = resolver.resolve(ids)
+    resolver.close()
+    cold_requests = len(stub.batches)
+
+    # A new resolver on the same cache: every ID, the unknown ones included, is cached
+    resolver = make_resolver(tmp_path, url)
+    warm = resolver.resolve(ids)
+    resolver.close()
+    assert warm == cold
+    assert len(stub.batches) == cold_requests
+    assert resolver.stats['requests'] == 0
+    assert resolver.stats['cache_hits'] == len(ids)
+
+def test_entries_expire_after_ttl(tmp_path, http_stub, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(killmail_names.time, 'time', clock)
+    stub = NamesStub()
+    resolver = make_resolver(tmp_path, http_stub(stub), ttl_days=1)
+    resolver.resolve([1, 2, 3])
+    assert len(stub.batches) == 1
+
+    clock.now += 86400 - 60
+    resolver.resolve([1, 2, 3])
+    assert len(stub.batches) == 1
+
+    clock.now += 120
+    assert resolver.resolve([1, 2, 3]) == {1: 'Pilot 1', 2: 'Pilot 2', 3: 'Pilot 3'}
+    resolver.close()
+    assert stub.batches[1:] == [[1, 2, 3]]
+
+def test_least_recently_used_entries_are_evicted(tmp_path, http_stub, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(killmail_names.time, 'time', clock)
+    stub = NamesStub()
+    resolver = make_resolver(tmp_path, http_stub(stub), max_entries=5)
+    resolver.resolve([1, 2, 3, 4, 5])
+    clock.now += 1
+    resolver.resolve([1, 2])  # 3, 4 and 5 are now the least recently used
+    clock.now += 1
+    resolver.resolve([6, 7, 8])
+    assert stub.batches == [[1, 2, 3, 4, 5], [6, 7, 8]]
+    cached = {row[0] for row in resolver.cache.execute('SELECT id FROM names')}
+    assert cached == {1, 2, 6, 7, 8}
+
+    clock.now += 1
+    resolver.resolve([1, 2, 6, 7, 8])
+    assert len(stub.batches) == 2
+    resolver.resolve([3])
+    resolver.close()
+    assert stub.batches[2:] == [[3]]
+
+def test_projection_resolves_only_the_selected_names(tmp_path, http_stub, pandas_converter):
+    input_folder = write_killmails(tmp_path / 'day', 50)
+    killmails = (json.loads(path.read_text()) for path in input_folder.glob('*.json'))
+    victim_characters = {killmail['killmail_id']: killmail['victim']['character_id'] for killmail in killmails}
+    stub = NamesStub()
+    url = http_stub(stub)
+    columns = ['killmail_id', 'victim_character_name', 'attacker_character_id', 'attacker_corporation_id']
+    for stream in (False, True):
+        output_csv = tmp_path / f"projected-{stream}.csv"
+        report = pandas_converter.convert_json_folder_to_csv_pandas(
+            str(input_folder), str(output_csv), workers=1, stream=stream, columns=columns,
+            resolve_names=True, names_url=f"{url}/universe/names/",
+            names_cache_path=str(tmp_path / f"names-{stream}.sqlite"),
+            use_lookup_cache=False, verbose=False, **LOOKUPS)
+        assert report['status'] == 'ok'
+        df = pd.read_csv(output_csv)
+        assert list(df.columns) == columns
+        assert df['victim_character_name'].tolist() == [f"Pilot {victim_characters[killmail_id]}"
+                                                        for killmail_id in df['killmail_id']]
+
+    # The attacker columns are written, but their names are not asked for
+    requested = {value for batch in stub.batches for value in batch}
+    assert requested == set(victim_characters.values())
@@ -0,0 +1,34 @@
+from conftest import LOOKUPS, write_killmails
+
+from killmail_sketches import KillmailSketches
+
+SHARD_COUNT = 2
+
+def test_stream_merge_matches_single_node(tmp_path, pandas_converter):
+    # Several batches, so the sketches' quantiles depend on where the chunks start and end
+    input_folder = write_killmails(tmp_path / 'day', 2000)
+    # Files that fail to parse leave batches with fewer rows than files
+    for killmail_id in range(128000000, 128002000, 97):
+        (input_folder / f"{killmail_id}.json").write_text('{"killmail_id": ')
+    settings = dict(LOOKUPS, stream=True, chunk_size=300, use_lookup_cache=False, verbose=False)
+
+    single_report = pandas_converter.convert_json_folder_to_csv_pandas(
+        str(input_folder), str(tmp_path / 'single.csv'), workers=1,
+        sketch_path=str(tmp_path / 'single.npz'), **settings)
+    assert single_report['status'] == 'ok'
+
+    partials = []
+    for shard_index in range(SHARD_COUNT):
+        partial = str(tmp_path / f"part-{shard_index}")
+        # The shards' own batch size does not matter to the merge
+        pandas_converter.convert_shard_pandas(str(input_folder), partial, shard_index, SHARD_COUNT,
+                                              workers=1, chunk_size=1000, verbose=False)
+        partials.append(partial)
+    merge_report = pandas_converter.merge_shards_pandas(partials, str(tmp_path / 'merged.csv'),
+                                                        sketch_path=str(tmp_path / 'merged.npz'), **settings)
+    assert merge_report['status'] == 'ok'
+
+    assert (tmp_path / 'merged.csv').read_bytes() == (tmp_path / 'single.csv').read_bytes()
+    single = KillmailSketches.load(str(tmp_path / 'single.npz')).summary()
+    merged = KillmailSketches.load(str(tmp_path / 'merged.npz')).summary()
+    assert merged == single
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from killmail_sketches import (TOP_COLUMNS, UNIQUE_COLUMNS, KillmailSketches, SpaceSaving, merge_sketch_files)
+
+def make_day(seed, rows=5000):
+    # Killmail rows with skewed ship, weapon and system counts and many distinct entities
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'victim_character_id': rng.integers(90000000, 90200000, rows),
+        'attacker_character_id': rng.integers(90000000, 90200000, rows),
+        'victim_corporation_id': rng.integers(98000000, 98020000, rows),
+        'attacker_corporation_id': rng.integers(98000000, 98020000, rows),
+        'victim_alliance_id': pd.array(np.where(rng.random(rows) < 0.5, rng.integers(99000000, 99002000, rows), 0)),
+        'attacker_alliance_id': rng.integers(99000000, 99002000, rows),
+        'victim_ship_type_id': rng.zipf(1.5, rows) % 3000 + 580,
+        'attacker_ship_type_id': rng.zipf(1.5, rows) % 3000 + 580,
+        'attacker_weapon_type_id': rng.zipf(2.0, rows) % 500 + 2000,
+        'solar_system_id': rng.zipf(1.3, rows) % 8000 + 30000000,
+        'victim_damage_taken': rng.lognormal(8, 1.5, rows).round(),
+        'attacker_damage_done': rng.lognormal(6, 1.5, rows).round(),
+    })
+    frame.loc[frame.sample(frac=0.1, random_state=seed).index, 'attacker_character_id'] = np.nan
+    return frame
+
+def feed(sketches, day, chunk_rows=1000):
+    for start in range(0, len(day), chunk_rows):
+        sketches.add(day.iloc[start:start + chunk_rows])
+    return sketches
+
+def test_save_load_round_trip(tmp_path):
+    sketches = feed(KillmailSketches(), make_day(1))
+    path = str(tmp_path / 'day.npz')
+    sketches.save(path)
+    loaded = KillmailSketches.load(path)
+
+    assert loaded.summary(top=20) == sketches.summary(top=20)
+    for name in UNIQUE_COLUMNS:
+        np.testing.assert_array_equal(loaded.unique[name].registers, sketches.unique[name].registers)
+    for name in TOP_COLUMNS:
+        for field in ('keys', 'counts', 'errors'):
+            np.testing.assert_array_equal(getattr(loaded.top[name], field), getattr(sketches.top[name], field))
+        assert loaded.top[name].total == sketches.top[name].total
+    for col, digest in sketches.distributions.items():
+        np.testing.assert_array_equal(loaded.distributions[col].means, digest.means)
+        np.testing.assert_array_equal(loaded.distributions[col].weights, digest.weights)
+    # A loaded file keeps taking rows, as incremental runs do
+    loaded.add(make_day(2, rows=100))
+    assert loaded.killmails == sketches.killmails + 100
+
+@pytest.mark.parametrize('capacity', [10000, 200])
+def test_merged_days_match_one_sketch_of_both(tmp_path, capacity):
+    days = [make_day(1), make_day(2)]
+    paths = []
+    for number, day in enumerate(days):
+        paths.append(str(tmp_path / f"day-{number}.npz"))
+        feed(KillmailSketches(capacity=capacity), day).save(paths[-1])
+    merged = merge_sketch_files(paths)
+    both = KillmailSketches(capacity=capacity)
+    for day in days:
+        feed(both, day)
+
+    assert merged.killmails == both.killmails == 10000
+    for name in UNIQUE_COLUMNS:
+        np.testing.assert_array_equal(merged.unique[name].registers, both.unique[name].registers)
+    rows = pd.concat(days, ignore_index=True)
+    for name, col in TOP_COLUMNS.items():
+        true_counts = rows[col].value_counts()
+        if capacity >= true_counts.size:
+            # Room for every key: both are exact
+            assert merged.top[name].top(capacity) == both.top[name].top(capacity)
+            assert all(error == 0 for _, _, error in merged.top[name].top(capacity))
+        assert [key for key, _, _ in merged.top[name].top(5)] == [key for key, _, _ in both.top[name].top(5)]
+        for key, count, error in merged.top[name].top(20):
+            assert count - error <= true_counts.get(key, 0) <= count
+
+def test_mismatched_settings_raise(tmp_path):
+    day = make_day(1, rows=500)
+    default_path, precision_path, capacity_path = (str(tmp_path / f"{name}.npz")
+                                                   for name in ('default', 'precision', 'capacity'))
+    feed(KillmailSketches(), day).save(default_path)
+    feed(KillmailSketches(precision=12), day).save(precision_path)
+    feed(KillmailSketches(capacity=500), day).save(capacity_path)
+
+    # Files with the same non-default settings merge, and keep them
+    merged = merge_sketch_files([precision_path, precision_path])
+    assert merged.unique['characters'].precision == 12
+    assert merged.killmails == 1000
+
+    for other in (precision_path, capacity_path):
+        with pytest.raises(ValueError, match='Cannot merge'):
+            merge_sketch_files([default_path, other])
+    # A refused merge leaves the sketches as they were
+    sketches = KillmailSketches.load(default_path)
+    before = sketches.summary()
+    with pytest.raises(ValueError):
+        sketches.merge(KillmailSketches.load(capacity_path))
+    assert sketches.summary() == before
+    with pytest.raises(ValueError):
+        SpaceSaving(10).merge(SpaceSaving(20))
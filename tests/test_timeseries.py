@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from killmail_timeseries import TIME_MISSING, parse_killmail_times
+
+def reference_times(values):
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), format='ISO8601', utc=True, errors='coerce')
+    return np.where(parsed.isna(), TIME_MISSING, parsed.to_numpy(dtype='datetime64[s]').view(np.int64))
+
+def test_malformed_dates_match_pandas():
+    values = [
+        '2025-07-07T12:34:56Z',
+        '2024-02-29T00:00:00Z',  # leap years
+        '2000-02-29T23:59:59Z',
+        '2024-02-30T00:00:00Z',  # impossible dates
+        '2023-02-29T00:00:00Z',
+        '2100-02-29T00:00:00Z',
+        '2025-04-31T08:00:00Z',
+        '2025-06-31T08:00:00Z',
+        '2025-09-31T08:00:00Z',
+        '2025-11-31T08:00:00Z',
+        '2025-12-32T00:00:00Z',
+        '2025-00-10T00:00:00Z',
+        '2025-13-10T00:00:00Z',
+        '2025-01-00T00:00:00Z',
+        '2025-01-01T24:00:00Z',
+        '2025-01-01T00:60:00Z',
+        '2016-12-31T23:59:60Z',  # leap second
+        '2025-01-01 00:00:00Z',  # wrong separators
+        '2025/01/01T00:00:00Z',
+        '2025-01-0xT00:00:00Z',
+        '2025-07-07T12:34:56.5Z',  # other formats
+        '2025-07-07T12:34:56+02:00',
+        '',
+        None,
+    ]
+    np.testing.assert_array_equal(parse_killmail_times(values), reference_times(values))
+
+def test_every_day_of_four_years_matches_pandas():
+    days = pd.date_range('1999-12-01', '2004-03-01', freq='D')
+    values = list(days.strftime('%Y-%m-%dT13:14:15Z'))
+    # Every day number 1-31 of every month, valid or not
+    values += [f"{year}-{month:02d}-{day:02d}T00:00:00Z" for year in (1900, 2000, 2023, 2024)
+               for month in range(1, 13) for day in range(1, 32)]
+    np.testing.assert_array_equal(parse_killmail_times(values), reference_times(values))